@@ -0,0 +1 @@
+# Benchmarks for the generation, dedup, and grading pipeline, run with: python -m benchmarks.<name>
@@ -0,0 +1,73 @@
+import argparse # Import the argparse module to read the corpus options
+import json # Import the json module to load the labeled corpus
+import os # Import the os module to locate the corpus next to this script
+import time # Import the time module to measure parsing cost
+from collections import Counter, defaultdict # Import the counters to group the results by question type and failure reason
+from response_parser import ParseError, parse_question # Import the parser being measured
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "question_responses.json") # Labeled question responses
+ROUNDS = 200 # Times the corpus is parsed for steadier timings
+
+# Function to load the labeled corpus, plus any recorded responses from a cassette
+def load_corpus(cassette_path=None): # Define the load_corpus function with the cassette_path parameter
+    with open(CORPUS_PATH) as corpus_file: # Open the corpus
+        corpus = json.load(corpus_file) # Load the labeled responses
+    if cassette_path: # Check if recorded responses should be added
+        from cassette import load_cassette, prompt_kind # Import the cassette helpers only when they are needed
+        for record in load_cassette(cassette_path): # Iterate over the recordings
+            kind = prompt_kind(record.get("prompt") or "") # Work out what the prompt asked for
+            if kind and kind != "batch": # Keep the single-question responses
+                corpus.append({"type": kind, "text": record["content"], "valid": None}) # Recorded responses have no label
+    return corpus # Return the corpus
+
+# Function to parse the corpus and print the success rate, label agreement, throughput, and failure reasons
+def run(cassette_path=None, rounds=ROUNDS): # Define the run function with the cassette_path and rounds parameters
+    corpus = load_corpus(cassette_path) # Load the responses
+
+    parsed = defaultdict(int) # Responses parsed per type
+    agreed = defaultdict(int) # Labeled responses whose parse result matches the label
+    labeled = defaultdict(int) # Labeled responses per type
+    counts = Counter(item["type"] for item in corpus) # Responses per type
+    reasons = Counter() # Failure reasons across the corpus
+    for item in corpus: # Iterate over the responses once to collect the results
+        try: # Try block to handle responses that cannot be parsed
+            parse_question(item["text"], item["type"]) # Parse the response
+            ok = True # The response parsed
+        except ParseError as e: # Catch responses that cannot be parsed
+            ok = False # The response did not parse
+            reasons[f"{item['type']}: {e}"] += 1 # Count the reason
+        parsed[item["type"]] += ok # Count the parsed response
+        if item["valid"] is not None: # Check if the response is labeled
+            labeled[item["type"]] += 1 # Count the labeled response
+            agreed[item["type"]] += ok == item["valid"] # Count the agreement
+
+    elapsed = defaultdict(float) # Seconds spent parsing per type
+    for item in corpus: # Iterate over the responses to time them
+        start = time.perf_counter() # Start timing
+        for _ in range(rounds): # Parse the response several times
+            try: # Try block to handle responses that cannot be parsed
+                parse_question(item["text"], item["type"]) # Parse the response
+            except ParseError: # Failures cost time too
+                pass
+        elapsed[item["type"]] += time.perf_counter() - start # Add the parsing time
+
+    print(f"{'type':>18} {'responses':>10} {'parsed':>8} {'agreement':>10} {'us/response':>12}") # Print the table header
+    for question_type in sorted(counts): # Iterate over the question types
+        agreement = f"{agreed[question_type] / labeled[question_type]:.0%}" if labeled[question_type] else "-" # Agreement with the labels
+        cost = elapsed[question_type] / (counts[question_type] * rounds) * 1e6 # Microseconds per response
+        print(f"{question_type:>18} {counts[question_type]:>10} {parsed[question_type] / counts[question_type]:>8.0%} {agreement:>10} {cost:>12.1f}") # Print the row
+    total_time = sum(elapsed.values()) # Seconds spent parsing
+    print(f"Throughput: {len(corpus) * rounds / total_time:,.0f} responses/s") # Print the throughput
+
+    print("Failure reasons:") # Print the failure reasons heading
+    for reason, count in reasons.most_common(): # Iterate over the reasons, most common first
+        print(f"  {count:>4}  {reason}") # Print the reason
+
+# Main entry point
+if __name__ == "__main__": # Check if the script is being run directly
+    parser = argparse.ArgumentParser(description="Measure the question response parser.") # Create the argument parser
+    parser.add_argument("--cassette", help="Also parse the question responses recorded in this cassette.") # Cassette path
+    parser.add_argument("--rounds", type=int, default=ROUNDS, help="Times each response is parsed when timing.") # Rounds
+    args = parser.parse_args() # Parse the command line
+
+    run(args.cassette, args.rounds) # Run the benchmark
@@ -0,0 +1,37 @@
+import json # Import the json module to load the labeled corpus
+import os # Import the os module to locate the corpus next to this script
+from pregrader import PreGrader # Import the PreGrader class being measured
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "scenario_answers.json") # Labeled scenario answers
+
+# Function to run the pre-grader over the labeled corpus and print its precision
+def run(): # Define the run function
+    with open(CORPUS_PATH) as corpus_file: # Open the corpus
+        corpus = json.load(corpus_file) # Load the labeled answers
+
+    grader = PreGrader() # Create a pre-grader with the configured thresholds
+    accepted = [] # Labels of the responses accepted locally
+    rejected = [] # Labels of the responses rejected locally
+    deferred = [] # Labels of the responses left to GPT
+
+    for item in corpus: # Iterate over the scenario questions
+        question_data = {"type": "scenario", "question": item["question"], "correct_answer": item["correct_answer"]} # Build the question data
+        for response, label in item["responses"]: # Iterate over the labeled responses
+            verdict = grader.grade(question_data, response) # Grade the response locally
+            if verdict is None: # Check if GPT would decide
+                deferred.append(label) # Record the deferred response
+            elif verdict[0]: # Check if the response was accepted
+                accepted.append(label) # Record the accepted response
+            else: # The response was rejected
+                rejected.append(label) # Record the rejected response
+
+    total = len(accepted) + len(rejected) + len(deferred) # Responses graded
+    print(f"responses:          {total}") # Print the corpus size
+    print(f"accepted locally:   {len(accepted):>3}  precision {sum(accepted) / len(accepted) if accepted else 1:.0%}") # Correct answers among the accepted ones
+    print(f"rejected locally:   {len(rejected):>3}  precision {rejected.count(False) / len(rejected) if rejected else 1:.0%}") # Wrong answers among the rejected ones
+    print(f"deferred to GPT:    {len(deferred):>3}") # Responses GPT would grade
+    print(f"GPT calls avoided:  {grader.stats()['avoided']:.0%}") # Fraction of calls the pre-grader settles
+
+# Main entry point
+if __name__ == "__main__": # Check if the script is being run directly
+    run() # Run the benchmark
@@ -0,0 +1,46 @@
+import argparse # Import the argparse module to read the cassette path
+import os # Import the os module to pick a backend that needs no network
+import re # Import the re module to read the requested question types from a prompt
+import time # Import the time module to measure parsing cost
+from collections import defaultdict # Import defaultdict to group the results by question type
+
+os.environ.setdefault("LLM_BACKEND", "local") # Parsing needs no live backend, so importing questions must not need an API key
+from cassette import LLM_CASSETTE, load_cassette, prompt_kind # Import the cassette helpers to read and classify the recorded responses
+from questions import parse_batch_response, parse_response # Import the parsers being measured
+
+ALL_TYPES = ["multiple_choice", "true_false", "fill_in_the_blank", "scenario", "write_code"] # Every question type
+
+# Function to replay every recorded question response through the parsers and print the parse rate and cost
+def run(path, rounds): # Define the run function with the path and rounds parameters
+    records = [(prompt_kind(record.get("prompt") or ""), record) for record in load_cassette(path)] # Classify the recordings
+    records = [(kind, record) for kind, record in records if kind] # Keep the question responses
+
+    parsed = defaultdict(int) # Responses parsed per kind
+    counts = defaultdict(int) # Responses replayed per kind
+    elapsed = defaultdict(float) # Seconds spent parsing per kind
+    for _ in range(rounds): # Replay the cassette several times for steadier timings
+        for kind, record in records: # Iterate over the question responses
+            start = time.perf_counter() # Start timing
+            if kind == "batch": # Check if the response is a batch
+                match = re.search(r"Question types, in order: (.+)", record["prompt"]) # Read the requested types
+                expected = len(match.group(1).split(",")) if match else 1 # Number of questions asked for
+                result = parse_batch_response(record["content"], ALL_TYPES) # Parse the batch
+                ok = len(result) / expected # Fraction of the batch that parsed
+            else: # The response is a single question
+                ok = 1 if parse_response(record["content"], kind) else 0 # Parse the question
+            elapsed[kind] += time.perf_counter() - start # Add the parsing time
+            counts[kind] += 1 # Count the response
+            parsed[kind] += ok # Count the parsed questions
+
+    print(f"{'kind':>18} {'responses':>10} {'parsed':>8} {'us/response':>12}") # Print the table header
+    for kind in sorted(counts): # Iterate over the kinds
+        print(f"{kind:>18} {counts[kind] // rounds:>10} {parsed[kind] / counts[kind]:>8.0%} {elapsed[kind] / counts[kind] * 1e6:>12.1f}") # Print the row
+
+# Main entry point
+if __name__ == "__main__": # Check if the script is being run directly
+    parser = argparse.ArgumentParser(description="Replay recorded question responses through the parsers.") # Create the argument parser
+    parser.add_argument("cassette", nargs="?", default=LLM_CASSETTE, help="Cassette recorded with LLM_CASSETTE_MODE=record.") # Cassette path
+    parser.add_argument("--rounds", type=int, default=20, help="Times to replay the cassette.") # Rounds
+    args = parser.parse_args() # Parse the command line
+
+    run(args.cassette, args.rounds) # Run the benchmark
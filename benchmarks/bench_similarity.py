@@ -0,0 +1,99 @@
+import random # Import the random module to build a synthetic question corpus
+import sys # Import the sys module to exit with an error when the index disagrees with the scan
+import time # Import the time module to measure lookup cost
+from fuzzywuzzy import fuzz # Import the fuzz function for the linear baseline
+from similarity import QuestionIndex # Import the QuestionIndex class being measured
+
+SIZES = [1000, 2500, 5000, 10000] # Numbers of stored questions to measure
+LOOKUPS = 200 # Lookups timed against the index at each size
+BASELINE_LOOKUPS = 50 # Lookups timed against the linear scan at each size
+THRESHOLD = 70 # Same threshold is_question_unique uses
+
+TERMS = ["list", "tuple", "dictionary", "set", "string", "integer", "float", "loop", "function", "variable", # Common Python terms
+         "class", "method", "module", "import", "exception", "generator", "iterator", "decorator", "lambda", "slice",
+         "index", "key", "value", "argument", "parameter", "return", "scope", "comprehension", "boolean", "operator"]
+TEMPLATES = [ # Question shapes similar to the generated ones
+    "What is the output of {0} when a {1} is passed to a {2}?",
+    "Which statement about a {0} and its {1} is true when using {2}?",
+    "True or False: a {0} can be used as a {1} inside a {2}.",
+    "Fill in the blank: a ________ is used to store a {0} in a {1} with {2}.",
+    "A developer uses a {0} to build a {1}. How should the {2} be handled?",
+]
+
+# Function to build a vocabulary of made-up identifiers so the corpus has realistic word variety
+def build_vocabulary(rng, size=3000): # Define the build_vocabulary function
+    letters = "abcdefghijklmnopqrstuvwxyz" # Letters for the identifiers
+    return TERMS + ["".join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(size)] # Return the vocabulary
+
+# Function to make one synthetic question
+def make_question(rng, vocabulary): # Define the make_question function
+    words = [rng.choice(vocabulary) for _ in range(3)] # Pick the words to fill in
+    extra = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(2, 6))) # Add some detail text
+    return rng.choice(TEMPLATES).format(*words) + f" Consider {extra}." # Return the question
+
+# Function to make a question that shares no template with the stored ones, so nothing should match it
+def make_unrelated(rng, vocabulary): # Define the make_unrelated function
+    return " ".join(rng.choice(vocabulary) for _ in range(rng.randint(8, 14))).capitalize() + "?" # Return the question
+
+# Function to make a near-duplicate of a stored question by changing one word
+def make_near_duplicate(rng, question, vocabulary): # Define the make_near_duplicate function
+    words = question.split() # Split the question into words
+    words[rng.randrange(len(words))] = rng.choice(vocabulary) # Replace one word
+    return " ".join(words) # Return the near-duplicate
+
+# Function to check a question against every stored question, as is_question_unique used to
+def linear_has_similar(stored, question, threshold=THRESHOLD): # Define the linear_has_similar function
+    for stored_question in stored: # Iterate over the stored questions
+        if fuzz.ratio(question.lower(), stored_question.lower()) > threshold: # Check the similarity ratio
+            return True # A similar question is stored
+    return False # No similar question is stored
+
+# Function to run the benchmark, print a table of lookup costs and return True if the index always agrees with the scan
+def run(): # Define the run function
+    rng = random.Random(7) # Fixed seed so runs are comparable
+    vocabulary = build_vocabulary(rng) # Build the vocabulary
+    corpus = [make_question(rng, vocabulary) for _ in range(max(SIZES))] # Build the stored questions
+    disagreements = 0 # Lookups where the index and the scan gave different verdicts
+
+    print(f"{'stored':>8} {'index us/lookup':>16} {'no-match us':>12} {'avg candidates':>15} {'linear us/lookup':>17} {'agreement':>10} {'duplicates found':>17}") # Print the table header
+    for size in SIZES: # Iterate over the sizes
+        stored = corpus[:size] # Questions stored at this size
+        index = QuestionIndex() # Create an empty index
+        for question in stored: # Iterate over the stored questions
+            index.add(question) # Store the question
+
+        # A third of the lookups are near-duplicates of stored questions, a third reuse a template and a third are unrelated
+        makers = [ # Query makers, cycled through
+            lambda: make_near_duplicate(rng, rng.choice(stored), vocabulary), # Near-duplicate
+            lambda: make_question(rng, vocabulary), # Same templates, fresh words
+            lambda: make_unrelated(rng, vocabulary), # Nothing in common
+        ]
+        queries = [makers[i % len(makers)]() for i in range(LOOKUPS)] # Build the lookups
+
+        start = time.perf_counter() # Start timing the index
+        index_answers = [index.has_similar(query, THRESHOLD) for query in queries] # Look up every query in the index
+        index_cost = (time.perf_counter() - start) / LOOKUPS * 1e6 # Microseconds per lookup
+        unrelated = queries[2::3] # Lookups with nothing to find, which have to rule out every stored question
+        start = time.perf_counter() # Start timing the unrelated lookups
+        for query in unrelated: # Iterate over the unrelated lookups
+            index.has_similar(query, THRESHOLD) # Look the query up again
+        no_match_cost = (time.perf_counter() - start) / len(unrelated) * 1e6 # Microseconds per unrelated lookup
+        candidates = sum(sum(1 for _ in index.candidates(query.lower(), THRESHOLD)) for query in queries) / LOOKUPS # Average questions left after the bounds
+
+        start = time.perf_counter() # Start timing the linear scan
+        linear_answers = [linear_has_similar(stored, query) for query in queries[:BASELINE_LOOKUPS]] # Look up a sample with the linear scan
+        linear_cost = (time.perf_counter() - start) / BASELINE_LOOKUPS * 1e6 # Microseconds per lookup
+        mismatched = sum(a != b for a, b in zip(index_answers, linear_answers)) # Verdicts that differ from the scan
+        disagreements += mismatched # Count them across sizes
+        agreement = 1 - mismatched / BASELINE_LOOKUPS # Fraction of identical verdicts
+
+        duplicates_found = sum(index_answers[::3]) / len(index_answers[::3]) # Fraction of near-duplicates the index catches
+
+        print(f"{size:>8} {index_cost:>16.1f} {no_match_cost:>12.1f} {candidates:>15.1f} {linear_cost:>17.1f} {agreement:>10.0%} {duplicates_found:>17.0%}") # Print the row
+
+    print(f"Disagreed with the linear scan on {disagreements} lookups") # Print the summary
+    return disagreements == 0 # Return True if the index kept the scan's verdicts
+
+# Main entry point
+if __name__ == "__main__": # Check if the script is being run directly
+    sys.exit(0 if run() else 1) # Exit with 1 if the index disagreed with the scan
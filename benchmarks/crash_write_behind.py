@@ -0,0 +1,92 @@
+import argparse # Import the argparse module to read the trial options
+import os # Import the os module to point the child processes at a scratch database
+import random # Import the random module to kill the writer at an unpredictable moment
+import signal # Import the signal module to kill the writer without any cleanup
+import sqlite3 # Import the sqlite3 module to count the rows that survived
+import subprocess # Import the subprocess module to run the writer in its own process
+import sys # Import the sys module to start the writer with this interpreter
+import tempfile # Import the tempfile module to keep the scratch database out of the project
+import threading # Import the threading module to read the acknowledgements while the writer runs
+import time # Import the time module to let the writer run before it is killed
+
+FLUSH_EVERY = 5 # Mistakes buffered between acknowledged flushes, like a short question set
+
+# Function run in the child process: buffer mistakes and print each one once a flush has committed it
+def write_acknowledged(chapter): # Define the write_acknowledged function with the chapter parameter
+    from write_behind import write_buffer # Import the buffer inside the child, after DATABASE_PATH is set
+    written = [] # Mistakes buffered since the last flush
+    number = 0 # Mistakes buffered so far
+    while True: # Write until the parent kills the process
+        number += 1 # Next mistake
+        write_buffer.add_mistake(1, chapter, 1, f"question {number}", "answer", "correct answer") # Buffer the mistake
+        written.append(number) # Remember it until it is acknowledged
+        if len(written) >= FLUSH_EVERY and write_buffer.flush(): # Flush at the end of each set
+            for acknowledged in written: # Iterate over the committed mistakes
+                print(f"ack {acknowledged}", flush=True) # Acknowledge the mistake
+            written = [] # Start the next set
+
+# Function run in the child process: buffer mistakes without flushing and exit normally
+def write_and_exit(chapter, count): # Define the write_and_exit function with the chapter and count parameters
+    from write_behind import write_buffer # Import the buffer inside the child, after DATABASE_PATH is set
+    for number in range(1, count + 1): # Iterate over the mistakes
+        write_buffer.add_mistake(1, chapter, 1, f"question {number}", "answer", "correct answer") # Buffer the mistake
+    sys.exit(0) # Exit without flushing, the buffer must flush itself on exit
+
+# Function to start a child process writing to the scratch database
+def start_child(db_path, *arguments): # Define the start_child function with the db_path and arguments parameters
+    env = dict(os.environ, DATABASE_PATH=db_path, WRITE_BEHIND_INTERVAL="60") # Keep the timer out of the way, only explicit flushes acknowledge
+    return subprocess.Popen( # Start the child
+        [sys.executable, "-m", "benchmarks.crash_write_behind", "--child", *arguments], # Run this module in child mode
+        stdout=subprocess.PIPE, text=True, env=env, # Read the acknowledgements
+    )
+
+# Function to read the questions stored for a chapter
+def stored_questions(db_path, chapter): # Define the stored_questions function with the db_path and chapter parameters
+    with sqlite3.connect(db_path) as conn: # Connect to the scratch database
+        return {row[0] for row in conn.execute('SELECT question FROM mistakes WHERE chapter = ?', (chapter,))} # Return the stored questions
+
+# Function to kill writers at random moments and check that every acknowledged mistake was stored
+def run(trials, exit_count): # Define the run function with the trials and exit_count parameters
+    lost = 0 # Acknowledged mistakes missing after a crash
+    acknowledged_total = 0 # Acknowledged mistakes across the trials
+    with tempfile.TemporaryDirectory() as scratch: # Scratch space for the database
+        db_path = os.path.join(scratch, "progress.db") # Scratch database
+        for trial in range(1, trials + 1): # Iterate over the trials
+            child = start_child(db_path, "ack", str(trial)) # Start a writer for this trial's chapter
+            lines = [] # Lines the writer printed
+            reader = threading.Thread(target=lambda: lines.extend(child.stdout)) # Keep reading, so a full pipe never pauses the writer
+            reader.start() # Start reading
+            time.sleep(random.uniform(0.3, 1.0)) # Let it write for a while
+            child.send_signal(signal.SIGKILL) # Kill it without any cleanup, mid-write or mid-flush
+            child.wait() # Wait for it to die
+            reader.join() # Read every acknowledgement it printed
+            acknowledged = {f"question {line.split()[1]}" for line in lines if line.startswith("ack ")} # Acknowledged mistakes
+            missing = acknowledged - stored_questions(db_path, trial) # Acknowledged but not stored
+            acknowledged_total += len(acknowledged) # Count the acknowledged mistakes
+            lost += len(missing) # Count the lost mistakes
+            print(f"Trial {trial}: {len(acknowledged)} acknowledged, {len(missing)} lost") # Print the trial result
+
+        chapter = trials + 1 # Chapter for the clean exit check
+        child = start_child(db_path, "exit", str(chapter), str(exit_count)) # Start a writer that never flushes
+        child.communicate() # Wait for it to exit
+        stored = len(stored_questions(db_path, chapter)) # Mistakes written on exit
+        print(f"Clean exit: {stored} of {exit_count} buffered mistakes written") # Print the result
+
+    print(f"Lost {lost} of {acknowledged_total} acknowledged mistakes") # Print the summary
+    return lost == 0 and stored == exit_count # Return True if nothing was lost
+
+# Main entry point
+if __name__ == "__main__": # Check if the script is being run directly
+    parser = argparse.ArgumentParser(description="Kill buffered writers at random and check no acknowledged write is lost.") # Create the argument parser
+    parser.add_argument("--trials", type=int, default=10, help="Writers to kill.") # Trials
+    parser.add_argument("--exit-count", type=int, default=25, help="Mistakes buffered by the writer that exits normally.") # Clean exit check size
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS) # Child mode and its arguments, used internally
+    args = parser.parse_args() # Parse the command line
+
+    if args.child: # Check if this process is a writer
+        if args.child[0] == "ack": # Check if the writer acknowledges flushes
+            write_acknowledged(int(args.child[1])) # Write until killed
+        else: # The writer exits normally
+            write_and_exit(int(args.child[1]), int(args.child[2])) # Write and exit
+    else: # This process runs the trials
+        sys.exit(0 if run(args.trials, args.exit_count) else 1) # Exit with 1 if anything was lost
@@ -0,0 +1,144 @@
+import gzip # Import the gzip module to keep cassettes compact on disk
+import hashlib # Import the hashlib module to key recordings by prompt
+import json # Import the json module to store one recording per line
+import os # Import the os module to read environment variables
+import threading # Import the threading module to share the cassette between worker threads
+import time # Import the time module to record and replay latencies
+from collections import defaultdict # Import defaultdict to group recordings by prompt
+from types import SimpleNamespace # Import SimpleNamespace to build responses shaped like the OpenAI client's
+from llm_backends import SINGLE_QUESTION_HEADINGS, create_backend, stream_chunks # Import the backend helpers to wrap the configured backend, replay streams, and classify prompts
+
+LLM_CASSETTE = os.getenv("LLM_CASSETTE", "llm_cassette.jsonl.gz") # File the recordings are written to and replayed from
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off").lower() # "record" to capture every response, "replay" to serve them back, "off" to do neither
+LLM_CASSETTE_LATENCY = os.getenv("LLM_CASSETTE_LATENCY", "false").lower() == "true" # Wait as long as the recorded call took when replaying
+
+# Exception raised when a replayed prompt was never recorded
+class CassetteMiss(Exception): # Define the CassetteMiss class
+    pass
+
+# Function to key a request by its prompt, so the same messages always find the same recordings
+def cassette_key(messages): # Define the cassette_key function with the messages parameter
+    prompt = json.dumps([[message.get("role"), message.get("content")] for message in messages or []]) # Roles and text of every message
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest() # Return the prompt hash
+
+# Function to read every recording from a cassette
+def load_cassette(path=LLM_CASSETTE): # Define the load_cassette function with the path parameter
+    records = [] # Recordings in the order they were made
+    with gzip.open(path, "rt", encoding="utf-8") as cassette_file: # Open the cassette
+        for line in cassette_file: # Iterate over the recordings
+            if line.strip(): # Skip blank lines
+                records.append(json.loads(line)) # Decode the recording
+    return records # Return the recordings
+
+# Function to work out what a recorded prompt asked for, returning the question type, "batch", or None
+def prompt_kind(prompt): # Define the prompt_kind function with the prompt parameter
+    if "Respond with only a JSON array" in prompt: # Check if the prompt asked for a batch
+        return "batch" # Batched questions
+    for heading, question_type in SINGLE_QUESTION_HEADINGS.items(): # Iterate over the single-question headings
+        if heading in prompt: # Check if the prompt asked for this type
+            return question_type # Single question
+    return None # Lessons and grading are not question responses
+
+# Class that passes requests to another backend and writes every response to a cassette
+class RecordingBackend: # Define the RecordingBackend class
+
+    # Initialize the RecordingBackend class
+    def __init__(self, backend, path=LLM_CASSETTE): # Define the constructor with the backend and path parameters
+        self.backend = backend # Backend that answers the requests
+        self.model = backend.model # Model used for every request
+        self.path = path # Cassette file
+        self.lock = threading.Lock() # Lock so lines from different threads do not interleave
+        self.client = SimpleNamespace(chat=SimpleNamespace(completions=self)) # Expose the same client.chat.completions.create path as the OpenAI client
+
+    # Function to append one recording to the cassette
+    def write(self, messages, model, content, usage, latency): # Define the write function
+        record = { # Describe the response
+            "key": cassette_key(messages), # Prompt hash
+            "prompt": messages[-1].get("content") if messages else "", # Prompt text, so suites can tell what was asked
+            "model": model, # Model the request asked for
+            "content": content, # Response text
+            "prompt_tokens": getattr(usage, "prompt_tokens", None), # Prompt tokens reported by the API
+            "completion_tokens": getattr(usage, "completion_tokens", None), # Completion tokens reported by the API
+            "latency": round(latency, 4), # Seconds the call took
+        }
+        with self.lock: # Guard the file
+            with gzip.open(self.path, "at", encoding="utf-8") as cassette_file: # Append, so a crash keeps everything recorded so far
+                cassette_file.write(json.dumps(record) + "\n") # Write the recording
+
+    # Function to answer a request with the wrapped backend and record the response
+    def create(self, **kwargs): # Define the create function with the request parameters
+        messages = kwargs.get("messages") or [] # Messages sent with the request
+        started = time.monotonic() # Time the call
+        response = self.backend.client.chat.completions.create(**kwargs) # Send the request
+        if kwargs.get("stream"): # Check if the response arrives in chunks
+            return self.record_stream(response, messages, kwargs.get("model"), started) # Record it once the stream ends
+        self.write(messages, kwargs.get("model"), response.choices[0].message.content, getattr(response, "usage", None), time.monotonic() - started) # Record the response
+        return response # Return the response
+
+    # Function to pass a stream through and record it after the last chunk
+    def record_stream(self, response, messages, model, started): # Define the record_stream function
+        parts = [] # Text received so far
+        usage = None # Usage, sent with the last chunk
+        for chunk in response: # Iterate over the chunks
+            if chunk.choices and chunk.choices[0].delta.content: # Check if the chunk has text
+                parts.append(chunk.choices[0].delta.content) # Keep the text
+            if getattr(chunk, "usage", None) is not None: # Check if the chunk reports usage
+                usage = chunk.usage # Keep the usage
+            yield chunk # Pass the chunk on
+        self.write(messages, model, "".join(parts), usage, time.monotonic() - started) # Record the whole response
+
+    # Function to close the wrapped backend
+    def close(self): # Define the close function
+        self.backend.close() # Close the wrapped backend
+
+# Class that answers requests from a cassette, without any network
+class ReplayBackend: # Define the ReplayBackend class
+
+    # Initialize the ReplayBackend class
+    def __init__(self, path=LLM_CASSETTE, replay_latency=LLM_CASSETTE_LATENCY, model=None): # Define the constructor with the path, replay_latency, and model parameters
+        self.records = defaultdict(list) # Recordings keyed by prompt hash, in recorded order
+        for record in load_cassette(path): # Iterate over the recordings
+            self.records[record["key"]].append(record) # Group them by prompt
+        self.replay_latency = replay_latency # Wait as long as the recorded call took
+        self.positions = defaultdict(int) # Next recording to serve for each prompt
+        self.lock = threading.Lock() # Lock to keep the positions consistent across threads
+        first = next(iter(self.records.values()), [{}])[0] # Any recording, to learn the recorded model
+        self.model = model or first.get("model") or "replay" # Model reported in responses and telemetry
+        self.client = SimpleNamespace(chat=SimpleNamespace(completions=self)) # Expose the same client.chat.completions.create path as the OpenAI client
+
+    # Function to take the next recording for a prompt, starting over once they have all been served
+    def next_record(self, messages): # Define the next_record function with the messages parameter
+        key = cassette_key(messages) # Prompt hash
+        with self.lock: # Guard the positions
+            recordings = self.records.get(key) # Recordings of this prompt
+            if not recordings: # Check if the prompt was never recorded
+                raise CassetteMiss(f"No recorded response for prompt {key[:12]}") # Report the miss
+            record = recordings[self.positions[key] % len(recordings)] # Take the next recording
+            self.positions[key] += 1 # Move on for the next request
+        return record # Return the recording
+
+    # Function to answer a request from the cassette the way the OpenAI client does
+    def create(self, model=None, messages=None, stream=False, stream_options=None, **kwargs): # Define the create function
+        record = self.next_record(messages) # Find the recording
+        if self.replay_latency and record.get("latency"): # Check if the recorded latency should be replayed
+            time.sleep(record["latency"]) # Wait as long as the recorded call took
+        usage = SimpleNamespace(prompt_tokens=record.get("prompt_tokens"), completion_tokens=record.get("completion_tokens")) # Recorded usage
+        if stream: # Check if the caller wants the reply in chunks
+            return stream_chunks(record["content"], usage if stream_options and stream_options.get("include_usage") else None) # Return the chunks
+        message = SimpleNamespace(role="assistant", content=record["content"]) # The recorded message
+        return SimpleNamespace(model=record.get("model") or self.model, choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")], usage=usage) # Return the response
+
+    # Function to match the other backends' interface
+    def close(self): # Define the close function
+        pass # Nothing to close
+
+# Function to create the configured backend, recording or replaying its responses as set by LLM_CASSETTE_MODE
+def open_backend(mode=LLM_CASSETTE_MODE, path=LLM_CASSETTE): # Define the open_backend function with the mode and path parameters
+    if mode == "replay": # Check if responses should be replayed
+        return ReplayBackend(path) # Serve the recorded responses, no live backend needed
+    if mode not in ("record", "off"): # Check if the mode is unknown
+        raise ValueError(f"Unknown cassette mode: {mode}") # Raise a ValueError for unknown modes
+    backend = create_backend() # Create the backend chosen by LLM_BACKEND
+    if mode == "record": # Check if responses should be recorded
+        return RecordingBackend(backend, path) # Record every response
+    return backend # Use the backend as is
@@ -0,0 +1,65 @@
+import json # Import the json module to pass the code and tests to the harness and read the results back
+import os # Import the os module to read environment variables
+import subprocess # Import the subprocess module to run the code away from the app
+import sys # Import the sys module to find the current Python interpreter
+
+GRADER_TIMEOUT = float(os.getenv("GRADER_TIMEOUT", "5")) # Seconds the code and its tests may run
+RESULT_MARKER = "@@GRADER_RESULT@@" # Prefix of the line carrying the results, so it cannot be confused with the code's output
+
+# Script run in the subprocess: runs the code, then each test, and prints the results as JSON
+HARNESS = """
+import contextlib, io, json, sys, traceback
+payload = json.loads(sys.stdin.read())
+namespace = {"__name__": "__main__"}
+output = io.StringIO()
+error = ""
+results = []
+with contextlib.redirect_stdout(output):
+    try:
+        exec(compile(payload["code"], "<submission>", "exec"), namespace)
+    except BaseException:
+        error = traceback.format_exc(limit=0).strip()
+    for test in payload["tests"]:
+        if error:
+            results.append([test, False, "The code did not run."])
+            continue
+        try:
+            exec(compile(test, "<test>", "exec"), namespace)
+            results.append([test, True, ""])
+        except AssertionError as e:
+            results.append([test, False, str(e) or "Assertion failed."])
+        except BaseException:
+            results.append([test, False, traceback.format_exc(limit=0).strip()])
+print("%s" + json.dumps({"output": output.getvalue(), "error": error, "results": results}))
+""" % RESULT_MARKER
+
+# Function to run code against assert-style test cases in a separate Python process
+def run_tests(code, tests, timeout=GRADER_TIMEOUT): # Define the run_tests function with the code, tests, and timeout parameters
+    try: # Try block to handle exceptions
+        result = subprocess.run( # Run the harness in a subprocess
+            [sys.executable, "-c", HARNESS], # Use the current Python interpreter
+            input=json.dumps({"code": code, "tests": list(tests)}), # Pass the code and tests on stdin
+            capture_output=True, text=True, timeout=timeout # Capture the results
+        )
+    except subprocess.TimeoutExpired: # Handle code that never finishes
+        return {"output": "", "error": "Execution timed out.", "passed": [], "failed": [(test, "Execution timed out.") for test in tests]} # Fail every test
+
+    for line in reversed(result.stdout.splitlines()): # Look for the results line from the end
+        if line.startswith(RESULT_MARKER): # Check if the line carries the results
+            report = json.loads(line[len(RESULT_MARKER):]) # Read the results
+            return { # Return the grading report
+                "output": report["output"].strip(), # What the code printed
+                "error": report["error"], # Error raised while running the code
+                "passed": [test for test, ok, _ in report["results"] if ok], # Tests that passed
+                "failed": [(test, message) for test, ok, message in report["results"] if not ok], # Tests that failed with the reason
+            }
+
+    error = result.stderr.strip() or "The grader did not report any results." # The process exited before reporting, for example by calling exit()
+    return {"output": result.stdout.strip(), "error": error, "passed": [], "failed": [(test, error) for test in tests]} # Fail every test
+
+# Function to keep only the test cases the sample solution passes
+def verify_test_cases(solution, tests, timeout=GRADER_TIMEOUT): # Define the verify_test_cases function with the solution, tests, and timeout parameters
+    tests = [test.strip() for test in tests if isinstance(test, str) and test.strip().startswith("assert ")] # Only plain assert statements are accepted
+    if not tests: # Check if there is nothing to verify
+        return [] # No test cases
+    return run_tests(solution, tests, timeout)["passed"] # Return the tests the sample solution passes
@@ -0,0 +1,105 @@
+import json # Import the json module to store question data in the pack
+import os # Import the os module to check for the pack file and read environment variables
+import sqlite3 # Import the sqlite3 module, the pack is a read-only SQLite file
+import threading # Import the threading module to share one pack connection between threads
+
+PACK_FORMAT_VERSION = 1 # Bump when the pack layout changes so old packs are ignored
+DEFAULT_PACK_PATH = os.getenv("CONTENT_PACK_PATH", "content_pack.db") # Location of the content pack the app loads at startup
+PACK_MMAP_SIZE = 256 * 1024 * 1024 # Let SQLite memory-map up to 256 MB of the pack
+
+# Function to create the pack tables in a pack that is being built
+def create_pack_schema(conn): # Define the create_pack_schema function with the conn parameter
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS pack_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS lessons (
+        chapter INTEGER NOT NULL,
+        lesson INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        PRIMARY KEY (chapter, lesson)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS questions (
+        chapter INTEGER NOT NULL,
+        lesson INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (chapter, lesson, position)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS review_questions (
+        chapter INTEGER NOT NULL,
+        lesson INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (chapter, lesson, position)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS built_lessons (
+        chapter INTEGER NOT NULL,
+        lesson INTEGER NOT NULL,
+        PRIMARY KEY (chapter, lesson)
+    ) WITHOUT ROWID;
+    ''') # Create every pack table
+
+# Function to encode question data compactly for the pack
+def encode_question(question_data): # Define the encode_question function with the question_data parameter
+    return json.dumps(question_data, separators=(",", ":")) # Use compact separators to keep the pack small
+
+# Class to serve lessons and questions from a built content pack
+class ContentPack: # Define the ContentPack class
+
+    # Initialize the ContentPack class
+    def __init__(self, path): # Define the constructor
+        self.path = path # Store the pack path
+        uri = f"file:{os.path.abspath(path)}?mode=ro&immutable=1" # Open the pack read-only, it never changes once built
+        self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False) # Share one connection between threads
+        self.conn.execute(f"PRAGMA mmap_size = {PACK_MMAP_SIZE}") # Memory-map the pack instead of copying pages
+        self.lock = threading.Lock() # Serialize access to the shared connection
+        self.meta = dict(self.conn.execute('SELECT key, value FROM pack_meta')) # Load the pack metadata
+
+    # Function to get the lesson content stored in the pack
+    def lesson_content(self, chapter, lesson): # Define the lesson_content function with the chapter and lesson parameters
+        with self.lock: # Serialize access to the shared connection
+            row = self.conn.execute( # Execute a query to retrieve the lesson content
+                'SELECT content FROM lessons WHERE chapter = ? AND lesson = ?',
+                (chapter, lesson) # Provide the chapter and lesson as parameters
+            ).fetchone() # Fetch the row from the pack
+        return row[0] if row else None # Return the content or None if the lesson is not in the pack
+
+    # Function to get the question bank for a lesson
+    def questions(self, chapter, lesson, review=False): # Define the questions function with the chapter, lesson, and review parameters
+        table = "review_questions" if review else "questions" # Pick the review pool or the lesson bank
+        with self.lock: # Serialize access to the shared connection
+            rows = self.conn.execute( # Execute a query to retrieve the questions
+                f'SELECT data FROM {table} WHERE chapter = ? AND lesson = ? ORDER BY position',
+                (chapter, lesson) # Provide the chapter and lesson as parameters
+            ).fetchall() # Fetch every question for the lesson
+        return [json.loads(row[0]) for row in rows] # Decode a fresh copy of each question
+
+    # Function to close the pack
+    def close(self): # Define the close function
+        with self.lock: # Serialize access to the shared connection
+            self.conn.close() # Close the connection
+
+# Function to open the content pack if a complete, current one exists
+def open_content_pack(path=DEFAULT_PACK_PATH): # Define the open_content_pack function with the path parameter
+    if not path or not os.path.exists(path): # Check if there is no pack to load
+        return None # Run without a pack
+
+    try: # Try block to handle exceptions
+        pack = ContentPack(path) # Open the pack
+    except sqlite3.Error as e: # Catch unreadable packs
+        print(f"Failed to open content pack {path}: {e}") # Log the error
+        return None # Run without a pack
+
+    if pack.meta.get("format_version") != str(PACK_FORMAT_VERSION) or pack.meta.get("complete") != "1": # Check the pack version and that the build finished
+        print(f"Ignoring content pack {path}: incomplete or built for another format version.") # Log the reason
+        pack.close() # Close the unusable pack
+        return None # Run without a pack
+
+    print(f"Loaded content pack {path} (version {pack.meta.get('pack_version')})") # Log the loaded pack
+    return pack # Return the opened pack
@@ -0,0 +1,134 @@
+import argparse # Import the argparse module to read the command line options
+import datetime # Import the datetime module to timestamp the pack
+import os # Import the os module to manage the pack files
+import sqlite3 # Import the sqlite3 module to write the pack
+from concurrent.futures import ThreadPoolExecutor, as_completed # Import the thread pool helpers to build lessons in parallel
+from config import chapters # Import the chapters dictionary from the config module for lesson details
+from content_pack import DEFAULT_PACK_PATH, PACK_FORMAT_VERSION, create_pack_schema, encode_question # Import the pack layout helpers
+from questions import LESSON_MODEL, LESSON_PROMPT_VERSION, request_lesson_content, generate_questions_from_content # Import the existing generation path
+
+# Function to list every lesson the pack should contain
+def lessons_to_build(selected_chapters=None): # Define the lessons_to_build function with the selected_chapters parameter
+    lessons = [] # Initialize an empty list to store the lessons
+    for chapter_num, chapter_data in chapters.items(): # Iterate over the chapters
+        if selected_chapters and chapter_num not in selected_chapters: # Check if the chapter was not requested
+            continue # Skip the chapter
+        for lesson_num, lesson_data in chapter_data['lessons'].items(): # Iterate over the lessons
+            if lesson_num == 8 or not lesson_data.get('question_count'): # Skip the review test lesson
+                continue # Review tests are served from the review pools
+            lessons.append((chapter_num, lesson_num)) # Add the lesson to the list
+    return lessons # Return the lessons
+
+# Function to explain why a generated question set is not good enough for the pack, None when it is
+def shortfall(question_set, wanted): # Define the shortfall function with the question_set and wanted parameters
+    if question_set.reason: # Check if generation stopped early
+        return question_set.reason # Report why
+    if len(question_set) < wanted: # Check if the set is short
+        return f"{len(question_set)} of {wanted} questions" # Report how short
+    if question_set.from_fallback: # Check if repeats filled the set
+        return f"{question_set.from_fallback} repeated questions from the fallback pool" # Report the padding
+    return None # The set is complete
+
+# Function to generate everything the pack stores for one lesson, run on a worker thread
+def build_lesson(chapter, lesson, content, bank_multiplier): # Define the build_lesson function with the chapter, lesson, content, and bank_multiplier parameters
+    lesson_data = chapters[chapter]['lessons'][lesson] # Retrieve the lesson details
+
+    if content is None: # Check if the content still has to be generated
+        content = request_lesson_content(chapter, lesson) # Generate the lesson content
+
+    bank = generate_questions_from_content( # Generate the lesson question bank
+        chapter, lesson, content, lesson_data['question_count'] * bank_multiplier, use_pack=False # Build a larger bank than one lesson needs
+    )
+    review_pool = generate_questions_from_content( # Generate the review pool used by the chapter review
+        chapter, lesson, content, lesson_data.get('complexity', 1) + 1, use_pack=False # The review asks for at most complexity + 1 questions
+    )
+    return content, bank, review_pool # Return the generated lesson
+
+# Function to build the content pack, resuming from an interrupted build if one exists
+def build_pack(output_path=DEFAULT_PACK_PATH, workers=4, bank_multiplier=2, selected_chapters=None, pack_version=None): # Define the build_pack function
+    staging_path = output_path + ".partial" # Build into a staging file so an interrupted build can resume
+
+    conn = sqlite3.connect(staging_path) # Connect to the staging pack
+    create_pack_schema(conn) # Create the pack tables if this is a fresh build
+
+    built = set(conn.execute('SELECT chapter, lesson FROM built_lessons')) # Lessons finished by an earlier run
+    stored_content = dict(((row[0], row[1]), row[2]) for row in conn.execute('SELECT chapter, lesson, content FROM lessons')) # Content kept from an earlier run
+    pending = [key for key in lessons_to_build(selected_chapters) if key not in built] # Lessons still to build
+
+    print(f"Building {len(pending)} lessons ({len(built)} already built) into {staging_path}") # Log the build plan
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor: # Create a thread pool to build the lessons in parallel
+        futures = { # Submit one build per pending lesson
+            executor.submit(build_lesson, chapter, lesson, stored_content.get((chapter, lesson)), bank_multiplier): (chapter, lesson) # Reuse content from an earlier run
+            for chapter, lesson in pending # Iterate over the pending lessons
+        }
+
+        for done, future in enumerate(as_completed(futures), start=1): # Store each lesson as soon as it is built
+            chapter, lesson = futures[future] # Look up which lesson finished
+            try: # Try block to handle exceptions
+                content, bank, review_pool = future.result() # Get the generated lesson
+            except Exception as e: # Catch any exceptions
+                print(f"Failed to build Chapter {chapter}, Lesson {lesson}: {e}") # Log the error and leave it for the next run
+                continue # Move on to the next lesson
+
+            lesson_data = chapters[chapter]['lessons'][lesson] # Retrieve the lesson details
+            problem = shortfall(bank, lesson_data['question_count'] * bank_multiplier) or shortfall(review_pool, lesson_data.get('complexity', 1) + 1) # Check both sets are complete
+            if problem: # Check if the lesson is incomplete
+                with conn: # Keep the content so the next run only regenerates the questions
+                    conn.execute('INSERT OR REPLACE INTO lessons (chapter, lesson, content) VALUES (?, ?, ?)', (chapter, lesson, content)) # Store the lesson content
+                print(f"Incomplete Chapter {chapter}, Lesson {lesson}: {problem}") # Log the problem and leave the lesson for the next run
+                continue # Move on to the next lesson
+
+            with conn: # Store the whole lesson in one transaction so a crash never leaves it half written
+                conn.execute('INSERT OR REPLACE INTO lessons (chapter, lesson, content) VALUES (?, ?, ?)', (chapter, lesson, content)) # Store the lesson content
+                conn.execute('DELETE FROM questions WHERE chapter = ? AND lesson = ?', (chapter, lesson)) # Clear any partial bank
+                conn.execute('DELETE FROM review_questions WHERE chapter = ? AND lesson = ?', (chapter, lesson)) # Clear any partial review pool
+                conn.executemany( # Store the question bank
+                    'INSERT INTO questions (chapter, lesson, position, data) VALUES (?, ?, ?, ?)',
+                    [(chapter, lesson, position, encode_question(question)) for position, question in enumerate(bank)] # Encode each question
+                )
+                conn.executemany( # Store the review pool
+                    'INSERT INTO review_questions (chapter, lesson, position, data) VALUES (?, ?, ?, ?)',
+                    [(chapter, lesson, position, encode_question(question)) for position, question in enumerate(review_pool)] # Encode each question
+                )
+                conn.execute('INSERT OR IGNORE INTO built_lessons (chapter, lesson) VALUES (?, ?)', (chapter, lesson)) # Mark the lesson as built
+            print(f"[{done}/{len(pending)}] Built Chapter {chapter}, Lesson {lesson}: {len(bank)} questions, {len(review_pool)} review questions") # Log the progress
+
+    remaining = [key for key in lessons_to_build(selected_chapters) if key not in set(conn.execute('SELECT chapter, lesson FROM built_lessons'))] # Lessons that still failed
+    if remaining: # Check if the build is incomplete
+        conn.close() # Close the staging pack
+        print(f"{len(remaining)} lessons failed. Run the builder again to resume.") # Tell the user how to finish the build
+        return False # Report an incomplete build
+
+    meta = { # Describe the pack so the app can check it before use
+        "format_version": str(PACK_FORMAT_VERSION), # Layout version
+        "pack_version": pack_version or datetime.datetime.now().strftime("%Y%m%d%H%M%S"), # Content version
+        "prompt_version": str(LESSON_PROMPT_VERSION), # Lesson prompt version
+        "model": LESSON_MODEL, # Lesson model
+        "built_at": datetime.datetime.now().isoformat(timespec="seconds"), # Build time
+        "complete": "1", # Marks a finished build
+    }
+    with conn: # Store the metadata in one transaction
+        conn.executemany('INSERT OR REPLACE INTO pack_meta (key, value) VALUES (?, ?)', meta.items()) # Store each metadata entry
+
+    if os.path.exists(output_path): # Check if an older pack is in the way
+        os.remove(output_path) # Remove the older pack
+    conn.execute('VACUUM INTO ?', (output_path,)) # Write a compacted copy as the final pack
+    conn.close() # Close the staging pack
+    os.remove(staging_path) # Remove the staging pack now that the build is finished
+
+    print(f"Content pack written to {output_path} (version {meta['pack_version']})") # Log the finished build
+    return True # Report a complete build
+
+# Main entry point
+if __name__ == "__main__": # Check if the script is being run directly
+    parser = argparse.ArgumentParser(description="Pre-generate lessons, question banks, and review pools into a content pack.") # Create the argument parser
+    parser.add_argument("--output", default=DEFAULT_PACK_PATH, help="Path of the content pack to write.") # Pack location
+    parser.add_argument("--workers", type=int, default=4, help="Number of lessons generated in parallel.") # Lesson concurrency
+    parser.add_argument("--bank-multiplier", type=int, default=2, help="Question bank size as a multiple of the lesson question count.") # Bank size
+    parser.add_argument("--chapters", type=int, nargs="*", help="Only build these chapters.") # Chapter filter
+    parser.add_argument("--pack-version", help="Version label stored in the pack (defaults to a timestamp).") # Version label
+    args = parser.parse_args() # Parse the command line
+
+    complete = build_pack(args.output, args.workers, args.bank_multiplier, args.chapters, args.pack_version) # Build the pack
+    raise SystemExit(0 if complete else 1) # Exit with a failure code if lessons are still missing
@@ -1,76 +1,290 @@
+import os # Import the os module to read environment variables
 import sqlite3 # Import the SQLite3 module to interact with the SQLite database
+import threading # Import the threading module to give each thread its own connection
+from dotenv import load_dotenv # Import load_dotenv to read the database settings from .env
 
-def initialize_database(): # Function to initialize the SQLite database
-    # Connect to the SQLite database (creates the file if it doesn't exist)
-    conn = sqlite3.connect('progress.db') # The database file is named progress.db
-    cursor = conn.cursor() # Create a cursor object to interact with the database
+load_dotenv() # Load environment variables from .env
+
+DATABASE_PATH = os.getenv("DATABASE_PATH", "progress.db") # Database file, or ":memory:" for a throwaway database shared by every thread
+DATABASE_TIMEOUT = float(os.getenv("DATABASE_TIMEOUT", "10")) # Seconds to wait for a lock held by another connection
+DATABASE_STATEMENT_CACHE = int(os.getenv("DATABASE_STATEMENT_CACHE", "256")) # Prepared statements kept per connection
+DATABASE_JOURNAL_MODE = os.getenv("DATABASE_JOURNAL_MODE", "WAL") # WAL lets readers keep reading while another connection writes
+DATABASE_SYNCHRONOUS = os.getenv("DATABASE_SYNCHRONOUS", "NORMAL") # NORMAL is safe with WAL and skips most fsyncs
+DATABASE_MMAP_SIZE = int(os.getenv("DATABASE_MMAP_SIZE", str(256 * 1024 * 1024))) # Bytes of the database SQLite may memory-map
+DATABASE_CACHE_SIZE = int(os.getenv("DATABASE_CACHE_SIZE", "-16000")) # Page cache per connection, negative values are KiB
+
+# Class to hand each thread one long-lived connection to the database
+class ConnectionManager: # Define the ConnectionManager class
+
+    # Initialize the ConnectionManager class
+    def __init__(self, path=DATABASE_PATH, timeout=DATABASE_TIMEOUT, cached_statements=DATABASE_STATEMENT_CACHE): # Define the constructor
+        self.in_memory = path == ":memory:" # True when the database lives only in memory
+        if self.in_memory: # Check if the database should live in memory
+            self.target = f"file:progress-{id(self)}?mode=memory&cache=shared" # Named in-memory database, so every thread sees the same data
+        else: # The database is a file
+            self.target = os.path.abspath(path) # Resolve the path once, so changing directory does not open another file
+        self.timeout = timeout # Seconds to wait for a lock
+        self.cached_statements = cached_statements # Prepared statements kept per connection
+        self.local = threading.local() # Each thread's connection
+        self.connections = {} # Open connections keyed by the thread that owns them, so they can all be closed
+        self.lock = threading.Lock() # Lock to guard the open connections
+        self.keeper = self.open() if self.in_memory else None # An in-memory database is dropped when its last connection closes, so keep one open
+
+    # Function to open a new connection with the manager's settings
+    def open(self): # Define the open function
+        conn = sqlite3.connect( # Connect to the database
+            self.target, # Database file or in-memory name
+            timeout=self.timeout, # Wait for locks held by other threads
+            cached_statements=self.cached_statements, # Reuse prepared statements
+            uri=self.in_memory, # The in-memory name is a URI
+            check_same_thread=False, # Each connection is used by one thread, but may be closed from another
+        )
+        if not self.in_memory: # In-memory databases have no journal file to tune
+            conn.execute(f"PRAGMA journal_mode = {DATABASE_JOURNAL_MODE}") # Stored in the file, so this only changes something the first time
+            conn.execute(f"PRAGMA mmap_size = {DATABASE_MMAP_SIZE}") # Read pages through the memory map instead of copying them
+        conn.execute(f"PRAGMA synchronous = {DATABASE_SYNCHRONOUS}") # Sync less often on commit
+        conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}") # Wait for a lock instead of failing at once
+        conn.execute(f"PRAGMA cache_size = {DATABASE_CACHE_SIZE}") # Keep more pages in memory
+        return conn # Return the connection
 
-    # Create the users table (if it doesn't already exist)
-    cursor.execute(''' 
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        email TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        chapter INTEGER DEFAULT 1,
-        lesson INTEGER DEFAULT 1
-    )
-    ''')
+    # Function to get the calling thread's connection, opening it on first use
+    def get(self): # Define the get function
+        conn = getattr(self.local, "conn", None) # The thread's connection
+        if conn is None: # Check if the thread has no connection yet
+            conn = self.open() # Open one
+            self.local.conn = conn # Keep it for the thread's next call
+            with self.lock: # Guard the open connections
+                for thread in [thread for thread in self.connections if not thread.is_alive()]: # Iterate over threads that have finished
+                    self.connections.pop(thread).close() # Close their connections
+                self.connections[threading.current_thread()] = conn # Track the connection
+        return conn # Return the connection
 
-    # Create the mistakes table (if it doesn't already exist)
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS mistakes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        chapter INTEGER NOT NULL,
-        lesson INTEGER NOT NULL,
-        question TEXT NOT NULL,
-        user_answer TEXT NOT NULL,
-        correct_answer TEXT NOT NULL,
-        feedback TEXT,
-        user_code TEXT,
-        user_output TEXT,
-        user_errors TEXT,
-        original_lesson INTEGER,
-        FOREIGN KEY (user_id) REFERENCES users(id)
-    )
-    ''')
+    # Function to close every open connection, for shutdown
+    def close_all(self): # Define the close_all function
+        with self.lock: # Guard the open connections
+            connections = list(self.connections.values()) # Every open connection
+            self.connections.clear() # Forget them
+        for conn in connections: # Iterate over the connections
+            conn.close() # Close the connection
+        self.local = threading.local() # Threads open fresh connections on their next call
 
-    # Create the lesson_content table (if it doesn't already exist)
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS lesson_content (
-        user_id INTEGER NOT NULL,
-        chapter INTEGER NOT NULL,
-        lesson INTEGER NOT NULL,
-        content TEXT NOT NULL,
-        PRIMARY KEY (user_id, chapter, lesson),
-        FOREIGN KEY (user_id) REFERENCES users(id)
-    )
-    ''')
+connections = ConnectionManager() # Connection manager shared by the whole app
 
-    # Create the lesson_scores table (if it doesn't already exist)
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS lesson_scores (
-        user_id INTEGER NOT NULL,
-        chapter INTEGER NOT NULL,
-        lesson INTEGER NOT NULL,
-        correct INTEGER NOT NULL,
-        total INTEGER NOT NULL,
-        PRIMARY KEY (user_id, chapter, lesson),
-        FOREIGN KEY (user_id) REFERENCES users(id)
-    )
-    ''')
+# Function to get the calling thread's database connection; use it as "with connect() as conn:" to commit on success and roll back on error
+def connect(): # Define the connect function
+    return connections.get() # Return the thread's connection
 
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS certificates (
-        user_id INTEGER PRIMARY KEY,
-        certificate_path TEXT,
-        date_issued TEXT,
-        FOREIGN KEY (user_id) REFERENCES users(id)
-    )
-    ''')
-    conn.commit() # Commit the changes to the database
-    conn.close() # Close the connection to the database
+# Ordered schema migrations as (version, description, statements); a database at version N runs every migration above N once
+# Append new migrations with the next version number, and never edit one that has shipped
+MIGRATIONS = [
+    (1, "baseline schema", [ # Tables created before the schema was versioned, so existing databases adopt them unchanged
+        # Create the users table (if it doesn't already exist)
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            chapter INTEGER DEFAULT 1,
+            lesson INTEGER DEFAULT 1
+        )
+        ''',
+        # Create the mistakes table (if it doesn't already exist)
+        '''
+        CREATE TABLE IF NOT EXISTS mistakes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            chapter INTEGER NOT NULL,
+            lesson INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            user_answer TEXT NOT NULL,
+            correct_answer TEXT NOT NULL,
+            feedback TEXT,
+            user_code TEXT,
+            user_output TEXT,
+            user_errors TEXT,
+            original_lesson INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        ''',
+        # Create the lesson_content table (if it doesn't already exist)
+        '''
+        CREATE TABLE IF NOT EXISTS lesson_content (
+            user_id INTEGER NOT NULL,
+            chapter INTEGER NOT NULL,
+            lesson INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            PRIMARY KEY (user_id, chapter, lesson),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        ''',
+        # Create the shared_lesson_content table (if it doesn't already exist)
+        # Lessons are shared between users and keyed by curriculum position, prompt version, and model
+        '''
+        CREATE TABLE IF NOT EXISTS shared_lesson_content (
+            chapter INTEGER NOT NULL,
+            lesson INTEGER NOT NULL,
+            prompt_version INTEGER NOT NULL,
+            model TEXT NOT NULL,
+            variant INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            PRIMARY KEY (chapter, lesson, prompt_version, model, variant)
+        )
+        ''',
+        # Create the lesson_digests table (if it doesn't already exist)
+        # Condensed lesson notes used in question prompts, keyed by a hash of the lesson content they summarize
+        '''
+        CREATE TABLE IF NOT EXISTS lesson_digests (
+            content_hash TEXT NOT NULL,
+            prompt_version INTEGER NOT NULL,
+            model TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            PRIMARY KEY (content_hash, prompt_version, model)
+        )
+        ''',
+        # Create the seen_questions table (if it doesn't already exist)
+        # Questions already served to a user in a chapter, so returning learners are not served near-duplicates
+        '''
+        CREATE TABLE IF NOT EXISTS seen_questions (
+            user_id INTEGER NOT NULL,
+            chapter INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            last_seen REAL NOT NULL,
+            PRIMARY KEY (user_id, chapter, question),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        ''',
+        # Create the llm_calls table (if it doesn't already exist)
+        # One row per API call with its token usage and latency, read by the telemetry report
+        '''
+        CREATE TABLE IF NOT EXISTS llm_calls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL NOT NULL,
+            call_site TEXT NOT NULL,
+            chapter INTEGER,
+            lesson INTEGER,
+            question_type TEXT,
+            model TEXT,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            latency REAL,
+            retries INTEGER NOT NULL DEFAULT 0,
+            parse_failures INTEGER NOT NULL DEFAULT 0,
+            error TEXT
+        )
+        ''',
+        # Create the lesson_scores table (if it doesn't already exist)
+        '''
+        CREATE TABLE IF NOT EXISTS lesson_scores (
+            user_id INTEGER NOT NULL,
+            chapter INTEGER NOT NULL,
+            lesson INTEGER NOT NULL,
+            correct INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY (user_id, chapter, lesson),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        ''',
+        # Create the certificates table (if it doesn't already exist)
+        '''
+        CREATE TABLE IF NOT EXISTS certificates (
+            user_id INTEGER PRIMARY KEY,
+            certificate_path TEXT,
+            date_issued TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        ''',
+    ]),
+    (2, "index telemetry calls by time", [ # The telemetry report can limit calls to recent ones without a full scan
+        'CREATE INDEX IF NOT EXISTS idx_llm_calls_created_at ON llm_calls (created_at)',
+    ]),
+    (3, "maintained mistake summary", [ # Mistake counts per lesson, so the mistakes screen and reviews read one row per lesson instead of counting
+        # Find a lesson's mistakes, in the order they were made, without a full scan
+        'CREATE INDEX IF NOT EXISTS idx_mistakes_user_lesson ON mistakes (user_id, chapter, lesson, id)',
+        # Create the mistake_summary table, one row per lesson with at least one mistake
+        '''
+        CREATE TABLE IF NOT EXISTS mistake_summary (
+            user_id INTEGER NOT NULL,
+            chapter INTEGER NOT NULL,
+            lesson INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            last_at REAL NOT NULL,
+            PRIMARY KEY (user_id, chapter, lesson)
+        ) WITHOUT ROWID
+        ''',
+        # Count the mistakes already recorded
+        '''
+        INSERT OR REPLACE INTO mistake_summary (user_id, chapter, lesson, count, last_at)
+        SELECT user_id, chapter, lesson, COUNT(*), (julianday('now') - 2440587.5) * 86400.0
+        FROM mistakes
+        GROUP BY user_id, chapter, lesson
+        ''',
+        # Count each new mistake, last_at is in seconds since the epoch like the other tables
+        '''
+        CREATE TRIGGER IF NOT EXISTS mistakes_summary_insert AFTER INSERT ON mistakes
+        BEGIN
+            INSERT INTO mistake_summary (user_id, chapter, lesson, count, last_at)
+            VALUES (new.user_id, new.chapter, new.lesson, 1, (julianday('now') - 2440587.5) * 86400.0)
+            ON CONFLICT (user_id, chapter, lesson) DO UPDATE SET count = count + 1, last_at = excluded.last_at;
+        END
+        ''',
+        # Uncount each deleted mistake, dropping lessons left with none
+        '''
+        CREATE TRIGGER IF NOT EXISTS mistakes_summary_delete AFTER DELETE ON mistakes
+        BEGIN
+            UPDATE mistake_summary SET count = count - 1
+            WHERE user_id = old.user_id AND chapter = old.chapter AND lesson = old.lesson;
+            DELETE FROM mistake_summary
+            WHERE user_id = old.user_id AND chapter = old.chapter AND lesson = old.lesson AND count <= 0;
+        END
+        ''',
+        # Move a mistake's count when it is moved to another lesson
+        '''
+        CREATE TRIGGER IF NOT EXISTS mistakes_summary_update AFTER UPDATE OF user_id, chapter, lesson ON mistakes
+        BEGIN
+            UPDATE mistake_summary SET count = count - 1
+            WHERE user_id = old.user_id AND chapter = old.chapter AND lesson = old.lesson;
+            DELETE FROM mistake_summary
+            WHERE user_id = old.user_id AND chapter = old.chapter AND lesson = old.lesson AND count <= 0;
+            INSERT INTO mistake_summary (user_id, chapter, lesson, count, last_at)
+            VALUES (new.user_id, new.chapter, new.lesson, 1, (julianday('now') - 2440587.5) * 86400.0)
+            ON CONFLICT (user_id, chapter, lesson) DO UPDATE SET count = count + 1, last_at = excluded.last_at;
+        END
+        ''',
+    ]),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0] # Version of the newest migration
+
+# Function to bring the database schema up to date, running each missing migration once
+def migrate(conn): # Define the migrate function with the conn parameter
+    version = conn.execute('PRAGMA user_version').fetchone()[0] # Version the database is at
+    if version == SCHEMA_VERSION: # Check if the schema is already current
+        return version # Nothing to do
+    if version > SCHEMA_VERSION: # Check if a newer app version migrated the database
+        print(f"Database schema version {version} is newer than this app's {SCHEMA_VERSION}") # Warn, the known tables still work
+        return version # Leave the newer schema alone
+
+    conn.execute('BEGIN IMMEDIATE') # Take the write lock, so two processes starting together do not both migrate
+    try: # Try block to roll back a failed migration
+        version = conn.execute('PRAGMA user_version').fetchone()[0] # Read the version again under the lock
+        for number, description, statements in MIGRATIONS: # Iterate over the migrations in order
+            if number <= version: # Check if the migration already ran
+                continue
+            for statement in statements: # Iterate over the migration's statements
+                conn.execute(statement) # Run the statement
+            conn.execute(f'PRAGMA user_version = {number}') # Record the migration, in the same transaction
+            print(f"Applied database migration {number}: {description}") # Log the migration
+            version = number # The database is now at this version
+        conn.commit() # Commit every migration at once
+    except sqlite3.Error: # Catch any database errors
+        conn.rollback() # Leave the schema as it was
+        raise # Let the caller report the failure
+    return version # Return the new version
+
+def initialize_database(): # Function to initialize the SQLite database
+    # Connect to the SQLite database (creates the file if it doesn't exist)
+    conn = connect() # The database file is set by DATABASE_PATH
+    migrate(conn) # Create or upgrade the tables, skipped when the schema is already current
 
 # Call the function to initialize the database
 initialize_database()
@@ -0,0 +1,222 @@
+import argparse # Import the argparse module to read the server options
+import json # Import the json module to build batched question responses and server replies
+import os # Import the os module to read environment variables
+import random # Import the random module to vary the stand-in responses
+import re # Import the re module to read the requested question types from a prompt
+import threading # Import the threading module to share the stand-in's random state between threads
+import time # Import the time module to simulate response latency
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer # Import the HTTP server classes to serve the stand-in over localhost
+from types import SimpleNamespace # Import SimpleNamespace to build responses shaped like the OpenAI client's
+from dotenv import load_dotenv # Import the load_dotenv function so the backend settings can come from the .env file
+
+# Load the environment variables
+load_dotenv()
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai").lower() # Which backend answers chat completions: "openai" or "local"
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo") # Model used for every request
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") # Optional API address, for example a local stand-in server
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60")) # Default seconds a single request may take
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "10")) # Connections kept open to the API
+LOCAL_LLM_LATENCY = float(os.getenv("LOCAL_LLM_LATENCY", "0.05")) # Seconds the stand-in waits before answering
+LOCAL_LLM_SEED = int(os.getenv("LOCAL_LLM_SEED", "0")) # Seed that makes the stand-in's answers repeatable
+LOCAL_LLM_PORT = int(os.getenv("LOCAL_LLM_PORT", "8765")) # Port the stand-in server listens on
+
+WORDS = ["list", "tuple", "dictionary", "set", "string", "loop", "function", "variable", "class", "method", "module", # Words the stand-in builds questions from
+         "exception", "generator", "iterator", "decorator", "lambda", "slice", "index", "argument", "scope", "operator",
+         "comprehension", "boolean", "integer", "float", "file", "import", "return", "value", "key", "object",
+         "parameter", "attribute", "instance", "package", "recursion", "condition", "branch", "counter", "buffer", "queue",
+         "stack", "tree", "node", "path", "token", "parser", "thread", "socket", "record", "matrix"]
+
+# Class that sends chat completions to the OpenAI API, or any server speaking the same protocol
+class OpenAIBackend: # Define the OpenAIBackend class
+
+    # Initialize the OpenAIBackend class
+    def __init__(self, api_key=None, model=LLM_MODEL, base_url=LLM_BASE_URL, timeout=LLM_TIMEOUT, pool_size=LLM_POOL_SIZE): # Define the constructor
+        from openai import OpenAI, DefaultHttpxClient, DEFAULT_CONNECTION_LIMITS # Import the OpenAI client here so the local backend works without it
+        limits = type(DEFAULT_CONNECTION_LIMITS)(max_connections=pool_size, max_keepalive_connections=pool_size) # Connection pool limits, built with the client library's own Limits class
+        self.model = model # Model used for every request
+        self.client = OpenAI( # Create the client
+            api_key=api_key or os.getenv("OPENAI_API_KEY") or (base_url and "local"), # A local server accepts any key
+            base_url=base_url, # Use the default API address unless one is given
+            timeout=timeout, # Default request timeout, the gateway passes a shorter one near a deadline
+            max_retries=0, # The gateway handles retries
+            http_client=DefaultHttpxClient(limits=limits), # Reuse connections across requests
+        )
+
+    # Function to close the connection pool
+    def close(self): # Define the close function
+        self.client.close() # Close the client's connections
+
+# Function to build one question item of the requested type, in the batched JSON shape
+def local_question_item(question_type, rng): # Define the local_question_item function with the question_type and rng parameters
+    topic = " ".join(rng.sample(WORDS, 8)) # Random topic that makes up most of the question, so questions pass the duplicate check
+    a, b = rng.sample(WORDS, 2) # Words for the answer
+    if question_type == "multiple_choice": # Check if the question type is 'multiple_choice'
+        return {"type": "multiple_choice", "question": f"Which option fits {topic}?", # Multiple choice item
+                "options": {"A": a, "B": b, "C": f"{a} {b}", "D": f"{b} {a}"}, "correct_answer": rng.choice("ABCD")}
+    if question_type == "true_false": # Check if the question type is 'true_false'
+        return {"type": "true_false", "question": f"{topic.capitalize()}.", "correct_answer": rng.choice(["True", "False"])} # True/false item
+    if question_type == "fill_in_the_blank": # Check if the question type is 'fill_in_the_blank'
+        words = topic.split() # Split the topic around the blank
+        return {"type": "fill_in_the_blank", "question": f"{' '.join(words[:4])} ________ {' '.join(words[4:])}", "correct_answer": a} # Fill in the blank item
+    if question_type == "scenario": # Check if the question type is 'scenario'
+        return {"type": "scenario", "question": f"A program needs {topic}. What should it use?", # Scenario item
+                "correct_answer": f"Use a {a} {b} because it keeps the {topic} easy to manage."}
+    name = "_".join(topic.split()[:3]) # Function name for the code challenge
+    return {"type": "write_code", "question": f"Write {name}(x, y) returning x plus y, for {topic}.", # Code challenge item
+            "correct_answer": f"def {name}(x, y):\n    return x + y", "tests": [f"assert {name}(1, 2) == 3", f"assert {name}(-1, 1) == 0"]}
+
+# Function to write a question item in the plain text format the single-question parsers read
+def local_question_text(item): # Define the local_question_text function with the item parameter
+    if item["type"] == "multiple_choice": # Check if the question type is 'multiple_choice'
+        options = "\n".join(f"{label}) {text}" for label, text in item["options"].items()) # List the options
+        return f"{item['question']}\n\n{options}\n\nCorrect Answer: {item['correct_answer']}" # Multiple choice text
+    if item["type"] in ("true_false", "fill_in_the_blank"): # Check if the question type has a one line answer
+        return f"{item['question']}\n\nCorrect Answer: {item['correct_answer']}" # True/false or fill in the blank text
+    if item["type"] == "scenario": # Check if the question type is 'scenario'
+        return f"Scenario:\n{item['question']}\n\nCorrect Answer:\n{item['correct_answer']}" # Scenario text
+    tests = "\n".join(item["tests"]) # List the test cases
+    return f"{item['question']}\n\n```python\n{item['correct_answer']}\n```\n\n{tests}" # Code challenge text
+
+SINGLE_QUESTION_HEADINGS = { # Heading in each single-question prompt and the type it asks for
+    "### MULTIPLE CHOICE QUESTION": "multiple_choice", # Multiple choice prompt
+    "### TRUE/FALSE QUESTION": "true_false", # True/false prompt
+    "### FILL IN THE BLANK QUESTION": "fill_in_the_blank", # Fill in the blank prompt
+    "### SCENARIO QUESTION": "scenario", # Scenario prompt
+    "### CODE CHALLENGE": "write_code", # Code challenge prompt
+}
+
+# Function to yield a reply in chunks shaped like the OpenAI client's stream, ending with the usage chunk when given
+def stream_chunks(content, usage=None): # Define the stream_chunks function with the content and usage parameters
+    for start in range(0, len(content), 40): # Iterate over the reply in 40 character pieces
+        delta = SimpleNamespace(content=content[start:start + 40]) # The new text
+        yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)], usage=None) # Yield the chunk
+    if usage is not None: # Check if the caller asked for usage
+        yield SimpleNamespace(choices=[], usage=usage) # Yield the usage chunk
+
+# Class that answers chat completions locally with well-formed templated responses, for load tests and offline benchmarks
+class LocalBackend: # Define the LocalBackend class
+
+    # Initialize the LocalBackend class
+    def __init__(self, model="local-stand-in", latency=LOCAL_LLM_LATENCY, seed=LOCAL_LLM_SEED): # Define the constructor with the model, latency, and seed parameters
+        self.model = model # Model name reported in responses and telemetry
+        self.latency = latency # Seconds to wait before answering
+        self.rng = random.Random(seed) # Random state that makes the answers repeatable
+        self.lock = threading.Lock() # Lock to share the random state between threads
+        self.client = SimpleNamespace(chat=SimpleNamespace(completions=self)) # Expose the same client.chat.completions.create path as the OpenAI client
+
+    # Function to write the reply to a prompt
+    def reply(self, messages): # Define the reply function with the messages parameter
+        prompt = messages[-1]["content"] if messages else "" # The user message
+        with self.lock: # Guard the random state
+            if "Respond with only a JSON array" in prompt: # Check if the prompt asks for a batch of questions
+                match = re.search(r"Question types, in order: (.+)", prompt) # Read the requested types
+                question_types = [name.strip() for name in match.group(1).split(",")] if match else ["true_false"] # List the types
+                return json.dumps([local_question_item(question_type, self.rng) for question_type in question_types]) # Return one item per type as a JSON array
+
+            if "Start your response with 'Correct' or 'Incorrect'" in prompt: # Check if the prompt asks for a verdict
+                if "Failed Test:" in prompt or "No code provided." in prompt or "No response provided." in prompt: # Check if the answer is missing or failed its tests
+                    return "Incorrect. Re-read the task and check your answer against the expected result." # Return a failing verdict
+                return "Correct. Your answer covers the key point of the question." # Return a passing verdict
+
+            if prompt.startswith("Condense the lesson below"): # Check if the prompt asks for a lesson digest
+                lesson_text = prompt.split("\n\n", 1)[-1].strip('"') # The lesson being condensed
+                sentences = [paragraph.split(". ")[0].strip().rstrip(".") for paragraph in lesson_text.split("\n\n") if paragraph.strip()] # First sentence of each paragraph
+                return "\n".join(f"- {sentence}." for sentence in sentences) # Return one bullet per paragraph
+
+            for heading, question_type in SINGLE_QUESTION_HEADINGS.items(): # Iterate over the single-question headings
+                if heading in prompt: # Check if the prompt asks for this type
+                    return local_question_text(local_question_item(question_type, self.rng)) # Return the question text
+
+        lesson = re.search(r"Lesson: (.+)", prompt) # Read the lesson title
+        topic = lesson.group(1).strip() if lesson else "this topic" # Topic of the lesson
+        return ( # Return a three paragraph lesson
+            f"This lesson covers {topic}. It explains the idea, shows where it fits in a Python program, and when to reach for it.\n\n"
+            f"For example, a short script can put {topic} to work so each step of the program is easy to follow.\n\n"
+            f"Key points to remember: practise {topic} with small examples, read error messages carefully, and keep your code simple."
+        )
+
+    # Function to answer a chat completion the way the OpenAI client does
+    def create(self, model=None, messages=None, max_tokens=None, stream=False, stream_options=None, timeout=None, **kwargs): # Define the create function
+        if self.latency: # Check if the stand-in should simulate latency
+            time.sleep(self.latency) # Wait before answering
+        content = self.reply(messages or []) # Write the reply
+        prompt_tokens = sum(len(message.get("content") or "") for message in messages or []) // 4 # Prompt tokens, counted as four characters per token
+        completion_tokens = len(content) // 4 # Completion tokens, counted the same way
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, total_tokens=prompt_tokens + completion_tokens) # Token usage
+        if stream: # Check if the caller wants the reply in chunks
+            return stream_chunks(content, usage if stream_options and stream_options.get("include_usage") else None) # Return the chunks
+        message = SimpleNamespace(role="assistant", content=content) # The reply message
+        return SimpleNamespace(model=model or self.model, choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")], usage=usage) # Return the response
+
+    # Function to match the OpenAI backend interface
+    def close(self): # Define the close function
+        pass # Nothing to close
+
+# Function to create the backend chosen by the configuration
+def create_backend(name=LLM_BACKEND): # Define the create_backend function with the name parameter
+    if name == "local": # Check if the local stand-in was chosen
+        return LocalBackend() # Answer locally
+    if name == "openai": # Check if the OpenAI API was chosen
+        return OpenAIBackend() # Answer with the OpenAI API or a compatible server
+    raise ValueError(f"Unknown LLM backend: {name}") # Raise a ValueError for unknown backends
+
+# Function to turn a stand-in response object into plain JSON data
+def to_json(value): # Define the to_json function with the value parameter
+    if isinstance(value, SimpleNamespace): # Check if the value is a response object
+        return {key: to_json(item) for key, item in vars(value).items()} # Convert each field
+    if isinstance(value, list): # Check if the value is a list
+        return [to_json(item) for item in value] # Convert each item
+    return value # Return plain values unchanged
+
+# Function to serve the stand-in over localhost so the real OpenAI client can be pointed at it with LLM_BASE_URL
+def serve_local(backend, host="127.0.0.1", port=LOCAL_LLM_PORT): # Define the serve_local function with the backend, host, and port parameters
+
+    # Class to answer chat completion requests
+    class Handler(BaseHTTPRequestHandler): # Define the Handler class
+        protocol_version = "HTTP/1.1" # Keep connections open so the client's pool is exercised
+
+        # Function to answer a POST request
+        def do_POST(self): # Define the do_POST function
+            if not self.path.rstrip("/").endswith("/chat/completions"): # Check if the path is the chat completions endpoint
+                self.send_error(404) # Only chat completions are served
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}") # Read the request body
+            created = int(time.time()) # Timestamp for the response
+            response = backend.create(**request) # Answer the request
+            if not request.get("stream"): # Check if the client wants one response
+                body = json.dumps({"id": f"local-{created}", "object": "chat.completion", "created": created, **to_json(response)}).encode() # Encode the response
+                self.send_response(200) # Send the status
+                self.send_header("Content-Type", "application/json") # Send the content type
+                self.send_header("Content-Length", str(len(body))) # Send the length
+                self.end_headers() # Finish the headers
+                self.wfile.write(body) # Send the response
+                return
+
+            self.send_response(200) # Send the status
+            self.send_header("Content-Type", "text/event-stream") # Stream server-sent events
+            self.send_header("Connection", "close") # The stream ends when the connection closes
+            self.end_headers() # Finish the headers
+            for chunk in response: # Iterate over the chunks
+                data = {"id": f"local-{created}", "object": "chat.completion.chunk", "created": created, "model": backend.model, **to_json(chunk)} # Describe the chunk
+                self.wfile.write(f"data: {json.dumps(data)}\n\n".encode()) # Send the chunk
+            self.wfile.write(b"data: [DONE]\n\n") # Mark the end of the stream
+            self.close_connection = True # Close the connection to end the stream
+
+        # Function to keep the server quiet
+        def log_message(self, format, *args): # Define the log_message function
+            pass # Do not log every request
+
+    server = ThreadingHTTPServer((host, port), Handler) # Create the server
+    print(f"Local LLM stand-in serving {backend.model} at http://{host}:{server.server_port}/v1") # Log the address
+    server.serve_forever() # Answer requests until interrupted
+
+# Main entry point
+if __name__ == "__main__": # Check if the script is being run directly
+    parser = argparse.ArgumentParser(description="Serve the local LLM stand-in over HTTP.") # Create the argument parser
+    parser.add_argument("--port", type=int, default=LOCAL_LLM_PORT, help="Port to listen on.") # Port
+    parser.add_argument("--latency", type=float, default=LOCAL_LLM_LATENCY, help="Seconds to wait before each answer.") # Latency
+    parser.add_argument("--seed", type=int, default=LOCAL_LLM_SEED, help="Seed for repeatable answers.") # Seed
+    args = parser.parse_args() # Parse the command line
+
+    serve_local(LocalBackend(latency=args.latency, seed=args.seed), port=args.port) # Serve the stand-in
@@ -0,0 +1,175 @@
+import os # Import the os module to read environment variables
+import random # Import the random module to add jitter to the backoff
+import threading # Import the threading module to share the limits between threads
+import time # Import the time module for rate limits, backoff, and deadlines
+
+REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "60")) # Requests allowed per minute
+TOKENS_PER_MINUTE = float(os.getenv("OPENAI_TOKENS_PER_MINUTE", "90000")) # Prompt and completion tokens allowed per minute
+REQUEST_DEADLINE = float(os.getenv("OPENAI_REQUEST_DEADLINE", "60")) # Seconds a call may take, including its retries
+REQUEST_RETRIES = int(os.getenv("OPENAI_REQUEST_RETRIES", "3")) # Retries after the first attempt
+BACKOFF_BASE = 0.5 # Seconds before the first retry
+BACKOFF_MAX = 20.0 # Longest wait between retries
+CIRCUIT_FAILURES = int(os.getenv("OPENAI_CIRCUIT_FAILURES", "5")) # Consecutive failures that open the circuit
+CIRCUIT_COOLDOWN = float(os.getenv("OPENAI_CIRCUIT_COOLDOWN", "30")) # Seconds the circuit stays open before a trial call
+
+try: # Try block so the local backend and replayed cassettes work without the OpenAI client installed
+    import openai # Import the openai module to recognise which errors are worth retrying
+    RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError) # Errors that may succeed on a later attempt
+except ImportError: # The OpenAI client is not installed
+    RETRYABLE_ERRORS = () # Nothing to retry, an empty tuple catches no errors
+
+# Exception raised when a call cannot finish before its deadline
+class DeadlineExceeded(Exception): # Define the DeadlineExceeded class
+    pass
+
+# Exception raised when calls are refused because the API keeps failing
+class CircuitOpenError(Exception): # Define the CircuitOpenError class
+    pass
+
+# Class to limit how fast something is spent, refilling continuously up to a capacity
+class TokenBucket: # Define the TokenBucket class
+
+    # Initialize the TokenBucket class
+    def __init__(self, per_minute): # Define the constructor with the per_minute parameter
+        self.capacity = max(1.0, per_minute) # Most that can be spent in a burst
+        self.rate = self.capacity / 60.0 # Refill per second
+        self.available = self.capacity # Start full
+        self.updated = time.monotonic() # Last refill time
+        self.lock = threading.Lock() # Lock to keep the bucket consistent across threads
+
+    # Function to take from the bucket, waiting for it to refill until the deadline
+    def acquire(self, amount, deadline): # Define the acquire function with the amount and deadline parameters
+        amount = min(amount, self.capacity) # A single call larger than the bucket waits for a full bucket
+        while True: # Loop until the amount is available
+            with self.lock: # Guard the bucket
+                now = time.monotonic() # Current time
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate) # Refill for the time passed
+                self.updated = now # Remember the refill time
+                if self.available >= amount: # Check if there is enough
+                    self.available -= amount # Spend it
+                    return # Let the call go ahead
+                wait = (amount - self.available) / self.rate # Seconds until there is enough
+            if now + wait > deadline: # Check if the wait would run past the deadline
+                raise DeadlineExceeded("Rate limit wait would exceed the request deadline.") # Give up now rather than later
+            time.sleep(wait) # Wait for the bucket to refill
+
+# Class to stop calling the API for a while after repeated failures
+class CircuitBreaker: # Define the CircuitBreaker class
+
+    # Initialize the CircuitBreaker class
+    def __init__(self, failure_limit=CIRCUIT_FAILURES, cooldown=CIRCUIT_COOLDOWN): # Define the constructor with the failure_limit and cooldown parameters
+        self.failure_limit = max(1, failure_limit) # Consecutive failures that open the circuit
+        self.cooldown = cooldown # Seconds the circuit stays open
+        self.failures = 0 # Consecutive failures so far
+        self.opened_at = None # When the circuit opened, None while closed
+        self.trial_running = False # True while a trial call tests a half-open circuit
+        self.lock = threading.Lock() # Lock to keep the state consistent across threads
+
+    # Function to check if a call may go ahead, raising CircuitOpenError if not
+    def before_call(self): # Define the before_call function
+        with self.lock: # Guard the state
+            if self.opened_at is None: # Check if the circuit is closed
+                return # Calls go ahead
+            if time.monotonic() - self.opened_at < self.cooldown or self.trial_running: # Check if the circuit is open or already being tested
+                raise CircuitOpenError("The API is failing repeatedly, try again shortly.") # Fail fast
+            self.trial_running = True # Let this one call test the API
+
+    # Function to record a successful call
+    def record_success(self): # Define the record_success function
+        with self.lock: # Guard the state
+            self.failures = 0 # Reset the failure count
+            self.opened_at = None # Close the circuit
+            self.trial_running = False # The trial is over
+
+    # Function to end a trial call that neither proved nor disproved the API is working
+    def release_trial(self): # Define the release_trial function
+        with self.lock: # Guard the state
+            self.trial_running = False # Let the next call test the API
+
+    # Function to record a failed call
+    def record_failure(self): # Define the record_failure function
+        with self.lock: # Guard the state
+            self.failures += 1 # Count the failure
+            if self.trial_running or self.failures >= self.failure_limit: # Check if the trial failed or too many calls failed
+                self.opened_at = time.monotonic() # Open the circuit again
+            self.trial_running = False # The trial is over
+
+# Function to read how long the API asked us to wait, if it said
+def retry_after(error): # Define the retry_after function with the error parameter
+    response = getattr(error, "response", None) # The HTTP response attached to the error
+    headers = getattr(response, "headers", None) or {} # Its headers
+    try: # Try block to handle exceptions
+        return float(headers.get("retry-after")) # Seconds to wait
+    except (TypeError, ValueError): # Missing or given as a date
+        return None # No hint from the API
+
+# Class that every chat completion goes through, applying rate limits, retries, deadlines, and the circuit breaker
+class RequestGateway: # Define the RequestGateway class
+
+    # Initialize the RequestGateway class
+    def __init__(self, client, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE): # Define the constructor
+        self.client = client # Client that sends the requests
+        self.request_bucket = TokenBucket(requests_per_minute) # Requests per minute limit
+        self.token_bucket = TokenBucket(tokens_per_minute) # Tokens per minute limit
+        self.breaker = CircuitBreaker() # Circuit breaker shared by every call
+
+    # Function to estimate the tokens a call will use before sending it
+    def estimate_tokens(self, messages, max_tokens): # Define the estimate_tokens function with the messages and max_tokens parameters
+        prompt_characters = sum(len(message.get("content") or "") for message in messages) # Characters in the prompt
+        return prompt_characters // 4 + (max_tokens or 0) # Roughly four characters per token, plus the completion allowance
+
+    # Function to send a chat completion, filling in the call record if one is given
+    def create(self, max_retries=REQUEST_RETRIES, deadline=REQUEST_DEADLINE, call=None, **kwargs): # Define the create function with the max_retries, deadline, call, and request parameters
+        started = time.monotonic() # Time the whole call, including retries
+        if call is not None: # Check if the caller is recording the call
+            call.model = kwargs.get("model") # Record the model
+        try: # Try block to handle exceptions
+            response = self.send(max_retries, deadline, call, **kwargs) # Send the request
+        except Exception as e: # Catch any exceptions
+            if call is not None: # Check if the caller is recording the call
+                call.error = f"{type(e).__name__}: {e}" # Record the error
+            raise # Report the error
+        finally: # Always time the call
+            if call is not None: # Check if the caller is recording the call
+                call.latency = time.monotonic() - started # Record the latency
+        if call is not None and not kwargs.get("stream"): # Streamed usage arrives with the last chunk, so the caller records it
+            call.set_usage(getattr(response, "usage", None)) # Record the token usage
+        return response # Return the response
+
+    # Function to send a chat completion, retrying failures with backoff until the deadline
+    def send(self, max_retries, deadline, call, **kwargs): # Define the send function with the max_retries, deadline, call, and request parameters
+        expires = time.monotonic() + deadline # Time by which the call must finish
+        estimate = self.estimate_tokens(kwargs.get("messages", []), kwargs.get("max_tokens")) # Tokens the call will use
+
+        attempt = 0 # Attempts made so far
+        while True: # Loop until the call succeeds or gives up
+            self.request_bucket.acquire(1, expires) # Wait for the requests per minute limit
+            self.token_bucket.acquire(estimate, expires) # Wait for the tokens per minute limit
+            self.breaker.before_call() # Fail fast while the circuit is open
+
+            remaining = expires - time.monotonic() # Time left for this attempt
+            try: # Try block to handle exceptions
+                response = self.client.chat.completions.create(timeout=remaining, **kwargs) # Send the request with the time left
+                self.breaker.record_success() # The API is working
+                return response # Return the response
+
+            except RETRYABLE_ERRORS as e: # Catch errors that may succeed on a later attempt
+                self.breaker.record_failure() # Count the failure
+                attempt += 1 # Count the attempt
+                if call is not None: # Check if the caller is recording the call
+                    call.retries = min(attempt, max_retries) # Record the retries made
+                if attempt > max_retries: # Check if there are no retries left
+                    raise # Report the last error
+
+                wait = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)) # Exponential backoff with full jitter
+                hint = retry_after(e) # How long the API asked us to wait
+                if hint is not None: # Check if the API gave a hint
+                    wait = max(wait, hint) # Never retry sooner than asked
+                if time.monotonic() + wait >= expires: # Check if the retry would start after the deadline
+                    raise DeadlineExceeded(f"Request deadline reached after {attempt} attempts: {e}") from e # Give up
+                print(f"API call failed ({type(e).__name__}), retrying in {wait:.1f}s") # Log the retry
+                time.sleep(wait) # Wait before retrying
+
+            except Exception: # Catch errors a retry will not fix, such as a bad request
+                self.breaker.release_trial() # Say nothing about the API's health, but let another call test it
+                raise # Report the error
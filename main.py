@@ -1,8 +1,10 @@
 from colorama import Fore, init # Import the Fore and init functions from colorama to change text color
 import sqlite3 # Import the sqlite3 module to work with SQLite databases
+import repository # Import the repository module for the user, mistake, and certificate queries
+from write_behind import write_buffer # Import the shared write buffer to batch mistake and progress writes
 import bcrypt # Import the bcrypt module for password hashing
 from config import chapters # Import the chapters dictionary from config.py to access the lesson content
-from questions import validate_answer_with_gpt, generate_lesson_content, generate_questions_from_content, generate_review_questions, generate_cumulative_review # Import functions from questions.py to generate questions, reviews, lesson content, and validate answers for code and scenario questions.
+from questions import validate_answer_with_gpt, generate_lesson_content, generate_lesson_content_stream, iter_lesson_parts, generate_questions_from_content, generate_review_questions, generate_cumulative_review # Import functions from questions.py to generate questions, reviews, lesson content, and validate answers for code and scenario questions.
 from fuzzywuzzy import fuzz # Import the fuzz function from fuzzywuzzy to compare strings
 import subprocess # Import the subprocess module to run the user's code
 import sys # Import the sys module to access system-specific parameters and functions
@@ -29,6 +31,11 @@ from reportlab.pdfgen import canvas # Import the canvas class from report
 from PIL import Image # Import the Image class from the PIL module to work with images
 import datetime # Import the datetime module to work with dates and times
 from plyer import filechooser # Import the filechooser module from plyer to access file selection dialogs
+from prefetch import LessonPrefetcher # Import the LessonPrefetcher class to build the next lesson in the background
+from code_grader import run_tests # Import the test harness to grade code answers locally
+from pregrader import pregrader # Import the pre-grader to settle obvious scenario answers without GPT
+from verdict_cache import verdict_cache # Import the verdict cache to report its counters
+from tasks import task_runner # Import the shared task runner to keep generation and validation off the UI thread
 
 #Run the user's code and capture output or errors
 def run_user_code(code): # Define the run_user_code function
@@ -59,49 +66,100 @@ class UserProgress: # Define the UserProgress class
         
     # Add a mistake to the lesson
     def add_mistake(self, chapter, lesson, question, user_answer, correct_answer, feedback=None, user_code=None, user_output=None, user_errors=None, original_lesson=None): # Define the add_mistake function
-        try: # Try to add the mistake to the database
-            with sqlite3.connect('progress.db') as conn: # Connect to the database
-                cursor = conn.cursor() # Create a cursor object
-                cursor.execute( # Execute an SQL query
-                    '''
-                    INSERT INTO mistakes (user_id, chapter, lesson, question, user_answer, correct_answer, feedback, user_code, user_output, user_errors, original_lesson)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''',
-                    (self.user_id, chapter, lesson, question, user_answer, correct_answer, feedback, user_code, user_output, user_errors, original_lesson) # Pass the parameters
-                )
-                conn.commit() # Commit the transaction
-        except sqlite3.Error as e: # Handle database errors
-            print(f"Failed to add mistake: {e}") # Print an error message
+        write_buffer.add_mistake( # Buffer the mistake, it is written with the next flush
+            self.user_id, chapter, lesson, question, user_answer, correct_answer, feedback, user_code, user_output, user_errors, original_lesson # Pass the parameters
+        )
 
     # save the user's progress       
     def save_progress(self): # Define the save_progress function
-        try: # Try to save the user's progress to the database
-            with sqlite3.connect('progress.db') as conn: # Connect to the database
-                cursor = conn.cursor() # Create a cursor object
-                cursor.execute( # Execute an SQL query
-                    'UPDATE users SET chapter = ?, lesson = ? WHERE id = ?',
-                    (self.chapter, self.lesson, self.user_id) # Pass the chapter, lesson, and user ID as parameters
-                )
-                conn.commit() # Commit the transaction
-        except sqlite3.Error as e: # Handle database errors
-            print(f"Failed to save progress: {e}") # Print an error message
+        write_buffer.save_progress(self.user_id, self.chapter, self.lesson) # Buffer the progress, it is written with the next flush
     def load_progress(self): # Define the load_progress function
+        pending = write_buffer.pending_progress(self.user_id) # Progress saved but not yet flushed
+        if pending: # Check if the buffered progress is newer than the database
+            self.chapter, self.lesson = pending # Use the buffered progress
+            return # No need to read the database
         try: # Try to load the user's progress from the database
-            with sqlite3.connect('progress.db') as conn: # Connect to the database
-                cursor = conn.cursor() # Create a cursor object
-                cursor.execute( # Execute an SQL query
-                    'SELECT chapter, lesson FROM users WHERE id = ?', 
-                    (self.user_id,) # Pass the user ID as a parameter
-                )
-                row = cursor.fetchone() # Fetch the first row from the result set
-                if row: # Check if the row exists
-                    self.chapter, self.lesson = row # Unpack the row
-                    print(f"Loaded progress: Chapter {self.chapter}, Lesson {self.lesson} for User ID {self.user_id}") # Debugging line
-                else: # Handle no progress found
-                    print(f"No progress found for User ID {self.user_id}, starting at default values.") # Debugging line
+            user = repository.get_user(self.user_id) # Look up the user
+            if user: # Check if the user exists
+                self.chapter, self.lesson = user.chapter, user.lesson # Take the saved position
+                print(f"Loaded progress: Chapter {self.chapter}, Lesson {self.lesson} for User ID {self.user_id}") # Debugging line
+            else: # Handle no progress found
+                print(f"No progress found for User ID {self.user_id}, starting at default values.") # Debugging line
         except sqlite3.Error as e: # Handle database errors
             print(f"Failed to load progress: {e}") # Print an error message
     
+# Function to generate a lesson's content and questions, used by the lesson screen and the prefetcher
+def build_lesson(user_id, chapter, lesson): # Define the build_lesson function
+    progress = UserProgress(user_id=user_id) # Initialize UserProgress
+    lesson_content = generate_lesson_content(progress, chapter, lesson) # Generate lesson content
+
+    question_count = chapters[chapter]['lessons'][lesson].get('question_count') # Get question count
+    if not question_count: # Check if question count is not specified
+        print("Error: No question count specified for this lesson.") # Print an error message
+        return lesson_content, [] # Return the content without questions
+    return lesson_content, generate_questions_from_content(chapter, lesson, lesson_content, question_count, user_id=user_id) # Generate questions
+
+# Function to find the lesson that follows a lesson in the same chapter
+def get_next_lesson(chapter, lesson): # Define the get_next_lesson function
+    next_lesson = lesson + 1 # The next lesson number
+    if next_lesson == 8 or next_lesson not in chapters[chapter]['lessons']: # Check if the next lesson is the review or does not exist
+        return None # Reviews are not prefetched
+    return chapter, next_lesson # Return the next lesson
+
+# Function to prepare a lesson on a worker thread, reporting each paragraph and returning the questions
+def prepare_lesson(user_id, chapter, lesson, progress_callback): # Define the prepare_lesson function
+    write_buffer.flush() # Write buffered mistakes first, so the delete below clears them too
+    try: # Try to clear the user's previous mistakes
+        repository.delete_mistakes_for_lesson(user_id, chapter, lesson) # Delete the lesson's mistakes
+        print("Cleared previous mistakes for the current lesson.") # Debugging line
+    except sqlite3.Error as e: # Handle database errors
+        print(f"Failed to clear previous mistakes: {e}") # Debugging line
+
+    prefetched = lesson_prefetcher.take(user_id, chapter, lesson) # Use the prefetched lesson if it is ready
+    if prefetched: # Check if the lesson was prefetched
+        lesson_content, questions = prefetched # Unpack the prefetched lesson
+        print(f"Using prefetched lesson for Chapter {chapter}, Lesson {lesson}") # Debugging statement
+        for part in lesson_content.split("\n\n"): # Iterate over the lesson parts
+            if part.strip(): # Skip empty parts
+                progress_callback(part.strip()) # Show the part
+        progress_callback(None) # Every part has arrived
+        return questions # Return the prefetched questions
+
+    # Stream the lesson so the first paragraph shows as soon as it arrives
+    progress = UserProgress(user_id=user_id) # Initialize UserProgress
+    chunks = [] # Collect the full lesson text for question generation
+
+    # Function to keep a copy of each chunk while passing it on to the paragraph splitter
+    def collect(stream): # Define the collect function
+        for chunk in stream: # Iterate over the streamed chunks
+            chunks.append(chunk) # Keep the chunk
+            yield chunk # Pass the chunk on
+
+    for part in iter_lesson_parts(collect(generate_lesson_content_stream(progress, chapter, lesson))): # Iterate over each completed paragraph
+        progress_callback(part) # Show the paragraph
+    progress_callback(None) # Every part has arrived
+
+    lesson_content = "".join(chunks) # Join the full lesson text
+    question_count = chapters[chapter]['lessons'][lesson].get('question_count') # Get question count
+    if not question_count: # Check if question count is not specified
+        print("Error: No question count specified for this lesson.") # Print an error message
+        return [] # Ensure questions list is initialized even if empty
+    questions = generate_questions_from_content(chapter, lesson, lesson_content, question_count, user_id=user_id) # Generate questions
+    print(f"Generated Questions: {questions}") # Debugging statement
+    return questions # Return the generated questions
+
+# Function to generate a chapter review, run on a worker thread
+def build_chapter_review(user_id, chapter): # Define the build_chapter_review function
+    progress = UserProgress(user_id) # Create a UserProgress instance
+    return generate_review_questions(progress, chapter) # Generate review questions
+
+# Function to generate the cumulative review, run on a worker thread
+def build_cumulative_review(user_id, progress_callback, cancel_event): # Define the build_cumulative_review function
+    progress = UserProgress(user_id) # Create a UserProgress instance
+    return generate_cumulative_review(progress, progress_callback=progress_callback, cancel_event=cancel_event) # Use cumulative review logic
+
+lesson_prefetcher = LessonPrefetcher(build_lesson) # Build the next lesson in the background while the user reads
+
 #class to handle the login screen
 class LoginScreen(Screen): # Define the LoginScreen class
     
@@ -128,15 +186,12 @@ class LoginScreen(Screen): # Define the LoginScreen class
     # Function to handle the login process
     def login_user(self, email, password): # Define the login_user function
         try: # Try to authenticate the user
-            with sqlite3.connect('progress.db') as conn: # Connect to the database
-                cursor = conn.cursor() # Create a cursor object
-                cursor.execute('SELECT * FROM users WHERE email = ?', (email,)) # Execute an SQL query
-                user = cursor.fetchone() # Fetch the first row from the result set
-            if user and user[3] and bcrypt.checkpw(password.encode(), user[3].encode() if isinstance(user[3], str) else user[3]): # Check if the user exists and the password matches
-                App.get_running_app().user_id = user[0]
+            user = repository.get_user_by_email(email) # Look up the user
+            if user and user.password and bcrypt.checkpw(password.encode(), user.password.encode() if isinstance(user.password, str) else user.password): # Check if the user exists and the password matches
+                App.get_running_app().user_id = user.id
                 # Pass user_id to MainScreen
                 main_screen = self.manager.get_screen('main')
-                main_screen.user_id = user[0]  # Assuming user[0] is the user_id
+                main_screen.user_id = user.id
                 self.manager.current = "main"  # Navigate to the main screen
                 return user
             else:
@@ -149,14 +204,8 @@ class LoginScreen(Screen): # Define the LoginScreen class
     def register_user(self, name, email, password):
         hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
         try:
-            with sqlite3.connect('progress.db') as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    'INSERT INTO users (name, email, password) VALUES (?, ?, ?)',
-                    (name, email, hashed_password)
-                )
-                conn.commit()
-                self.ids.message_label.text = "Registration successful! Please login."
+            repository.create_user(name, email, hashed_password)
+            self.ids.message_label.text = "Registration successful! Please login."
         except sqlite3.IntegrityError:
             self.ids.message_label.text = "Error: A user with that email already exists."
 
@@ -176,17 +225,13 @@ class MainScreen(Screen): # Define the MainScreen class
                 print("Error: user_id is not set.") 
                 return # Exit the function
 
-            with sqlite3.connect('progress.db') as conn: # Connect to the database
-                cursor = conn.cursor() # Create a cursor object
-                # Corrected SQL query to fetch the user by the `id` column, not `user_id`
-                cursor.execute('SELECT id, name, chapter, lesson FROM users WHERE id = ?', (self.user_id,)) # Execute an SQL query
-                result = cursor.fetchone() # Fetch the first row from the result set
-                if result: # Check if a result is found
-                    self.user_id, self.user_name, chapter, lesson = result
-                    print(f"User found: ID={self.user_id}, Name={self.user_name}, Chapter={chapter}, Lesson={lesson}")
-                else: # Handle case where user is not found 
-                    self.user_name = "Default User" # Set a default user name
-                    print("User not found. Setting default name.")
+            user = repository.get_user(self.user_id) # Look up the user
+            if user: # Check if a result is found
+                self.user_name = user.name # Set the user name
+                print(f"User found: ID={user.id}, Name={user.name}, Chapter={user.chapter}, Lesson={user.lesson}")
+            else: # Handle case where user is not found 
+                self.user_name = "Default User" # Set a default user name
+                print("User not found. Setting default name.")
 
         except sqlite3.Error as e: # Handle database errors
             print(f"Database error while fetching user data: {e}") # Print an error message
@@ -334,46 +379,77 @@ class LessonScreen(Screen): # Define the LessonScreen class
         self.current_part = 0  # Initialize current part index
         self.chapter = None  # Initialize chapter attribute
         self.lesson = None  # Initialize lesson attribute
+        self.questions = []  # Initialize an empty list for the lesson questions
+        self.lesson_task = None  # Background task preparing the lesson
+        self.streaming = False  # True while lesson parts are still arriving
+        self.questions_ready = True  # False while the lesson questions are being generated
+        self.waiting_for_questions = False  # True when the user finished reading before the questions were ready
     
     # Function to load the lesson content
     def load_lesson(self, user_id, chapter, lesson): # Define the load_lesson function
         print(f"Loading lesson for User ID: {user_id}, Chapter: {chapter}, Lesson: {lesson}") # Debugging
         self.chapter = chapter  # Store the chapter value
         self.lesson = lesson  # Store the lesson value
-        try: # Try to clear the user's previous mistakes
-            with sqlite3.connect('progress.db') as conn: # Connect to the database
-                cursor = conn.cursor() # Create a cursor object
-                cursor.execute( # Execute an SQL query
-                    '''
-                    DELETE FROM mistakes WHERE user_id = ? AND chapter = ? AND lesson = ? 
-                    ''',
-                    (user_id, chapter, lesson) # Pass the user ID, chapter, and lesson as parameters
-                )
-                conn.commit() # Commit the transaction
-            print("Cleared previous mistakes for the current lesson.") # Debugging line
-        except sqlite3.Error as e: # Handle database errors
-            print(f"Failed to clear previous mistakes: {e}") # Debugging line
-
-        progress = UserProgress(user_id=user_id) # Initialize UserProgress
-        lesson_content = generate_lesson_content(progress, chapter, lesson) # Generate lesson content
-        print(f"Generated Lesson Content:\n{lesson_content}") # Debugging statement
+        if self.lesson_task: # Check if an earlier load is still running
+            self.lesson_task.cancel() # Drop its results
+        lesson_prefetcher.cancel(keep=(user_id, chapter, lesson)) # Stop prefetching lessons the user did not open
 
-        self.lesson_parts = [part.strip() for part in lesson_content.split("\n\n") if part.strip()] # Split the lesson parts
+        self.lesson_parts = [] # Parts are added as they arrive
         self.current_part = 0   # Reset current part index
-        if self.lesson_parts:
-            self.ids.lesson_content.text = self.lesson_parts[self.current_part] # Display the first part
-        else:
-            self.ids.lesson_content.text = "No content available." # Error Handling/Debugging line
-
-        # Generate questions from lesson content
-        question_count = chapters[chapter]['lessons'][lesson].get('question_count') # Get question count
-        if not question_count: # Check if question count is not specified
-            print("Error: No question count specified for this lesson.") # Print an error message
-            self.questions = []  # Ensure questions list is initialized even if empty
-        else: # Generate questions
-            self.questions = generate_questions_from_content(chapter, lesson, lesson_content, question_count) # Generate questions
-            print(f"Generated Questions: {self.questions}") # Debugging statement
-    
+        self.questions = [] # Questions are generated after the full lesson arrives
+        self.streaming = True # Parts are still arriving
+        self.questions_ready = False # Questions are not generated yet
+        self.waiting_for_questions = False # Reset the waiting flag
+        self.ids.lesson_content.text = "Loading lesson..." # Show a placeholder until the first paragraph arrives
+        self.update_navigation_buttons() # Update the navigation buttons
+
+        self.lesson_task = task_runner.submit( # Prepare the lesson on a worker thread so the UI stays responsive
+            prepare_lesson, user_id, chapter, lesson, # Pass the user, chapter, and lesson
+            on_progress=self.add_lesson_part, # Show each paragraph as it arrives
+            on_result=lambda questions: self.set_lesson_questions(user_id, questions), # Store the questions once they are ready
+            on_error=self.show_lesson_error # Show a message if the lesson could not be prepared
+        )
+
+    # Function to show a newly arrived lesson part, or finish the lesson when the part is None
+    def add_lesson_part(self, part): # Define the add_lesson_part function
+        if part is None: # Check if every part has arrived
+            self.streaming = False # No more parts will arrive
+            if not self.lesson_parts: # Check if nothing arrived
+                self.ids.lesson_content.text = "No content available." # Error Handling/Debugging line
+            return # Exit the function
+        self.lesson_parts.append(part) # Add the part to the lesson
+        if len(self.lesson_parts) == 1: # Check if this is the first part
+            self.update_lesson_display() # Display the first part straight away
+
+    # Function to store the generated lesson questions
+    def set_lesson_questions(self, user_id, questions): # Define the set_lesson_questions function
+        self.questions = questions # Store the questions
+        self.questions_ready = True # The questions are ready
+
+        # Start building the next lesson while the user reads this one
+        next_lesson = get_next_lesson(self.chapter, self.lesson) # Find the next lesson
+        if next_lesson: # Check if there is a lesson to prefetch
+            lesson_prefetcher.prefetch(user_id, *next_lesson) # Prefetch the next lesson
+
+        if self.waiting_for_questions: # Check if the user is waiting to start the questions
+            self.waiting_for_questions = False # Clear the waiting flag
+            self.next_lesson_part() # Move on to the questions
+
+    # Function to show a message when the lesson could not be prepared
+    def show_lesson_error(self, error): # Define the show_lesson_error function
+        self.streaming = False # No more parts will arrive
+        self.questions_ready = True # Let the user continue without questions
+        if not self.lesson_parts: # Check if nothing was shown yet
+            self.ids.lesson_content.text = "Unable to load this lesson. Please try again." # Show the error message
+
+    # Function that runs when the user leaves the lesson screen
+    def on_leave(self): # Define the on_leave function
+        if self.manager.current != "questions": # Check if the user went somewhere other than this lesson's questions
+            lesson_prefetcher.cancel() # Stop prefetching the next lesson
+            if self.lesson_task: # Check if the lesson is still loading
+                self.lesson_task.cancel() # Ignore any parts or questions still arriving for the lesson the user left
+            self.waiting_for_questions = False # Do not jump to the questions later
+
     # Function to store questions for transition
     def store_questions_for_transition(self, questions, chapter, lesson): # define the store_questions_for_transition function
         question_screen = self.manager.get_screen("questions")  # Get the QuestionScreen instance
@@ -392,6 +468,11 @@ class LessonScreen(Screen): # Define the LessonScreen class
         if self.current_part < len(self.lesson_parts) - 1: # Check if not at the end
             self.current_part += 1 # Move to the next part
             self.update_lesson_display() # Update the lesson display
+        elif self.streaming: # Check if more parts are still arriving
+            return # Wait for the next part
+        elif not self.questions_ready: # Check if the questions are still being generated
+            self.waiting_for_questions = True # Move on as soon as they are ready
+            return # Wait for the questions
         else:
             self.store_questions_for_transition(self.questions, self.chapter, self.lesson)  # Add this call here if not present
             self.manager.current = "questions" # Transition to the questions screen
@@ -420,20 +501,10 @@ class ProfileScreen(Screen): # Define the ProfileScreen class
     is_editing_email = BooleanProperty(False) # Initialize is_editing_email property
     certificate_path = None # Initialize certificate_path attribute
 
-    def __init__(self, **kwargs): # Define the constructor
-        super().__init__(**kwargs) # Call the superclass constructor
-        self.conn = None  # Initialize the conn attribute to ensure it exists
-
     def on_enter(self): # Define the on_enter function
         main_screen = self.manager.get_screen('main') # Get the MainScreen instance
-        
-        if not main_screen.conn: # Check if the connection is not established
-            main_screen.initialize_database_connection() # Initialize the database connection
-
-        self.conn = main_screen.conn # Inherit the connection
         self.user_id = main_screen.user_id # Inherit the user_id
 
-        self.ensure_database_connection()  # Ensure the database connection is active
         self.load_user_data() # Load user data from the database
         self.check_certificate() # Check if a certificate exists
     
@@ -445,33 +516,17 @@ class ProfileScreen(Screen): # Define the ProfileScreen class
         self.email = "" # Reset the email
         self.certificate_path = None # Reset the certificate path
 
-    # Function to ensure the database connection
-    def ensure_database_connection(self): # Define the ensure_database_connection function
-        main_screen = self.manager.get_screen('main') # Get the MainScreen instance
-        if main_screen.conn is None: # Check if the connection is not established
-            main_screen.initialize_database_connection() # Initialize the database connection
-        self.conn = main_screen.conn # Inherit the connection
-        try: # Try to check the database connection
-            cursor = self.conn.cursor() # Create a cursor object
-            cursor.execute('SELECT 1') # Execute a test query
-        except sqlite3.Error as e:  # Handle database errors
-            main_screen.initialize_database_connection() # Reinitialize the database connection
-            self.conn = main_screen.conn # Inherit the connection
-
     # Function to load user data from the database
     def load_user_data(self):
         # Fetch user data from the database
         try: # Try to load user data from the database
-            if self.conn: # Check if the connection is established
-                cursor = self.conn.cursor() # Create a cursor object
-                cursor.execute('SELECT name, email FROM users WHERE id = ?', (self.user_id,)) # Execute an SQL query
-                result = cursor.fetchone() # Fetch the first row from the result set
-                if result: # Check if the result is found
-                    self.username = result[0] # Set the username
-                    self.email = result[1] # Set the email
-                    print(f"Loaded user data: {result}")  # Log loaded user data
-                else: # Handle case where user is not found
-                    print("User not found.") # Debugging line
+            user = repository.get_user(self.user_id) # Look up the user
+            if user: # Check if the result is found
+                self.username = user.name # Set the username
+                self.email = user.email # Set the email
+                print(f"Loaded user data: {user.name}, {user.email}")  # Log loaded user data
+            else: # Handle case where user is not found
+                print("User not found.") # Debugging line
         except sqlite3.Error as e: # Handle database errors
             print(f"Database error: {e}") # Handle database errors
 
@@ -496,19 +551,11 @@ class ProfileScreen(Screen): # Define the ProfileScreen class
             return # Exit the function
 
         try: # Try to update the username in the database
-            if self.conn: # Check if the connection is established
-                cursor = self.conn.cursor() # Create a cursor object
-                cursor.execute('UPDATE users SET name = ? WHERE id = ?', (new_username, self.user_id)) # Execute an SQL query
-                self.conn.commit() # Commit the transaction
-
-                # Verify if the update was successful
-                cursor.execute('SELECT name FROM users WHERE id = ?', (self.user_id,)) # Execute an SQL query
-                updated_username = cursor.fetchone() # Fetch the first row from the result set
-                if updated_username and updated_username[0] == new_username: # Check if the username is updated
-                    self.username = new_username  # Update the property after a successful save
-                    self.show_message("Username updated successfully.") # Show a message
-                else: # Handle case where the username is not updated
-                    self.show_message("Failed to update username.") # Show a message
+            if repository.update_user_name(self.user_id, new_username): # Update the username, checking that the user's row changed
+                self.username = new_username  # Update the property after a successful save
+                self.show_message("Username updated successfully.") # Show a message
+            else: # Handle case where the username is not updated
+                self.show_message("Failed to update username.") # Show a message
 
             self.is_editing_username = False # Reset the editing state
         except sqlite3.Error as e: # Handle database errors 
@@ -529,19 +576,11 @@ class ProfileScreen(Screen): # Define the ProfileScreen class
 
         if self.verify_password(password):  # Verify the password
             try:  # Try to update the email in the database
-                if self.conn: # Check if the connection is established
-                    cursor = self.conn.cursor() # Create a cursor object
-                    cursor.execute('UPDATE users SET email = ? WHERE id = ?', (new_email, self.user_id)) # Execute an SQL query
-                    self.conn.commit() # Commit the transaction
-
-                    # Check if the update was successful
-                    cursor.execute('SELECT email FROM users WHERE id = ?', (self.user_id,)) # Execute an SQL query
-                    updated_email = cursor.fetchone() # Fetch the first row from the result set
-                    if updated_email and updated_email[0] == new_email: # Check if the email is updated
-                        self.email = new_email  # Update the property after successful save
-                        self.show_message("Email updated successfully.") # Show a message
-                    else: # Handle case where the email is not updated
-                        self.show_message("Failed to update email.") # Show a message
+                if repository.update_user_email(self.user_id, new_email): # Update the email, checking that the user's row changed
+                    self.email = new_email  # Update the property after successful save
+                    self.show_message("Email updated successfully.") # Show a message
+                else: # Handle case where the email is not updated
+                    self.show_message("Failed to update email.") # Show a message
 
                 self.is_editing_email = False # Reset the editing state
             except sqlite3.Error as e: # Handle database errors
@@ -552,12 +591,9 @@ class ProfileScreen(Screen): # Define the ProfileScreen class
     # Function to verify the password
     def verify_password(self, password): # Define the verify_password function
         try: # Try to verify the password
-            if self.conn: # Check if the connection is established
-                cursor = self.conn.cursor() # Create a cursor object
-                cursor.execute('SELECT password FROM users WHERE id = ?', (self.user_id,)) # Execute an SQL query
-                result = cursor.fetchone() # Fetch the first row from the result set
-                if result and bcrypt.checkpw(password.encode(), result[0]): # Check if the password matches
-                    return True # Return True if the password matches
+            user = repository.get_user(self.user_id) # Look up the user
+            if user and bcrypt.checkpw(password.encode(), user.password): # Check if the password matches
+                return True # Return True if the password matches
         except sqlite3.Error as e: # Handle database errors
             print(f"Database error: {e}") # Print an error message
         return False # Return False if the password does not match
@@ -567,10 +603,7 @@ class ProfileScreen(Screen): # Define the ProfileScreen class
         if self.verify_password(old_password): # Verify the old password
             hashed_password = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt()) # Hash the new password
             try: # Try to update the password in the database
-                if self.conn: # Check if the connection is established
-                    cursor = self.conn.cursor() # Create a cursor object
-                    cursor.execute('UPDATE users SET password = ? WHERE id = ?', (hashed_password, self.user_id)) # Execute an SQL query
-                    self.conn.commit() # Commit the transaction
+                repository.update_user_password(self.user_id, hashed_password) # Store the new password hash
                 self.show_message("Password updated successfully.") # Show a message
             except sqlite3.Error as e: # Handle database errors
                 print(f"Database error: {e}") # Print an error message
@@ -578,6 +611,15 @@ class ProfileScreen(Screen): # Define the ProfileScreen class
             self.show_message("Incorrect old password. Password not updated.") # Show a message
 
     # Function to check if a certificate exists
+    def check_certificate(self): # Define the check_certificate function
+        try: # Try to look up the certificate
+            certificate = repository.get_certificate(self.user_id) # Look up the user's certificate
+        except sqlite3.Error as e: # Handle database errors
+            print(f"Database error while fetching certificate: {e}") # Print an error message
+            certificate = None # Treat the certificate as missing
+        self.certificate_path = certificate.certificate_path if certificate else None # Set the certificate path
+
+    # Function to show a message in a popup
     def show_message(self, message): # Define the show_message function
         popup = Popup(title='Notification', content=Label(text=message), size_hint=(0.6, 0.4)) # Create a popup
         popup.open() # Open the popup
@@ -622,6 +664,7 @@ class MistakesScreen(Screen): # Define the MistakesScreen class
     def __init__(self, **kwargs): # Define the constructor
         super(MistakesScreen, self).__init__(**kwargs) # Call the superclass constructor
         self.current_view_state = 'chapters'  # Tracks whether viewing 'chapters' or 'lessons'
+        self.mistake_counts = {} # Mistakes per (chapter, lesson), loaded with the chapters
 
     # Function to handle the back button press
     def on_pre_enter(self): # Define the on_pre_enter function
@@ -647,38 +690,29 @@ class MistakesScreen(Screen): # Define the MistakesScreen class
 
     # Function to load the completed chapters and lessons
     def load_completed_chapters_and_lessons(self): # Define the load_completed_chapters_and_lessons function
+        write_buffer.flush() # Write buffered mistakes, so they are counted
         try: # Try to load the completed chapters and lessons
-            with sqlite3.connect('progress.db') as conn: # Connect to the database
-                cursor = conn.cursor() # Create a cursor object
-                cursor.execute( # Execute an SQL query
-                    '''
-                    SELECT DISTINCT chapter, lesson
-                    FROM mistakes
-                    WHERE user_id = ?
-                    ORDER BY chapter, lesson
-                    ''',
-                    (self.user_id,)
+            summary = repository.get_mistake_summary(self.user_id) # One query for every lesson's count
+            self.mistake_counts = {(row.chapter, row.lesson): row.count for row in summary} # Keep the counts for the lesson buttons
+            chapters = {} # Initialize an empty dictionary for chapters
+            for row in summary: # Iterate over the lessons
+                if row.chapter not in chapters: # Check if the chapter is not in the dictionary
+                    chapters[row.chapter] = [] # Initialize an empty list for the chapter
+                chapters[row.chapter].append(row.lesson) # Add the lesson to the chapter
+
+            if not chapters: # Check if no chapters are found
+                no_mistakes_label = Label( # Create a Label
+                    text="No lessons with mistakes found.", # Set the text
+                    size_hint_y=None, # Set the size hint for y-axis
+                    height=30 # Set the height
                 )
-                lessons = cursor.fetchall() # Fetch all rows from the result set
-                chapters = {} # Initialize an empty dictionary for chapters
-                for chapter, lesson in lessons: # Iterate over the lessons
-                    if chapter not in chapters: # Check if the chapter is not in the dictionary
-                        chapters[chapter] = [] # Initialize an empty list for the chapter
-                    chapters[chapter].append(lesson) # Add the lesson to the chapter
-
-                if not chapters: # Check if no chapters are found
-                    no_mistakes_label = Label( # Create a Label
-                        text="No lessons with mistakes found.", # Set the text
-                        size_hint_y=None, # Set the size hint for y-axis
-                        height=30 # Set the height
-                    )
-                    self.ids.mistakes_container.add_widget(no_mistakes_label) # Add the label to the container
-                    return # Exit the function
+                self.ids.mistakes_container.add_widget(no_mistakes_label) # Add the label to the container
+                return # Exit the function
 
-                for chapter in sorted(chapters.keys()): # Iterate over the chapters
-                    self.add_chapter(chapter, chapters[chapter]) # Add the chapter to the UI
+            for chapter in sorted(chapters.keys()): # Iterate over the chapters
+                self.add_chapter(chapter, chapters[chapter]) # Add the chapter to the UI
 
-                self.current_view_state = 'chapters' # Set the current view state to chapters
+            self.current_view_state = 'chapters' # Set the current view state to chapters
 
         except sqlite3.Error as e: # Handle database errors
             print(f"Failed to load lessons with mistakes: {e}") # Print an error message
@@ -728,7 +762,7 @@ class MistakesScreen(Screen): # Define the MistakesScreen class
     def add_lessons_to_layout(self, lessons, layout, chapter_text): # Define the add_lessons_to_layout function
         chapter_number = int(chapter_text.split()[1]) # Extract the chapter number
         for lesson in sorted(lessons): # Iterate over the lessons
-            total_mistakes = self.get_total_mistakes(self.user_id, chapter_number, lesson) # Get the total mistakes
+            total_mistakes = self.mistake_counts.get((chapter_number, lesson), 0) # Count loaded with the chapters
 
             lesson_button = Button( # Create a Button
                 text=f"Lesson {lesson} - Mistakes: {total_mistakes}", # Set the text
@@ -741,24 +775,6 @@ class MistakesScreen(Screen): # Define the MistakesScreen class
             layout.add_widget(lesson_button) # Add the button to the layout
             self.current_view_state = 'lessons' # Set the current view state to lessons
 
-    # Function to get the total mistakes for a lesson
-    def get_total_mistakes(self, user_id, chapter, lesson): # Define the get_total_mistakes function
-        try: # Try to get the total mistakes
-            with sqlite3.connect('progress.db') as conn: # Connect to the database
-                cursor = conn.cursor() # Create a cursor object
-                cursor.execute( # Execute an SQL query
-                    '''
-                    SELECT COUNT(*)
-                    FROM mistakes
-                    WHERE user_id = ? AND chapter = ? AND lesson = ?
-                    ''',
-                    (user_id, chapter, lesson)
-                )
-                total_mistakes = cursor.fetchone()[0] # Fetch the first row from the result set
-                return total_mistakes # Return the total mistakes
-        except sqlite3.Error as e: # Handle database errors
-            return 0    # Return 0 if an error occurs
-
     # Function to show mistakes for a lesson
     def show_mistakes_for_lesson(self, instance): # Define the show_mistakes_for_lesson function
         self.ids.mistakes_container.clear_widgets() # Clear the mistakes container
@@ -798,18 +814,18 @@ class MistakesScreen(Screen): # Define the MistakesScreen class
                 )
                 return label # Return the label
 
-            question_label = create_wrapped_label(f"[b]Question:[/b] {mistake['question']}") # Create a wrapped label
+            question_label = create_wrapped_label(f"[b]Question:[/b] {mistake.question}") # Create a wrapped label
             mistake_box.add_widget(question_label) # Add the question label to the mistake box
  
-            correct_answer_label = create_wrapped_label(f"[b]Correct Answer:[/b] {mistake['correct_answer']}") # Create a wrapped label
+            correct_answer_label = create_wrapped_label(f"[b]Correct Answer:[/b] {mistake.correct_answer}") # Create a wrapped label
             mistake_box.add_widget(correct_answer_label) # Add the correct answer label to the mistake box
 
-            user_answer_label = create_wrapped_label(f"[b]Your Answer:[/b] {mistake['user_answer']}") # Create a wrapped label
+            user_answer_label = create_wrapped_label(f"[b]Your Answer:[/b] {mistake.user_answer}") # Create a wrapped label
             mistake_box.add_widget(user_answer_label) # Add the user answer label to the mistake box
 
             # Optional feedback
-            if mistake['feedback']: # Check if feedback exists
-                feedback_label = create_wrapped_label(f"[b]Feedback:[/b] {mistake['feedback']}") # Create a wrapped label
+            if mistake.feedback: # Check if feedback exists
+                feedback_label = create_wrapped_label(f"[b]Feedback:[/b] {mistake.feedback}") # Create a wrapped label
                 mistake_box.add_widget(feedback_label) # Add the feedback label to the mistake box
 
             detailed_layout.add_widget(mistake_box) # Add the mistake box to the layout
@@ -821,29 +837,7 @@ class MistakesScreen(Screen): # Define the MistakesScreen class
     # Function to get mistakes for a lesson
     def get_mistakes_for_lesson(self, user_id, chapter, lesson): # Define the get_mistakes_for_lesson function
         try: # Try to get the mistakes for a lesson
-            with sqlite3.connect('progress.db') as conn: # Connect to the database
-                cursor = conn.cursor()  # Create a cursor object
-                cursor.execute(  # Execute an SQL query
-                    '''
-                    SELECT question, user_answer, correct_answer, feedback
-                    FROM mistakes
-                    WHERE user_id = ? AND chapter = ? AND lesson = ?
-                    ORDER BY id
-                    ''',
-                    (user_id, chapter, lesson)
-                )
-                mistakes = cursor.fetchall() # Fetch all rows from the result set
-                # Convert to list of dictionaries
-                mistakes_list = [] # Initialize an empty list for mistakes
-                for row in mistakes: # Iterate over the mistakes
-                    mistakes_dict = { # Create a dictionary for the mistake
-                        'question': row[0], # Set the question
-                        'user_answer': row[1], # Set the user answer
-                        'correct_answer': row[2], # Set the correct answer
-                        'feedback': row[3] if len(row) > 3 else None  # Handle missing feedback
-                    }
-                    mistakes_list.append(mistakes_dict) # Add the mistake to the list
-                return mistakes_list # Return the list of mistakes
+            return repository.get_mistakes_for_lesson(user_id, chapter, lesson) # Return the mistakes, in the order they were made
         except sqlite3.Error as e: # Handle database errors
             print(f"Failed to get mistakes for lesson: {e}") # Print an error message
             return [] # Return an empty list if an error occurs
@@ -868,6 +862,7 @@ class ChapterReviewScreen(Screen): # Define the ChapterReviewScreen class
         super().__init__(**kwargs) # Call the superclass constructor
         self.user_id = None # Initialize the user_id attribute
         self.chapter = None # Initialize the chapter attribute
+        self.review_task = None # Background task generating the review
 
     # Function to start the chapter review
     def start_chapter_review(self, user_id, chapter): # Define the start_chapter_review function
@@ -878,20 +873,35 @@ class ChapterReviewScreen(Screen): # Define the ChapterReviewScreen class
 
     # Function to generate review questions
     def generate_review_questions(self, dt): # Define the generate_review_questions function
-        progress = UserProgress(self.user_id)   # Create a UserProgress instance
-        questions = generate_review_questions(progress, self.chapter) # Generate review questions
-        num_questions = len(questions) # Get the number of questions
+        self.review_task = task_runner.submit( # Generate the review on a worker thread so the UI stays responsive
+            build_chapter_review, self.user_id, self.chapter, # Pass the user ID and chapter
+            on_result=self.show_review_questions, # Show the questions once they are ready
+            on_error=self.show_review_error # Show a message if the review could not be generated
+        )
+
+    # Function to show the generated review questions
+    def show_review_questions(self, questions): # Define the show_review_questions function
         # Store questions in QuestionScreen with a flag indicating review mode
         question_screen = self.manager.get_screen('questions') # Get the QuestionScreen instance
         question_screen.set_questions(questions, self.chapter, lesson=8, is_review=True) # Set the questions
         self.manager.current = 'questions' # Navigate to the questions screen
 
+    # Function to show a message when the review could not be generated
+    def show_review_error(self, error): # Define the show_review_error function
+        self.ids.loading_label.text = f"Unable to generate the Chapter {self.chapter} Review. Please try again." # Update the loading label
+
+    # Function that runs when the user leaves the chapter review screen
+    def on_leave(self): # Define the on_leave function
+        if self.review_task and self.manager.current != 'questions': # Check if the review is still generating for a screen the user left
+            self.review_task.cancel() # Drop the result
+
 # class to handle the chapter review result screen
 class CumulativeReviewScreen(Screen): # Define the CumulativeReviewScreen class
     # Define the constructor
     def __init__(self, **kwargs): # Define the constructor
         super().__init__(**kwargs) # Call the superclass constructor
         self.user_id = None # Initialize the user_id attribute
+        self.review_task = None # Background task generating the review
 
     # Function to start the cumulative review
     def start_cumulative_review(self, user_id): # Define the start_cumulative_review function
@@ -901,13 +911,34 @@ class CumulativeReviewScreen(Screen): # Define the CumulativeReviewScreen class
 
     # Function to generate cumulative review questions
     def generate_cumulative_review_questions(self, dt): # Define the generate_cumulative_review_questions function
-        progress = UserProgress(self.user_id) # Create a UserProgress instance
-        questions = generate_cumulative_review(progress)  # Use cumulative review logic
+        self.review_task = task_runner.submit( # Generate the review on a worker thread so the UI stays responsive
+            build_cumulative_review, self.user_id, # Pass the user ID
+            on_progress=self.show_review_progress, # Show how many lessons are done
+            on_result=self.show_review_questions, # Show the questions once they are ready
+            on_error=self.show_review_error, # Show a message if the review could not be generated
+            cancellable=True # Stop processing lessons if the user leaves
+        )
+
+    # Function to show the review generation progress
+    def show_review_progress(self, done, total): # Define the show_review_progress function
+        self.ids.loading_label.text = f"Generating Cumulative Review... {done}/{total}" # Update the loading label
+
+    # Function to show the generated review questions
+    def show_review_questions(self, questions): # Define the show_review_questions function
         num_questions = len(questions) # Get the number of questions
         # Update the loading label to display the number of questions
         self.ids.loading_label.text = f"Generated {num_questions} questions for the Cumulative Review." # Update the loading label
         Clock.schedule_once(lambda dt: self.go_to_questions_screen(questions), 1.0) # Delayed transition
 
+    # Function to show a message when the review could not be generated
+    def show_review_error(self, error): # Define the show_review_error function
+        self.ids.loading_label.text = "Unable to generate the Cumulative Review. Please try again." # Update the loading label
+
+    # Function that runs when the user leaves the cumulative review screen
+    def on_leave(self): # Define the on_leave function
+        if self.review_task and self.manager.current != 'questions': # Check if the review is still generating for a screen the user left
+            self.review_task.cancel() # Drop the result
+
     # Function to navigate to the questions screen
     def go_to_questions_screen(self, questions): # Define the go_to_questions_screen function
         # Store questions in QuestionScreen with a flag indicating cumulative review mode
@@ -928,9 +959,13 @@ class QuestionScreen(Screen): # Define the QuestionScreen class
         self.selected_answer = None  # To track selected answers for multiple choice
         self.awaiting_next_submission = False  # To prevent multiple submissions
         self.feedback_label = None # To store the feedback label
+        self.validation_task = None # Background task validating the current answer
     
     # Function to set the questions
     def set_questions(self, questions, chapter, lesson, is_review=False, is_cumulative_review=False): # Define the set_questions function
+        if self.validation_task: # Check if an answer from the previous set is still being validated
+            self.validation_task.cancel() # Drop its feedback
+            self.validation_task = None # Clear the task
         self.questions = questions # Store the questions
         self.chapter = chapter # Store the chapter number
         self.lesson = lesson # Store the lesson number
@@ -952,14 +987,7 @@ class QuestionScreen(Screen): # Define the QuestionScreen class
 
             # Fetch user_name from the database to ensure it's always updated
             try:  # Try to fetch the user name from the database
-                with sqlite3.connect('progress.db') as conn:  # Connect to the database
-                    cursor = conn.cursor()  # Create a cursor object
-                    cursor.execute('SELECT name FROM users WHERE id = ?', (main_screen.user_id,))  # Execute an SQL query
-                    result = cursor.fetchone()  # Fetch the first row from the result set
-                    if result:  # Check if the result is found
-                        user_name = result[0]  # Set the user name
-                    else:  # Handle case where the user name is not found
-                        user_name = "User"  # Set the default user name
+                user_name = repository.get_user_name(main_screen.user_id) or "User"  # Set the user name, or the default if the user is not found
             except sqlite3.Error as e:  # Handle database errors
                 print(f"Database error while fetching user name: {e}")  # Debugging statement
                 user_name = "User"  # Set the default user name
@@ -991,6 +1019,7 @@ class QuestionScreen(Screen): # Define the QuestionScreen class
                     else:  # Handle case where the lesson is the last one
                         pass  # No need to unlock the next lesson
                     user_progress.save_progress()  # Save the user progress 
+                write_buffer.flush()  # The question set is over, commit its mistakes and progress together
                 # Transition back to the main screen
                 self.manager.current = 'main'  # Navigate to the main screen
                 self.manager.get_screen('main').on_enter()  # Refresh the main screen if necessary
@@ -1102,6 +1131,8 @@ class QuestionScreen(Screen): # Define the QuestionScreen class
             self.ids.code_comparison_label.opacity = 0 # Hide the code comparison button
             self.ids.code_comparison_label.size_hint_y = 0 # Hide the code comparison button
 
+        write_buffer.flush_soon() # Write the last answer's mistake in the background while the user reads the question
+
 
     # Function to handle the selection of an option
     def on_option_selected(self, instance): # Define the on_option_selected function
@@ -1117,6 +1148,9 @@ class QuestionScreen(Screen): # Define the QuestionScreen class
         correct = False  # Initialize correct at the start
         print("submit_answer called") # Debugging output for function call
 
+        if self.validation_task: # Check if an answer is still being validated
+            return # Ignore the press until the feedback arrives
+
         if self.awaiting_next_submission: # Check if awaiting next submission
             # Move to the next question after showing feedback
             self.current_question_index += 1 # Move to the next question
@@ -1140,12 +1174,14 @@ class QuestionScreen(Screen): # Define the QuestionScreen class
             elif question_type == 'fill_in_the_blank': # Check if the question type is fill in the blank
                 user_answer = self.ids.user_input.text if hasattr(self.ids, 'user_input') else "" # Get the user input
                 correct = self.validate_answer(question, user_answer) # Validate the answer
+            elif question_type == 'write_code': # Check if the question type is write code
                 user_code = self.collect_code_input() # Collect the user code input
-                correct, feedback = self.validate_code_answer(question, user_code) # Validate the code answer
-                self.display_feedback(correct, feedback, question.get('correct_answer', ''), user_code=user_code, question_type=question_type) # Display the feedback
+                self.start_validation(self.validate_code_answer, question, user_code) # Validate the code answer in the background
+                return # The feedback is shown when the validation finishes
             elif question_type == 'scenario': # Check if the question type is scenario
                 user_response = self.collect_scenario_response() # Collect the user response
-                correct, feedback = self.validate_scenario_answer(question, user_response) # Validate the scenario answer
+                self.start_validation(self.validate_scenario_answer, question, user_response) # Validate the scenario answer in the background
+                return # The feedback is shown when the validation finishes
             else: # Handle unrecognized question types
                 feedback = "Unrecognized question type." # Provide feedback for unrecognized question types
 
@@ -1158,6 +1194,33 @@ class QuestionScreen(Screen): # Define the QuestionScreen class
         else: # Handle case where no questions are available
             self.display_feedback(False, "No questions available.", "", question_type="unknown")  # Display feedback for no questions
 
+    # Function to validate an answer on a worker thread and show the feedback when it finishes
+    def start_validation(self, validate, question, user_answer): # Define the start_validation function
+        self.ids.feedback_label.text = "Checking your answer..." # Let the user know the answer is being checked
+        self.ids.feedback_label.color = (1, 1, 1, 1) # Neutral color while checking
+        self.validation_task = task_runner.submit( # Run the validation in the background
+            validate, question, user_answer, # Pass the question and the user's answer
+            on_result=lambda result: self.finish_validation(result, question, user_answer), # Show the feedback when it finishes
+            on_error=lambda error: self.finish_validation((False, "An error occurred during validation."), question, user_answer) # Show an error if it fails
+        )
+
+    # Function to show the feedback for a background validation
+    def finish_validation(self, result, question, user_answer): # Define the finish_validation function
+        self.validation_task = None # The validation has finished
+        correct, feedback = result # Unpack the validation result
+        self.display_feedback(correct, feedback, question.get('correct_answer', ''), user_code=user_answer, question_type=question.get('type', '')) # Display the feedback
+
+        if correct: # Check if the answer is correct
+            self.correct_answers += 1  # Increment correct answers if correct
+
+        self.awaiting_next_submission = True # Set the flag to await next submission
+
+    # Function that runs when the user leaves the questions screen
+    def on_leave(self): # Define the on_leave function
+        if self.validation_task: # Check if an answer is still being validated
+            self.validation_task.cancel() # Drop the feedback for a screen the user left
+            self.validation_task = None # Clear the task
+
     # Function to collect code input***REMOVE BEFORE SUBMISSION***
     def bypass_validation(self): # Define the bypass_validation function
         if self.awaiting_next_submission:
@@ -1191,10 +1254,22 @@ class QuestionScreen(Screen): # Define the QuestionScreen class
     
     # Function to validate code answers
     def validate_code_answer(self, question_data, user_code):  # Define the validate_code_answer function
-        user_output, user_errors = run_user_code(user_code) # Run the user code
-        correct, feedback = validate_answer_with_gpt( # Validate the answer with GPT
-            question_data, user_code=user_code, user_output=user_output # Pass the question data, user code, and user output
-        )  
+        tests = question_data.get('tests') # Test cases verified against the sample solution when the question was generated
+        if tests: # Grade locally when the question has test cases
+            report = run_tests(user_code, tests) # Run the user code against the test cases
+            user_output, user_errors = report["output"], report["error"] # Use the output and errors from the test run
+            if not report["failed"]: # Check if every test passed
+                return True, f"Correct! Your code passed all {len(tests)} tests." # No GPT call needed
+            correct = False # The failed tests decide the verdict
+            _, feedback = validate_answer_with_gpt( # Ask GPT only to explain what went wrong
+                question_data, user_code=user_code, user_output=user_output, failed_tests=report["failed"] # Pass the question data, user code, user output, and failed tests
+            )
+            feedback = f"Incorrect: your code passed {len(report['passed'])} of {len(tests)} tests.\n\n{feedback}" # Lead with the test result
+        else: # Fall back to GPT grading for questions without test cases
+            user_output, user_errors = run_user_code(user_code) # Run the user code
+            correct, feedback = validate_answer_with_gpt( # Validate the answer with GPT
+                question_data, user_code=user_code, user_output=user_output # Pass the question data, user code, and user output
+            )
         feedback_message = feedback  # Initialize feedback message
 
         if not correct: # Save the mistake if incorrect
@@ -1203,13 +1278,17 @@ class QuestionScreen(Screen): # Define the QuestionScreen class
                 feedback_message += f"\n\nErrors:\n{user_errors}" # Append errors to feedback
             self.save_mistake(question_data, user_code, feedback_message) # Save the mistake
 
-            return correct, feedback_message # Return the validation result
+        return correct, feedback_message # Return the validation result
 
     # Function to validate scenario answers
     def validate_scenario_answer(self, question_data, user_response): # Define the validate_scenario_answer function
-        correct, feedback = validate_answer_with_gpt( # Validate the answer with GPT
-            question_data=question_data, user_response=user_response # Pass the question data and user response
-        )
+        verdict = pregrader.grade(question_data, user_response) # Settle empty, off-topic, and near-verbatim answers locally
+        if verdict is not None: # Check if the pre-grader was confident
+            correct, feedback = verdict # Use the local verdict
+        else: # Leave the ambiguous answers to GPT
+            correct, feedback = validate_answer_with_gpt( # Validate the answer with GPT
+                question_data=question_data, user_response=user_response # Pass the question data and user response
+            )
 
         if not correct: # Save the mistake if incorrect
             self.save_mistake(question_data, user_response, feedback) # Save the mistake
@@ -1219,8 +1298,8 @@ class QuestionScreen(Screen): # Define the QuestionScreen class
 
     # Function to save mistakes
     def save_mistake(self, question_data, user_answer, feedback=""): # Define the save_mistake function
-        user_progress = UserProgress(self.manager.get_screen('main').user_id) # Initialize UserProgress
-        user_progress.add_mistake( # Add the mistake to the user progress
+        write_buffer.add_mistake( # Buffer the mistake, without loading the user's progress or opening a transaction
+            user_id=self.manager.get_screen('main').user_id, # Include the user ID
             chapter=self.chapter, # Include chapter number
             lesson=self.lesson, # Include lesson number
             question=question_data.get('question', ''),  # Include question text
@@ -1408,14 +1487,11 @@ class CumulativeReviewResultScreen(Screen):  # Define the CumulativeReviewResult
     def on_enter(self):  # Define the on_enter function
         # Load certificate path from the database when entering the result screen
         try:  # Try to fetch the certificate path from the database
-            with sqlite3.connect('progress.db') as conn:  # Connect to the database
-                cursor = conn.cursor()  # Create a cursor object
-                cursor.execute('SELECT certificate_path FROM certificates WHERE user_id = ?', (self.user_id,))  # Execute an SQL query
-                result = cursor.fetchone()  # Fetch the first row from the result set
-                if result and result[0]:  # Check if the result is found and not empty
-                    self.certificate_path = result[0]  # Set the certificate path
-                else:  # Handle case where the certificate path is not found
-                    self.certificate_path = None  # Set the certificate path to None
+            certificate = repository.get_certificate(self.user_id)  # Look up the user's certificate
+            if certificate and certificate.certificate_path:  # Check if the result is found and not empty
+                self.certificate_path = certificate.certificate_path  # Set the certificate path
+            else:  # Handle case where the certificate path is not found
+                self.certificate_path = None  # Set the certificate path to None
         except sqlite3.Error as e:  # Handle database errors
             print(f"Database error while fetching certificate path: {e}")  # Debugging statement
             self.certificate_path = None  # Set the certificate path to None
@@ -1429,15 +1505,10 @@ class CumulativeReviewResultScreen(Screen):  # Define the CumulativeReviewResult
         # Fetch the user's name from the database
         user_name = None
         try:
-            with sqlite3.connect('progress.db') as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT name FROM users WHERE id = ?', (user_id,))
-                result = cursor.fetchone()
-                if result:
-                    user_name = result[0]
-                else:
-                    print(f"No user found with id {user_id}")
-                    user_name = "User"  # Default name if user not found
+            user_name = repository.get_user_name(user_id)
+            if user_name is None:
+                print(f"No user found with id {user_id}")
+                user_name = "User"  # Default name if user not found
         except sqlite3.Error as e:
             print(f"Database error while fetching user name: {e}")
             user_name = "User"  # Default name in case of an error
@@ -1466,15 +1537,10 @@ class CumulativeReviewResultScreen(Screen):  # Define the CumulativeReviewResult
         # Retrieve the user's name from the database using the user_id
         user_name = None
         try:
-            with sqlite3.connect('progress.db') as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT name FROM users WHERE id = ?', (user_id,))
-                result = cursor.fetchone()
-                if result:
-                    user_name = result[0]
-                else:
-                    print(f"No user found with id {user_id}")
-                    return  # If no user is found, exit the function
+            user_name = repository.get_user_name(user_id)
+            if user_name is None:
+                print(f"No user found with id {user_id}")
+                return  # If no user is found, exit the function
         except sqlite3.Error as e:
             print(f"Database error while fetching user name: {e}")
             return  # Exit if there's a database error
@@ -1511,15 +1577,7 @@ class CumulativeReviewResultScreen(Screen):  # Define the CumulativeReviewResult
 
         # Save certificate details to the database
         try:  # Try to save the certificate details to the database
-            with sqlite3.connect('progress.db') as conn:  # Connect to the database
-                cursor = conn.cursor()  # Create a cursor object
-                cursor.execute('''
-                    INSERT INTO certificates (user_id, certificate_path, date_issued)
-                    VALUES (?, ?, ?)
-                    ON CONFLICT(user_id) DO UPDATE SET certificate_path = excluded.certificate_path, date_issued = excluded.date_issued
-                ''', (user_id, output_file_path, current_date))
-
-                conn.commit()  # Commit the changes
+            repository.save_certificate(user_id, output_file_path, current_date)  # Store the certificate, replacing any earlier one
         except sqlite3.Error as e:  # Handle database errors
             print(f"Database error while saving certificate: {e}")  # Debugging statement
 
@@ -1568,6 +1626,19 @@ class MyApp(App):   # Define the MyApp class
         sm.add_widget(CumulativeReviewResultScreen(name="cumulative_review_result"))  # Add the CumulativeReviewResultScreen to the Screen
         return sm   # Return the ScreenManager
 
+    def on_pause(self): # Define the on_pause function
+        write_buffer.flush() # The app may be killed while paused, so write everything buffered
+        return True # Allow the app to pause
+
+    def on_stop(self): # Define the on_stop function
+        write_buffer.flush() # Write everything buffered before the app closes
+        lesson_prefetcher.shutdown() # Stop the background prefetch worker
+        task_runner.shutdown() # Stop the background task workers
+        stats = verdict_cache.stats() # Read the grading cache counters
+        print(f"Verdict cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%}), {stats['latency_saved']:.1f}s saved") # Log the counters
+        stats = pregrader.stats() # Read the scenario pre-grader counters
+        print(f"Scenario pre-grader: {stats['accepted']} accepted, {stats['rejected']} rejected, {stats['deferred']} sent to GPT ({stats['avoided']:.0%} of calls avoided)") # Log the counters
+
 # Main entry point
 if __name__ == "__main__":  # Check if the script is being run directly
     MyApp().run() # Run the Kivy application
\ No newline at end of file
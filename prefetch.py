@@ -0,0 +1,67 @@
+import threading # Import the threading module to guard the cache between threads
+from collections import OrderedDict # Import OrderedDict to keep the cache in least-recently-used order
+from concurrent.futures import ThreadPoolExecutor, CancelledError # Import the thread pool to build lessons in the background
+
+# Class to build upcoming lessons in the background and keep the results in a bounded cache
+class LessonPrefetcher: # Define the LessonPrefetcher class
+
+    # Initialize the LessonPrefetcher class
+    def __init__(self, build_lesson, max_entries=3): # Define the constructor with the build_lesson and max_entries parameters
+        self.build_lesson = build_lesson # Function that returns (content, questions) for a user, chapter, and lesson
+        self.max_entries = max_entries # Maximum number of prefetched lessons kept in memory
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch") # One background worker so prefetching never competes with itself
+        self.cache = OrderedDict() # Prefetched lessons keyed by (user_id, chapter, lesson)
+        self.pending = {} # Lessons being prefetched keyed by (user_id, chapter, lesson)
+        self.lock = threading.Lock() # Lock to keep the cache and pending lessons consistent
+
+    # Function to start prefetching a lesson in the background
+    def prefetch(self, user_id, chapter, lesson): # Define the prefetch function with the user_id, chapter, and lesson parameters
+        key = (user_id, chapter, lesson) # Build the cache key
+        with self.lock: # Guard the cache and pending lessons
+            if key in self.cache or key in self.pending: # Check if the lesson is already prefetched or in progress
+                return # Nothing to do
+            future = self.executor.submit(self.build_lesson, user_id, chapter, lesson) # Build the lesson on the background worker
+            self.pending[key] = future # Track the lesson as in progress
+        future.add_done_callback(lambda done, key=key: self.store_result(key, done)) # Cache the result when the build finishes
+        print(f"Prefetching Chapter {chapter}, Lesson {lesson} for User ID {user_id}") # Debugging line
+
+    # Function to move a finished build into the cache
+    def store_result(self, key, future): # Define the store_result function with the key and future parameters
+        with self.lock: # Guard the cache and pending lessons
+            if self.pending.get(key) is not future: # Check if the prefetch was cancelled while it ran
+                return # Discard the result
+            del self.pending[key] # The lesson is no longer in progress
+            if future.cancelled() or future.exception() is not None: # Check if the build did not produce a lesson
+                return # Leave the lesson to be generated on demand
+            self.cache[key] = future.result() # Store the prefetched lesson
+            self.cache.move_to_end(key) # Mark it as the most recently used lesson
+            while len(self.cache) > self.max_entries: # Check if the cache is over its limit
+                self.cache.popitem(last=False) # Evict the least recently used lesson
+
+    # Function to take a prefetched lesson, waiting for it if it is still being built
+    def take(self, user_id, chapter, lesson): # Define the take function with the user_id, chapter, and lesson parameters
+        key = (user_id, chapter, lesson) # Build the cache key
+        with self.lock: # Guard the cache and pending lessons
+            if key in self.cache: # Check if the lesson is ready
+                return self.cache.pop(key) # Hand the lesson over, it is only served once
+            future = self.pending.pop(key, None) # Take over an in-progress build instead of starting a second one
+
+        if future is None: # Check if the lesson was never prefetched
+            return None # The caller generates it on demand
+        try: # Try block to handle exceptions
+            return future.result() # Wait for the in-progress build
+        except (CancelledError, Exception) as e: # Catch failed or cancelled builds
+            print(f"Prefetch failed for Chapter {chapter}, Lesson {lesson}: {e}") # Log the error
+            return None # The caller generates it on demand
+
+    # Function to cancel prefetching, except for the lesson the user is opening
+    def cancel(self, keep=None): # Define the cancel function with the keep parameter
+        with self.lock: # Guard the cache and pending lessons
+            for key in list(self.pending): # Iterate over the lessons in progress
+                if key != keep: # Check if the lesson is not the one being opened
+                    self.pending.pop(key).cancel() # Cancel it if it has not started, and drop its result if it has
+
+    # Function to stop the background worker when the app closes
+    def shutdown(self): # Define the shutdown function
+        self.cancel() # Cancel any lessons in progress
+        self.executor.shutdown(wait=False, cancel_futures=True) # Stop the background worker without waiting for a running build
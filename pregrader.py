@@ -0,0 +1,126 @@
+import math # Import the math module for the TF-IDF weights
+import os # Import the os module to read environment variables
+import re # Import the re module to split answers into words
+import threading # Import the threading module to guard the counters between threads
+from collections import Counter # Import Counter to count word frequencies
+from fuzzywuzzy import fuzz # Import the fuzz function from the fuzzywuzzy module for string similarity comparison
+
+PREGRADE_ACCEPT = float(os.getenv("PREGRADE_ACCEPT", "0.6")) # Scores at or above this are accepted without GPT
+PREGRADE_REJECT = float(os.getenv("PREGRADE_REJECT", "0.1")) # Scores at or below this are rejected without GPT
+PREGRADE_MIN_WORDS = 2 # Responses with fewer content words are only settled locally when they match the answer verbatim
+PREGRADE_VERBATIM = int(os.getenv("PREGRADE_VERBATIM", "90")) # fuzz.ratio of the content words at or above which a response counts as the expected answer
+
+WORD_PATTERN = re.compile(r"[a-z0-9_]+") # Precompiled pattern that splits text into lowercase words
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+") # Precompiled pattern that splits text into sentences
+STOPWORDS = frozenset(( # Words that carry no meaning on their own
+    "a", "an", "the", "and", "or", "but", "if", "then", "so", "of", "to", "in", "on", "at", "by", "for", "with",
+    "from", "as", "is", "are", "was", "were", "be", "been", "being", "it", "its", "this", "that", "these", "those",
+    "they", "them", "their", "you", "your", "we", "our", "he", "she", "i", "me", "my", "do", "does", "did", "can",
+    "could", "should", "would", "will", "may", "might", "must", "have", "has", "had", "not", "no", "yes", "there",
+    "which", "what", "when", "where", "who", "why", "how", "than", "into", "about", "also", "just", "use", "using", "used",
+))
+
+# Function to reduce a word to a rough stem so "lists" matches "list" and "sorting" matches "sort"
+def stem(word): # Define the stem function with the word parameter
+    for suffix in ("ing", "ed", "es", "s"): # Iterate over the common suffixes
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3: # Check if enough of the word is left
+            return word[:-len(suffix)] # Strip the suffix
+    return word # Return the word unchanged
+
+# Function to split text into stemmed content words
+def content_words(text): # Define the content_words function with the text parameter
+    return [stem(word) for word in WORD_PATTERN.findall((text or "").lower()) if word not in STOPWORDS] # Drop stopwords and stem the rest
+
+# Function to compare two texts by TF-IDF cosine, weighting words by how rare they are in the question and answer
+def tfidf_cosine(response_words, answer_words, documents): # Define the tfidf_cosine function
+    document_frequency = Counter(word for document in documents for word in set(document)) # Count the documents containing each word
+    total = len(documents) # Number of documents
+
+    # Function to weight each word of a text
+    def weights(words): # Define the weights function
+        counts = Counter(words) # Count the words
+        return {word: count * (math.log((1 + total) / (1 + document_frequency[word])) + 1) for word, count in counts.items()} # TF-IDF weight per word
+
+    response_weights, answer_weights = weights(response_words), weights(answer_words) # Weight both texts
+    dot = sum(weight * answer_weights.get(word, 0.0) for word, weight in response_weights.items()) # Dot product of the two vectors
+    norm = math.sqrt(sum(w * w for w in response_weights.values())) * math.sqrt(sum(w * w for w in answer_weights.values())) # Product of the vector lengths
+    return dot / norm if norm else 0.0 # Return the cosine similarity
+
+# Class to score scenario answers locally and settle the obvious ones without GPT
+class PreGrader: # Define the PreGrader class
+
+    # Initialize the PreGrader class
+    def __init__(self, accept=PREGRADE_ACCEPT, reject=PREGRADE_REJECT): # Define the constructor with the accept and reject parameters
+        self.accept = accept # Score at or above which a response is accepted
+        self.reject = reject # Score at or below which a response is rejected
+        self.lock = threading.Lock() # Lock to keep the counters consistent across threads
+        self.accepted = 0 # Responses accepted locally
+        self.rejected = 0 # Responses rejected locally
+        self.deferred = 0 # Responses left to GPT
+
+    # Function to score how well a response matches the expected answer, from 0 to 1
+    def score(self, question, correct_answer, user_response): # Define the score function
+        response_words = content_words(user_response) # Content words of the response
+        answer_words = content_words(correct_answer) # Content words of the expected answer
+        if not response_words or not answer_words: # Check if either side has nothing to compare
+            return 0.0 # No match
+
+        # Words the question already gives away do not show understanding, so they are left out of the coverage
+        question_words = set(content_words(question)) # Content words of the question
+        keywords = set(answer_words) - question_words or set(answer_words) # Words the response should bring in
+        coverage = len(keywords & set(response_words)) / len(keywords) # Fraction of the keywords the response covers
+
+        sentences = [content_words(sentence) for sentence in SENTENCE_PATTERN.split(question or "")] # The question's sentences as documents
+        cosine = tfidf_cosine(response_words, answer_words, sentences + [answer_words, response_words]) # TF-IDF cosine between the response and the answer
+        token_set = fuzz.token_set_ratio(" ".join(response_words), " ".join(answer_words)) / 100 # Word overlap ignoring order and repetition
+
+        return 0.4 * cosine + 0.4 * coverage + 0.2 * token_set # Blend the three signals
+
+    # Function to check if a response restates the expected answer nearly word for word
+    def verbatim(self, correct_answer, user_response): # Define the verbatim function
+        response_words = content_words(user_response) # Content words of the response
+        answer_words = content_words(correct_answer) # Content words of the expected answer
+        if not response_words or not answer_words: # Check if either side has nothing to compare
+            return False # Nothing to match
+        return fuzz.ratio(" ".join(response_words), " ".join(answer_words)) >= PREGRADE_VERBATIM # Compare the stemmed words in order
+
+    # Function to grade a scenario answer locally, returning (correct, feedback) or None when GPT should decide
+    def grade(self, question_data, user_response): # Define the grade function with the question_data and user_response parameters
+        correct_answer = question_data.get('correct_answer') or question_data.get('answer') or "" # Expected answer parsed from the question
+        verdict = None # Local verdict, None while undecided
+
+        response_words = content_words(user_response) # Content words of the response
+        if not response_words: # Check if the response is empty or only filler words
+            verdict = (False, "Incorrect: please answer in a complete sentence that explains your reasoning.") # Reject it
+        elif correct_answer and self.verbatim(correct_answer, user_response): # Check if the response restates the expected answer
+            verdict = (True, f"Correct! Your answer matches the expected answer: {correct_answer}") # Accept it
+        elif len(response_words) < PREGRADE_MIN_WORDS: # Short answers that are not verbatim are too ambiguous to settle locally
+            pass # Leave them to GPT
+        elif correct_answer: # Only score when there is an expected answer to compare with
+            score = self.score(question_data.get('question', ''), correct_answer, user_response) # Score the response
+            if score >= self.accept: # Check if the response clearly matches
+                verdict = (True, f"Correct! Your answer matches the expected answer: {correct_answer}") # Accept it
+            elif score <= self.reject: # Check if the response clearly misses
+                verdict = (False, f"Incorrect: your answer does not address the scenario. Expected answer: {correct_answer}") # Reject it
+
+        with self.lock: # Guard the counters
+            if verdict is None: # Check if GPT has to decide
+                self.deferred += 1 # Count the deferred response
+            elif verdict[0]: # Check if the response was accepted
+                self.accepted += 1 # Count the accepted response
+            else: # The response was rejected
+                self.rejected += 1 # Count the rejected response
+        return verdict # Return the verdict
+
+    # Function to report how many GPT calls the pre-grader avoided
+    def stats(self): # Define the stats function
+        with self.lock: # Guard the counters
+            total = self.accepted + self.rejected + self.deferred # Responses graded
+            return { # Return the counters
+                "accepted": self.accepted, # Responses accepted locally
+                "rejected": self.rejected, # Responses rejected locally
+                "deferred": self.deferred, # Responses left to GPT
+                "avoided": (self.accepted + self.rejected) / total if total else 0.0, # Fraction of GPT calls avoided
+            }
+
+pregrader = PreGrader() # Shared pre-grader used by the question screen
@@ -3,109 +3,314 @@ import os # Import the os module for environment variables
 import random   # Import the random module for random number generation
 from colorama import Fore   # Import the Fore class from the colorama module for colored output
 from config import chapters # Import the chapters dictionary from the config module for lesson details
-from openai import OpenAI  # Import the OpenAI class from the openai module for interacting with the OpenAI API
-from fuzzywuzzy import fuzz # Import the fuzz function from the fuzzywuzzy module for string similarity comparison
+from cassette import open_backend # Import the open_backend function to create the configured backend, recording or replaying its responses
+from llm_gateway import RequestGateway # Import the RequestGateway class to rate limit and retry every API call
+from telemetry import LLMCall, record_call # Import the telemetry helpers to record token usage and latency for every API call
+from code_grader import verify_test_cases # Import the test case verifier to check generated tests against the sample solution
+from verdict_cache import verdict_cache, verdict_key # Import the verdict cache so repeated answers skip the API
+from response_parser import ParseError, parse_question # Import the response parser to turn question responses into question data
+from seen_questions import SeenQuestionStore # Import the SeenQuestionStore class to remember served questions per user and chapter
 import re # Import the re module for regular expressions operations
 import sqlite3 # Import the sqlite3 module for database operations 
+import database # Import the database module for the shared connections and so every table exists before it is used
+import repository # Import the repository module for the lesson content and mistake queries
+from write_behind import write_buffer # Import the shared write buffer to flush mistakes before reading them
+from content_pack import open_content_pack # Import the open_content_pack function to serve pre-generated content
+import json # Import the json module to read structured question batches
+import hashlib # Import the hashlib module to key lesson digests by content
+import time # Import the time module to measure grading latency
+import threading # Import the threading module to guard shared state between worker threads
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError # Import the thread pool helpers to send API requests in parallel and stop waiting at a deadline
 
 # Load the environment variables
 load_dotenv()
 
-api_key = os.getenv("OPENAI_API_KEY") # Retrieve the OpenAI API key from the environment variables
+backend = open_backend() # Create the backend chosen by LLM_BACKEND, the OpenAI API by default, wrapped by any cassette
+client = backend.client # Client with the OpenAI chat completions interface
+gateway = RequestGateway(client) # Every API call goes through the gateway for rate limits, retries, and deadlines
+
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "4")) # Maximum number of question requests sent to the API at the same time
+MODEL = backend.model # Model used for every request
+LESSON_MODEL = MODEL # Model used to generate lesson content, part of the shared content key so each model keeps its own lessons
+LESSON_PROMPT_VERSION = 1 # Bump when the lesson prompt changes so old shared content is no longer served
+LESSON_CONTENT_VARIANTS = max(1, int(os.getenv("LESSON_CONTENT_VARIANTS", "3"))) # Number of shared versions kept for each lesson
+LESSON_CONTENT_UNAVAILABLE = "Unable to retrieve or generate lesson content." # Message returned when no lesson content can be produced
+CUMULATIVE_REVIEW_CONCURRENCY = int(os.getenv("CUMULATIVE_REVIEW_CONCURRENCY", "8")) # Maximum number of lessons processed at the same time in the cumulative review
+BATCH_QUESTION_GENERATION = os.getenv("BATCH_QUESTION_GENERATION", "true").lower() == "true" # Ask for all of a lesson's questions in one JSON request by default
+BATCH_TOKENS_PER_QUESTION = 300 # Token allowance per question in a batched request
+QUESTION_DEADLINE = float(os.getenv("QUESTION_DEADLINE", "30")) # Seconds a question request may take, including retries
+VALIDATION_DEADLINE = float(os.getenv("VALIDATION_DEADLINE", "20")) # Seconds an answer validation may take, including retries, while the learner waits
+GENERATION_ATTEMPTS_PER_QUESTION = int(os.getenv("GENERATION_ATTEMPTS_PER_QUESTION", "3")) # Question requests allowed per question asked for, before giving up
+GENERATION_DEADLINE = float(os.getenv("GENERATION_DEADLINE", "90")) # Seconds a lesson's question set may take to generate
+LESSON_DIGEST = os.getenv("LESSON_DIGEST", "true").lower() == "true" # Put condensed lesson notes in question prompts instead of the full lesson
+LESSON_DIGEST_MIN_CHARS = int(os.getenv("LESSON_DIGEST_MIN_CHARS", "1200")) # Lessons shorter than this go into question prompts as they are
+LESSON_DIGEST_WORDS = 150 # Longest digest the model is asked for
+DIGEST_PROMPT_VERSION = 1 # Bump when the digest prompt changes so old digests are no longer served
+
+content_pack = open_content_pack() # Load the pre-generated content pack if one has been built
+
+stored_questions = SeenQuestionStore()  # Store seen questions per user and chapter, persisted across sessions
 
-client = OpenAI(api_key=api_key) # Create an OpenAI client with the API key
+# Function to determine if a question is unique based on a similarity threshold
+def is_question_unique(new_question, threshold=70, user_id=None, chapter=None): # Set the default threshold to 70
+    return not stored_questions.has_similar(new_question, user_id, chapter, threshold) # Compare against the questions already served in this scope
 
-stored_questions = set()  # Store seen questions globally
+# Function to store the question in the user's chapter scope
+def store_question(question_text, user_id=None, chapter=None): # Define the store_question function with the question_text, user_id, and chapter parameters
+    stored_questions.add(question_text, user_id, chapter) # Add the question to the scope and persist it
 
-# Function to determine if a question is unique based on a similarity threshold
-def is_question_unique(new_question, threshold=70): # Set the default threshold to 70
-    for stored_question in stored_questions: # Iterate over the stored questions
-        similarity = fuzz.ratio(new_question.lower(), stored_question.lower()) # Calculate the similarity ratio
-        if similarity > threshold: # Check if the similarity is above the threshold
-            return False # Return False if the question is not unique
-    return True # Return True if the question is unique
-
-# Function to store the question in the global set
-def store_question(question_text): # Define the store_question function with the question_text parameter
-    stored_questions.add(question_text) # Add the question to the stored questions set
-
-# Function to reset the similarity database 
-def reset_similarity_database(): # Define the reset_similarity_database function
-    global stored_questions # Access the global stored_questions set
-    stored_questions.clear() # Clear the stored questions set
+# Function to reset the similarity database for a user, a chapter, or everything
+def reset_similarity_database(user_id=None, chapter=None): # Define the reset_similarity_database function with the user_id and chapter parameters
+    stored_questions.invalidate(user_id, chapter) # Forget the seen questions in the matching scopes
 
 # Function to generate lesson content or retrieve it from the database
 def generate_lesson_content(progress, chapter, lesson): # Define the generate_lesson_content function with the progress, chapter, and lesson parameters
     try: # Try block to handle exceptions
-        # Check if the lesson content is already stored in the database
-        with sqlite3.connect('progress.db') as conn: # Connect to the database
-            cursor = conn.cursor() # Create a cursor object
-            cursor.execute( # Execute a query to retrieve the stored content
-                '''
-                SELECT content
-                FROM lesson_content
-                WHERE user_id = ? AND chapter = ? AND lesson = ?
-                ''',
-                (progress.user_id, chapter, lesson) # Provide the user ID, chapter, and lesson as parameters
-            )
-            row = cursor.fetchone() # Fetch the row from the database
-            if row: # Check if the row is not empty
-                return row[0]  # Return the stored content 
+        lesson_content, variant = find_lesson_content(progress, chapter, lesson) # Check the stored content first
+        if lesson_content: # Check if the content was found
+            return lesson_content # Return the stored content
 
-        chapter_title = chapters[chapter]["title"] # Retrieve the chapter title
-        lesson_title = chapters[chapter]["lessons"][lesson]["title"] # Retrieve the lesson title
+        lesson_content = request_lesson_content(chapter, lesson) # Generate the lesson content with the API
+        store_shared_lesson_content(chapter, lesson, variant, lesson_content) # Store the generated content for other users
 
-        prompt = ( # Define the prompt string
-            f"Provide an educational and engaging lesson on the following topic:\n" # Include the prompt for the lesson content
-            f"Chapter: {chapter_title}\n" # Include the chapter title
-            f"Lesson: {lesson_title}\n" # Include the lesson title
-            f"The lesson should include 2-3 paragraphs explaining the concept, examples, " # Include the requirements for the lesson content
-            f"and key points to remember." # Include the requirements for the lesson content
+        return lesson_content # Return the generated lesson content
+
+    except Exception as e: # Catch any exceptions
+        return LESSON_CONTENT_UNAVAILABLE # Return a default message
+
+# Function to stream lesson content as it is generated, yielding text chunks
+def generate_lesson_content_stream(progress, chapter, lesson): # Define the generate_lesson_content_stream function with the progress, chapter, and lesson parameters
+    chunks = [] # Initialize an empty list to collect the streamed text
+    call = None # Call record, created once an API call is made
+    try: # Try block to handle exceptions
+        lesson_content, variant = find_lesson_content(progress, chapter, lesson) # Check the stored content first
+        if lesson_content: # Check if the content was found
+            yield lesson_content # Stored content arrives as a single chunk
+            return # Nothing to generate
+
+        call = LLMCall("lesson_stream", chapter, lesson) # Record the call's usage and latency
+        started = time.monotonic() # Time the whole stream, not just its first chunk
+        response = gateway.create( # Call the OpenAI API through the gateway to stream the lesson content
+            call=call, # Fill in the call record
+            model=LESSON_MODEL, # Use the lesson model
+            messages=build_lesson_messages(chapter, lesson), # Define the messages to send to the API
+            temperature=0.7, # Set the temperature to 0.7 
+            max_tokens=1000, # Limit the token count for the response
+            stream=True, # Receive the content in chunks as it is generated
+            stream_options={"include_usage": True} # Report the token usage with the last chunk
         )
 
-        response = client.chat.completions.create( # Call the OpenAI API to generate the lesson content
-            model="gpt-3.5-turbo", # Use the GPT-3.5-turbo model
-            messages=[{"role": "system", "content": "You are a Python tutor."}, # Define the system message
-                      {"role": "user", "content": prompt}], # Define the user message
+        for chunk in response: # Iterate over the streamed chunks
+            call.set_usage(getattr(chunk, "usage", None)) # The last chunk carries the token usage
+            if not chunk.choices: # Check if the chunk carries no content
+                continue # Skip the chunk
+            text = chunk.choices[0].delta.content # Extract the new text
+            if text: # Check if the chunk has text
+                chunks.append(text) # Collect the text for storage
+                yield text # Hand the text to the caller straight away
+
+        # Store the full text only once the stream has completed
+        lesson_content = "".join(chunks).strip() # Join the streamed text
+        if lesson_content: # Check if the stream produced any text
+            store_shared_lesson_content(chapter, lesson, variant, lesson_content) # Store the generated content for other users
+        else: # The stream ended without text
+            yield LESSON_CONTENT_UNAVAILABLE # Return a default message instead of storing an empty lesson
+
+    except Exception as e: # Catch any exceptions
+        if call is not None and call.error is None: # Check if the stream failed after the gateway returned it
+            call.error = f"{type(e).__name__}: {e}" # Record the error
+        if not chunks: # Check if nothing was streamed yet
+            yield LESSON_CONTENT_UNAVAILABLE # Return a default message
+
+    finally: # Record the call however the stream ended
+        if call is not None: # Check if an API call was made
+            call.latency = time.monotonic() - started # Time the whole stream
+            record_call(call) # Record the call
+
+# Function to group streamed lesson text into paragraphs, yielding each one as soon as it is complete
+def iter_lesson_parts(chunks): # Define the iter_lesson_parts function with the chunks parameter
+    buffer = "" # Text received since the last complete paragraph
+    for chunk in chunks: # Iterate over the streamed chunks
+        buffer += chunk # Add the chunk to the buffer
+        while "\n\n" in buffer: # Check if a paragraph break has arrived
+            part, buffer = buffer.split("\n\n", 1) # Split off the complete paragraph
+            if part.strip(): # Skip empty paragraphs
+                yield part.strip() # Yield the complete paragraph
+    if buffer.strip(): # Check if the last paragraph has text
+        yield buffer.strip() # Yield the last paragraph
+
+# Function to look up stored lesson content, returning the content (or None) and the user's shared variant
+def find_lesson_content(progress, chapter, lesson): # Define the find_lesson_content function with the progress, chapter, and lesson parameters
+    variant = (progress.user_id or 0) % LESSON_CONTENT_VARIANTS # Pick the shared variant this user is always served
+
+    # Check for a per-user override first, then the shared content, in one indexed query
+    stored = repository.find_lesson_content(progress.user_id, chapter, lesson, LESSON_PROMPT_VERSION, LESSON_MODEL, variant) # Look up the stored content
+
+    if stored and stored.user_id is not None: # Check if the user has an override
+        return stored.content, variant # Return the override
+
+    if content_pack: # Check if a content pack is loaded
+        pack_content = content_pack.lesson_content(chapter, lesson) # Look up the lesson in the pack
+        if pack_content: # Check if the pack has the lesson
+            return pack_content, variant # Return the pre-generated content
+
+    return (stored.content if stored else None), variant # Return the shared content, or None if the lesson was never generated
+
+# Function to store generated lesson content in the shared tier so other users with this variant reuse it
+def store_shared_lesson_content(chapter, lesson, variant, content): # Define the store_shared_lesson_content function with the chapter, lesson, variant, and content parameters
+    repository.store_shared_lesson_content(chapter, lesson, LESSON_PROMPT_VERSION, LESSON_MODEL, variant, content) # Store the content under its curriculum position, prompt version, model, and variant
+
+# Function to build the messages that ask the API for a lesson
+def build_lesson_messages(chapter, lesson): # Define the build_lesson_messages function with the chapter and lesson parameters
+    chapter_title = chapters[chapter]["title"] # Retrieve the chapter title
+    lesson_title = chapters[chapter]["lessons"][lesson]["title"] # Retrieve the lesson title
+
+    prompt = ( # Define the prompt string
+        f"Provide an educational and engaging lesson on the following topic:\n" # Include the prompt for the lesson content
+        f"Chapter: {chapter_title}\n" # Include the chapter title
+        f"Lesson: {lesson_title}\n" # Include the lesson title
+        f"The lesson should include 2-3 paragraphs explaining the concept, examples, " # Include the requirements for the lesson content
+        f"and key points to remember." # Include the requirements for the lesson content
+    )
+
+    return [{"role": "system", "content": "You are a Python tutor."}, # Define the system message
+            {"role": "user", "content": prompt}] # Define the user message
+
+# Function to request new lesson content from the OpenAI API
+def request_lesson_content(chapter, lesson): # Define the request_lesson_content function with the chapter and lesson parameters
+    call = LLMCall("lesson", chapter, lesson) # Record the call's usage and latency
+    try: # Try block to make sure the call is recorded
+        response = gateway.create( # Call the OpenAI API through the gateway to generate the lesson content
+            call=call, # Fill in the call record
+            model=LESSON_MODEL, # Use the lesson model
+            messages=build_lesson_messages(chapter, lesson), # Define the messages to send to the API
             temperature=0.7, # Set the temperature to 0.7 
             max_tokens=1000 # Limit the token count for the response
         )
+    finally: # Record the call whether or not it succeeded
+        record_call(call) # Record the call
+
+    return response.choices[0].message.content.strip() # Extract the content from the API response
+
+lesson_digests = {} # Digests already loaded or generated, keyed by content hash
+lesson_digests_lock = threading.Lock() # Lock to share the digests between worker threads
+
+# Function to build the messages that ask the API to condense a lesson for question prompts
+def build_digest_messages(content): # Define the build_digest_messages function with the content parameter
+    prompt = ( # Define the prompt string
+        f"Condense the lesson below into study notes for writing quiz questions. " # Include the digest instructions
+        f"Keep every concept, rule, keyword, and code example a question could ask about, and drop greetings, repetition, and filler. " # Include what to keep and drop
+        f"Use short bullet points and at most {LESSON_DIGEST_WORDS} words.\n\n" # Include the length limit
+        f"\"{content}\"" # Include the lesson content
+    )
+    return [{"role": "system", "content": "You are a Python tutor."}, # Define the system message
+            {"role": "user", "content": prompt}] # Define the user message
+
+# Function to get the condensed notes for a lesson, generating and storing them once per lesson content
+def get_lesson_digest(chapter, lesson, content): # Define the get_lesson_digest function with the chapter, lesson, and content parameters
+    if not LESSON_DIGEST or not content or len(content) < LESSON_DIGEST_MIN_CHARS: # Check if the lesson is short enough to use as it is
+        return content # Use the full lesson
+
+    content_hash = hashlib.sha256(content.strip().encode("utf-8")).hexdigest() # Key the digest by the lesson content, so edited lessons get a new digest
+    with lesson_digests_lock: # Guard the loaded digests
+        if content_hash in lesson_digests: # Check if the digest is already loaded
+            return lesson_digests[content_hash] # Return the loaded digest
+
+    with database.connect() as conn: # Connect to the database
+        row = conn.execute( # Look up the stored digest
+            'SELECT digest FROM lesson_digests WHERE content_hash = ? AND prompt_version = ? AND model = ?',
+            (content_hash, DIGEST_PROMPT_VERSION, MODEL) # Provide the content hash, prompt version, and model as parameters
+        ).fetchone()
+
+    if row: # Check if the digest was stored
+        digest = row[0] # Use the stored digest
+    else: # The lesson has no digest yet
+        call = LLMCall("digest", chapter, lesson) # Record the call's usage and latency
+        try: # Try block to handle exceptions
+            response = gateway.create( # Call the OpenAI API through the gateway to condense the lesson
+                call=call, # Fill in the call record
+                deadline=QUESTION_DEADLINE, # Questions are waiting on the digest
+                model=MODEL, # Use the configured model
+                messages=build_digest_messages(content), # Define the messages to send to the API
+                temperature=0, # Keep the digest stable
+                max_tokens=LESSON_DIGEST_WORDS * 2 # Allow enough tokens for the word limit
+            )
+            digest = response.choices[0].message.content.strip() # Extract the digest from the API response
+        except Exception as e: # Catch any exceptions, the gateway has already retried
+            print(f"Lesson digest request failed, using the full lesson: {e}") # Log the error
+            return content # Fall back to the full lesson
+        finally: # Record the call whether or not it succeeded
+            record_call(call) # Record the call
+
+        if not digest or len(digest) >= len(content): # Check if the digest saves nothing
+            digest = content # Keep using the full lesson
+        with database.connect() as conn: # Connect to the database
+            conn.execute( # Store the digest for every later question set on this lesson
+                'INSERT OR IGNORE INTO lesson_digests (content_hash, prompt_version, model, digest) VALUES (?, ?, ?, ?)',
+                (content_hash, DIGEST_PROMPT_VERSION, MODEL, digest) # Provide the content hash, prompt version, model, and digest as parameters
+            )
 
-        lesson_content = response.choices[0].message.content.strip() # Extract the content from the API response
-
-        # Store the generated content in the database
-        with sqlite3.connect('progress.db') as conn: # Connect to the database
-            cursor = conn.cursor() # Create a cursor object
-            cursor.execute( # Execute a query to store the generated content
-                '''
-                INSERT INTO lesson_content (user_id, chapter, lesson, content) 
-                VALUES (?, ?, ?, ?)
-                ''',
-                (progress.user_id, chapter, lesson, lesson_content) # Provide the user ID, chapter, lesson, and content as parameters
-            ) 
-            conn.commit() # Commit the transaction
+    with lesson_digests_lock: # Guard the loaded digests
+        lesson_digests[content_hash] = digest # Remember the digest
+    return digest # Return the digest
 
-        return lesson_content # Return the generated lesson content
+# Function to store a lesson that only this user will see, overriding the shared content
+def set_lesson_override(progress, chapter, lesson, content): # Define the set_lesson_override function with the progress, chapter, lesson, and content parameters
+    repository.set_lesson_override(progress.user_id, chapter, lesson, content) # Store the override
 
-    except Exception as e: # Catch any exceptions
-        return "Unable to retrieve or generate lesson content." # Return a default message
+# Function to remove a user's override so the shared content is served again
+def clear_lesson_override(progress, chapter, lesson): # Define the clear_lesson_override function with the progress, chapter, and lesson parameters
+    repository.clear_lesson_override(progress.user_id, chapter, lesson) # Delete the override
+
+# Class for a generated question set, a list that also says why it came up short
+class QuestionSet(list): # Define the QuestionSet class
+
+    # Initialize the QuestionSet class
+    def __init__(self, requested): # Define the constructor with the requested parameter
+        super().__init__() # Start with no questions
+        self.requested = requested # Number of questions asked for
+        self.reason = None # Why the set has fewer questions than requested, None when it is complete
+        self.attempts = 0 # Question requests sent to the API
+        self.from_fallback = 0 # Questions served from the fallback pool
 
 # Function to generate questions based on the lesson content
-def generate_questions_from_content(chapter, lesson, content, question_count, max_retries=2): # Define the generate_questions_from_content function with the chapter, lesson, content, question_count, and max_retries parameters
-    questions = []  # Initialize an empty list to store the questions
+def generate_questions_from_content(chapter, lesson, content, question_count, max_retries=2, max_workers=None, batched=None, use_pack=True, from_review_pool=False, user_id=None): # Define the generate_questions_from_content function with the chapter, lesson, content, question_count, max_retries, max_workers, batched, use_pack, from_review_pool, and user_id parameters
+    questions = QuestionSet(question_count)  # Initialize an empty question set to store the questions
     allowed_types = determine_question_types(chapters[chapter]['lessons'][lesson]['title'].lower()) # Determine the allowed question types based on the lesson title and store in allowed_types
+    expires = time.monotonic() + GENERATION_DEADLINE # Time by which the set must be ready, whatever happens
+    max_attempts = question_count * GENERATION_ATTEMPTS_PER_QUESTION # Question requests allowed for the whole set
+    fallback_pool = [] # Valid questions turned away as repeats, served if the budget runs out
+
+    if use_pack and content_pack: # Serve pre-generated questions from the content pack first
+        bank = content_pack.questions(chapter, lesson, review=from_review_pool) # Load the lesson bank or review pool
+        random.shuffle(bank) # Shuffle so repeat visits see different questions
+        for question_data in bank: # Iterate over the pre-generated questions
+            if len(questions) >= question_count: # Check if enough questions were accepted
+                break # Stop taking questions from the pack
+            if is_question_unique(question_data["question"], user_id=user_id, chapter=chapter): # Check if the question is unique
+                questions.append(question_data) # Append the question data to the questions list
+                store_question(question_data["question"], user_id, chapter) # Store the question to avoid duplicates
+            else: # The user has seen a similar question before
+                fallback_pool.append(question_data) # Keep it in case nothing new can be generated
+
+        # Only the questions the pack could not supply are generated below
+
+    notes = get_lesson_digest(chapter, lesson, content) if len(questions) < question_count else content # Condensed lesson used in every question prompt
 
     #function to send request to OpenAI API with retries
-    def send_request_with_retries(prompt, retries_left): # Define the send_request_with_retries function with the prompt and retries_left parameters
+    def send_request_with_retries(prompt, retries_left, max_tokens=400, call=None): # Define the send_request_with_retries function with the prompt, retries_left, max_tokens, and call parameters
         try: # Try block to handle exceptions
-            response = client.chat.completions.create( # Call the OpenAI API to generate the content
-                model="gpt-3.5-turbo", # Use the GPT-3.5-turbo model 
+            response = gateway.create( # Call the OpenAI API through the gateway, which retries with backoff
+                call=call, # Fill in the call record
+                max_retries=retries_left, # Retry transient failures up to the caller's limit
+                deadline=max(0.0, min(QUESTION_DEADLINE, expires - time.monotonic())), # Give up once the request or the set deadline passes
+                model=MODEL, # Use the configured model
                 messages=[  # Define the messages to send to the API
                     {"role": "system", "content": "You are a Python tutor."}, # Define the system message
                     {"role": "user", "content": prompt} # Define the user message
                 ],
                 temperature=0.7, # Set the temperature to 0.7 for diversity
-                max_tokens=400 # Limit the token count for the response
+                max_tokens=max_tokens # Limit the token count for the response
             )
 
             if not response or not response.choices: # Check if the response is empty or improperly formatted
@@ -113,40 +318,119 @@ def generate_questions_from_content(chapter, lesson, content, question_count, ma
 
             return response.choices[0].message.content.strip() # Return the content from the API response
 
-        except Exception as e: # Catch any exceptions
-            if retries_left > 0: # Check if there are retries left
-                return send_request_with_retries(prompt, retries_left - 1) # Retry the request
-            else: # If no retries left
-                return None # Return None
-
-    while len(questions) < question_count: # Loop until the desired number of questions is generated
-        try: # Try block to handle exceptions
-            question_type = random.choice(allowed_types)  # Random question type
-            prompt = ( # Define the prompt string
-                f"Based on the content below, generate a unique and non-repetitive {question_type} question:\n" # Prompt to generate a unique question
-                f"\"{content}\"\n" # Include the lesson content in the prompt
-                f"Ensure it covers a specific aspect of the lesson and is distinct from other potential questions." # Include the requirements for the question
-                f"\n{build_prompt(chapter, lesson, question_type)}" # Include the generated prompt based on the question type
-            )
-
-            question_text = send_request_with_retries(prompt, max_retries) # Send the request to the API with retries
-
-            if not question_text: # Check if the question text is empty
-                continue  # Try generating another question
+        except Exception as e: # Catch any exceptions, the gateway has already retried
+            print(f"Question request failed: {e}") # Log the error
+            return None # Return None
 
-            question_data = parse_response(question_text, question_type) # Parse the response to extract the question data
+    # Function to request and parse a single question, run on a worker thread
+    def request_question(question_type): # Define the request_question function with the question_type parameter
+        # The lesson notes come first and the question type last, so every prompt for this lesson shares the same prefix for provider-side caching
+        prompt = ( # Define the prompt string
+            f"Lesson notes:\n\"{notes}\"\n\n" # Include the condensed lesson content in the prompt
+            f"Based on the lesson notes above, generate a unique and non-repetitive {question_type} question. " # Prompt to generate a unique question
+            f"Ensure it covers a specific aspect of the lesson and is distinct from other potential questions." # Include the requirements for the question
+            f"\n{build_prompt(chapter, lesson, question_type)}" # Include the generated prompt based on the question type
+        )
 
-            if question_data and "question" in question_data and is_question_unique(question_data["question"]): # Check if the question data is valid and the question is unique
+        call = LLMCall("question", chapter, lesson, question_type) # Record the call's usage, latency, and parse result
+        question_text = send_request_with_retries(prompt, max_retries, call=call) # Send the request to the API with retries
+
+        question_data = None # Parsed question, None if the request or parsing failed
+        if question_text: # Check if the request returned text
+            try: # Try block to handle responses that cannot be parsed
+                question_data = verify_code_question(parse_question(question_text, question_type)) # Parse the response and verify any test cases on this worker thread
+            except ParseError as e: # Catch responses that cannot be parsed
+                print(f"Could not parse {question_type} question: {e}") # Log why, so prompt or parser fixes can target the cause
+            call.parse_failures = 0 if question_data else 1 # Record whether the response could be parsed
+        record_call(call) # Record the call
+        return question_data # Return the question data, None lets the caller request another question
+
+    if batched is None: # Check if the caller left the mode to the configuration
+        batched = BATCH_QUESTION_GENERATION # Use the configured generation mode
+
+    if batched and len(questions) < question_count: # Ask for the rest of the set in one request first
+        questions.attempts += 1 # The batch counts as one attempt
+        question_types = [random.choice(allowed_types) for _ in range(question_count - len(questions))] # Pick the question type mix up front
+        batch_prompt = build_batch_prompt(chapter, lesson, notes, question_types) # Build one prompt covering every question
+        call = LLMCall("question_batch", chapter, lesson, "batch") # Record the call's usage, latency, and parse results
+        batch_text = send_request_with_retries( # Send the batched request to the API with retries
+            batch_prompt, max_retries, max_tokens=BATCH_TOKENS_PER_QUESTION * question_count, call=call # Allow enough tokens for the whole array
+        )
+        batch_questions = parse_batch_response(batch_text, allowed_types) # Keep the questions that pass validation
+        if batch_text: # Check if the request returned text
+            call.parse_failures = max(0, len(question_types) - len(batch_questions)) # Record the questions that were missing or invalid
+        record_call(call) # Record the call
+
+        for question_data in batch_questions: # Iterate over the questions that passed validation
+            if len(questions) >= question_count: # Check if enough questions were already accepted
+                break # Ignore any extra questions
+            verify_code_question(question_data) # Drop test cases the sample solution fails
+            if is_question_unique(question_data["question"], user_id=user_id, chapter=chapter): # Check if the question is unique
                 questions.append(question_data) # Append the question data to the questions list
-                store_question(question_data["question"])   # Store the question to avoid duplicates
-            else: # If the question is not unique
-                continue  # Skip duplicates or invalid questions
-
-        except Exception as e: # Catch any exceptions
-            print(f"Error generating question: {e}") # Log the error
+                store_question(question_data["question"], user_id, chapter) # Store the question to avoid duplicates
+            else: # The question is a repeat
+                fallback_pool.append(question_data) # Keep it in case nothing new can be generated
+
+        # Any question that failed validation or was a duplicate is topped up with single-question requests below
+
+    worker_count = max(1, max_workers or MAX_CONCURRENT_REQUESTS) # Use the configured concurrency limit unless one is passed in
+
+    executor = ThreadPoolExecutor(max_workers=worker_count) # Create a thread pool to send the requests in parallel
+    try: # Try block to make sure the pool is shut down
+        while len(questions) < question_count: # Loop until the desired number of questions is generated or the budget runs out
+            remaining = expires - time.monotonic() # Seconds left before the deadline
+            if remaining <= 0: # Check if the deadline has passed
+                questions.reason = f"deadline of {GENERATION_DEADLINE:.0f}s reached" # Record why the set is short
+                break # Stop generating
+            if questions.attempts >= max_attempts: # Check if the attempts are used up
+                questions.reason = f"all {max_attempts} attempts used" # Record why the set is short
+                break # Stop generating
+
+            # Request every missing question at once, choosing a random allowed type for each, within the attempts left
+            request_count = min(question_count - len(questions), max_attempts - questions.attempts) # Requests to send this round
+            questions.attempts += request_count # Count the attempts
+            futures = [ # Submit one request per missing question
+                executor.submit(request_question, random.choice(allowed_types)) # Random question type
+                for _ in range(request_count) # One request for each question still needed
+            ]
+
+            try: # Try block to stop waiting at the deadline
+                for future in as_completed(futures, timeout=remaining): # Handle the responses in the order they arrive
+                    try: # Try block to handle exceptions
+                        question_data = future.result() # Get the parsed question data from the worker
+
+                        # Check uniqueness here, on one thread, so parallel results cannot slip past each other
+                        if not question_data or "question" not in question_data: # Check if the request or parsing failed
+                            continue # Skip invalid questions
+                        if len(questions) < question_count and is_question_unique(question_data["question"], user_id=user_id, chapter=chapter): # Check if the question is still needed and unique
+                            questions.append(question_data) # Append the question data to the questions list
+                            store_question(question_data["question"], user_id, chapter)   # Store the question to avoid duplicates
+                        else: # The question is a repeat
+                            fallback_pool.append(question_data) # Keep it in case nothing new can be generated
+
+                    except Exception as e: # Catch any exceptions
+                        print(f"Error generating question: {e}") # Log the error
+            except FuturesTimeoutError: # The deadline passed with requests still running
+                questions.reason = f"deadline of {GENERATION_DEADLINE:.0f}s reached" # Record why the set is short
+                break # Stop waiting, the running requests finish in the background
+    finally: # Always release the pool
+        executor.shutdown(wait=False, cancel_futures=True) # Drop queued requests without waiting for running ones
 
     if len(questions) < question_count: # Check if not enough questions were generated
-        print("Not enough unique questions generated.") # Log a warning message
+        seen_texts = {question_data["question"].strip().lower() for question_data in questions} # Questions already in the set
+        for question_data in fallback_pool: # Serve repeats rather than too few questions
+            if len(questions) >= question_count: # Check if the set is full
+                break # Stop taking fallback questions
+            if question_data["question"].strip().lower() not in seen_texts: # Never put the same question in the set twice
+                seen_texts.add(question_data["question"].strip().lower()) # Remember the question
+                questions.append(question_data) # Append the fallback question
+                questions.from_fallback += 1 # Count the fallback question
+
+    if len(questions) < question_count: # Check if the set is still short
+        print(f"Not enough unique questions generated: {len(questions)} of {question_count}, {questions.reason}.") # Log a warning message
+    elif questions.reason: # The fallback pool filled the set
+        print(f"Question generation stopped early ({questions.reason}), {questions.from_fallback} questions served from the fallback pool.") # Log the fallback
+        questions.reason = None # The set is complete
 
     return questions # Return the generated questions
 
@@ -230,260 +514,151 @@ def build_prompt(chapter, lesson, question_type): # Define the build_prompt func
             f"    if n == 0:\n" # Include a sample solution
             f"        return 1\n" # Include a sample solution
             f"    return n * factorial(n - 1)\n" # Include a sample solution
-            f"```\n" # End the code block
-            f"Now, generate a new coding challenge with a task description and sample solution." # Include the task description
+            f"```\n\n" # End the code block
+            f"Test Cases:\n" # Include the test cases section in the prompt
+            f"assert factorial(0) == 1\n" # Include a sample test case
+            f"assert factorial(5) == 120\n\n" # Include a sample test case
+            f"Now, generate a new coding challenge with a task description, sample solution, and three to five test cases. " # Include the task description
+            f"Each test case must be a single assert statement that calls the solution." # Include the test case requirements
         )
     else: # If the question type is unknown
         raise ValueError(f"Unknown question type: {question_type}") # Raise a ValueError with the unknown question type
  
     return prompt # Return the generated prompt
 
-# Function to parse the response from the OpenAI API
-def parse_response(response_text, question_type): # Define the parse_response function with the response_text and question_type parameters
-    try: # Try block to handle exceptions
-        lines = response_text.split('\n') # Split the response text into lines
-        # Handle different question types
-        if question_type == "multiple_choice": # Check if the question type is 'multiple_choice'
-            return parse_multiple_choice(lines) # Parse the multiple-choice question
-        elif question_type == "fill_in_the_blank": # Check if the question type is 'fill_in_the_blank'
-            return parse_fill_in_the_blank(lines) # Parse the fill-in-the-blank question
-        elif question_type == "write_code": # Check if the question type is 'write_code'
-            return parse_code_challenge(lines) # Parse the code challenge question
-        elif question_type == "true_false": # Check if the question type is 'true_false'
-            return parse_true_false(lines) # Parse the true/false question
-        elif question_type == "scenario": # Check if the question type is 'scenario'
-            return parse_scenario(lines) # Parse the scenario-based question
-        else: # If the question type is unknown
-            return None # Return None
-    except Exception as e: # Catch any exceptions
-        return None # Return None
-
-# Function to parse a true/false question
-def parse_true_false(lines): # Define the parse_true_false function with the lines parameter
-
-    try: # Try block to handle exceptions
-        # Step 1: Clean and filter out empty lines 
-        cleaned_lines = [line.strip() for line in lines if line.strip()] # Clean and filter out empty lines
-
-        # Step 2: Extract the question
-        question = None # Initialize the question variable as None
-        for line in cleaned_lines: # Iterate over the cleaned lines
-            # Skip headers like '### TRUE/FALSE QUESTION'
-            if line.startswith("###") or "Chapter" in line or "Lesson" in line: # Check if the line contains headers
-                continue # Skip the header lines
-
-            # If we find a valid question line, set it as the question
-            if line.lower().startswith("question:"): # Check if the line starts with 'Question:'
-                question = line.split(":", 1)[-1].strip()  # Extract after 'Question:'
-            elif not question: # If the question is not set
-                question = line  # Fallback: take the first non-header line as the question
-
-        if not question: # Check if the question is empty
-            raise ValueError("Failed to extract a valid question.") # Raise a ValueError
-
-        # Step 3: Extract the correct answer from the last line
-        answer_line = cleaned_lines[-1].lower() # Extract the last line
-        correct_answer = "true" if "true" in answer_line else "false" # Extract the correct answer
-
-        # Step 4: Return the structured question data
-        return { # Return the structured question data
-            "type": "true_false", # Include the question type
-            "question": question, # Include the question text
-            "correct_answer": correct_answer, # Include the correct answer
-        } 
-    except Exception as e: # Catch any exceptions
-        return None # Return None
-
-# Function to parse a scenario-based question
-def parse_scenario(lines): # Define the parse_scenario function with the lines parameter
-
-    try:
-        scenario = [] # Initialize an empty list to store the scenario
-        answer = [] # Initialize an empty list to store the answer
-        current_section = None # Initialize the current_section variable as None
-
-        for line in lines: # Iterate over the lines
-            stripped = line.strip().lower() # Strip and convert to lowercase
-
-            if not stripped: # Check if the line is empty
-                continue # Skip empty lines
-
-            if re.match(r"(###\s*)?scenario\s*:", stripped): # Check if the line contains 'Scenario:'
-                current_section = "scenario" # Set the current section to 'scenario'
-                continue # Move to the next line
-            elif re.match(r"(###\s*)?correct\s*answer\s*:", stripped): # Check if the line contains 'Correct Answer:'
-                current_section = "answer" # Set the current section to 'answer'
-                continue # Move to the next line
-
-            if current_section == "scenario": # Check if the current section is 'scenario'
-                scenario.append(line.strip()) # Append the line to the scenario list
-            elif current_section == "answer": # Check if the current section is 'answer'
-                answer.append(line.strip()) # Append the line to the answer list
- 
-        scenario_text = " ".join(scenario).strip() # Join the scenario lines
-        correct_answer = " ".join(answer).strip() # Join the answer lines
-
-        if not scenario_text or not correct_answer: # Check if the scenario or answer text is empty
-            raise ValueError("Incomplete scenario: Missing answer.") # Raise a ValueError
+# Fields each question type must provide in a batched JSON response
+QUESTION_SCHEMAS = { # Map each question type to a short description of its JSON shape
+    "multiple_choice": '{"type": "multiple_choice", "question": "...", "options": {"A": "...", "B": "...", "C": "...", "D": "..."}, "correct_answer": "A"}', # Multiple choice shape
+    "true_false": '{"type": "true_false", "question": "...", "correct_answer": "True"}', # True/false shape
+    "fill_in_the_blank": '{"type": "fill_in_the_blank", "question": "... ________ ...", "correct_answer": "..."}', # Fill in the blank shape
+    "scenario": '{"type": "scenario", "question": "[describe the scenario]", "correct_answer": "[descriptive, multi-word answer]"}', # Scenario shape
+    "write_code": '{"type": "write_code", "question": "[task description]", "correct_answer": "[sample solution code]", "tests": ["assert [call] == [expected]", "..."]}', # Code challenge shape with assert statements that test the solution
+}
+
+# Function to build a prompt asking for several questions as one JSON array
+def build_batch_prompt(chapter, lesson, content, question_types): # Define the build_batch_prompt function with the chapter, lesson, content, and question_types parameters
+    chapter_title = chapters.get(chapter, {}).get('title', "General Python Knowledge") # Retrieve the chapter title with a fallback value
+    lesson_title = chapters.get(chapter, {}).get('lessons', {}).get(lesson, {}).get('title', "Fundamental Concepts") # Retrieve the lesson title with a fallback value
 
-        return { # Return the structured question data
-            "type": "scenario", # Include the question type
-            "question": scenario_text, # Include the scenario text
-            "correct_answer": correct_answer # Include the answer text
-        }
+    shapes = "\n".join(QUESTION_SCHEMAS[question_type] for question_type in sorted(set(question_types))) # Describe every question type that is requested
+    type_list = ", ".join(question_types) # List the requested type for each array item
+
+    # The lesson comes first and the requested types last, so prompts for the same lesson share a prefix for provider-side caching
+    prompt = ( # Define the prompt string
+        f"Lesson notes:\n\"{content}\"\n" # Include the lesson content in the prompt
+        f"Chapter: {chapter_title}\n" # Include the chapter title in the prompt
+        f"Lesson: {lesson_title}\n\n" # Include the lesson title in the prompt
+        f"Based on the lesson notes above, generate {len(question_types)} unique and non-repetitive questions. " # Prompt to generate the questions
+        f"Each question must cover a different aspect of the lesson.\n" # Include the requirements for the questions
+        f"Question types, in order: {type_list}\n\n" # Include the question type for each item
+        f"Respond with only a JSON array. Each item must use exactly one of these shapes:\n" # Ask for structured output
+        f"{shapes}\n" # Include the JSON shapes
+        f"Fill in the blank questions must contain '________' where the answer goes." # Include the blank marker requirement
+    )
+    return prompt # Return the generated prompt
 
-    except Exception as e:  # Catch any exceptions
-        return None # Return None
+# Function to parse a batched JSON response into validated question data
+def parse_batch_response(response_text, allowed_types): # Define the parse_batch_response function with the response_text and allowed_types parameters
+    if not response_text: # Check if the response text is empty
+        return [] # Nothing to parse
 
-# Function to parse a multiple-choice question
-def parse_multiple_choice(lines): # Define the parse_multiple_choice function with the lines parameter
+    text = response_text.strip() # Strip surrounding whitespace
+    text = re.sub(r'^```(?:json)?\s*|\s*```$', '', text) # Remove a markdown code fence around the JSON
 
     try: # Try block to handle exceptions
-        # Step 1: Clean each line and remove empty lines
-        cleaned_lines = [line.strip() for line in lines if line.strip()] # Clean and filter out empty lines
-
-        # Step 2: Filter out headers and unnecessary symbols
-        question_lines = [ # Filter out headers and unnecessary symbols
-            re.sub(r'^[#*>\-]+\s?', '', line)  # Remove common markdown symbols
-            for line in cleaned_lines  # Iterate over the cleaned lines
-            if not re.match(r'^(chapter|lesson|multiple[- ]?choice.*)$', line, re.IGNORECASE) # Filter out headers
-        ]
-
-        # Step 3: Initialize variables
-        question = [] # Initialize an empty list to store the question
-        options = {} # Store options as a dictionary
-        correct_answer = None # Initialize the correct answer as None
-
-        # Step 4: Extract the question, options, and correct answer
-        for line in question_lines: # Iterate over the question lines
-            # Detect options like 'A) Integer'
-            option_match = re.match(r'^([A-Da-d])\)\s*(.*)', line) # Match the option pattern
-            if option_match: # Check if the option pattern is matched
-                label = option_match.group(1).upper() # Extract the option label
-                option_text = option_match.group(2).strip() # Extract the option text
-                options[label] = option_text  # Store as { 'A': 'Integer', ... }
-                continue  # Move to the next line
-
-            # Detect the correct answer
-            if "correct answer:" in line.lower(): # Check if the line contains 'Correct Answer:'
-                match = re.search(r'correct answer:\s*([A-Da-d])', line, re.IGNORECASE) # Match the correct answer pattern
-                if match: # Check if the correct answer pattern is matched
-                    correct_answer = match.group(1).upper() # Extract the correct answer
-                continue # Move to the next line
- 
-            # Collect question text
-            question.append(line) # Append the line to the question list
-
-        # Step 5: Validate parsed data
-        question_text = "\n".join(question).strip() # Join the question lines
-        if not question_text or not options or correct_answer is None: # Check if the question text, options, or correct answer is missing
-            raise ValueError("Incomplete multiple-choice question.") # Raise a ValueError
+        items = json.loads(text) # Decode the JSON array
+    except ValueError: # Catch invalid JSON
+        start, end = text.find('['), text.rfind(']') # Look for an array inside surrounding prose
+        if start == -1 or end <= start: # Check if no array was found
+            return [] # Nothing usable in the response
+        try: # Try block to handle exceptions
+            items = json.loads(text[start:end + 1]) # Decode the embedded array
+        except ValueError: # Catch invalid JSON
+            return [] # Nothing usable in the response
+
+    if isinstance(items, dict): # Accept an object wrapping the array
+        items = items.get("questions", []) # Use the wrapped questions
+    if not isinstance(items, list): # Check if the response is not an array
+        return [] # Nothing usable in the response
+
+    questions = [] # Initialize an empty list to store the valid questions
+    for item in items: # Iterate over the decoded items
+        question_data = validate_question_data(item) # Validate the item against its schema
+        if question_data and question_data["type"] in allowed_types: # Keep only valid questions of an allowed type
+            questions.append(question_data) # Append the question data to the questions list
+    return questions # Return the valid questions
+
+# Function to validate one decoded JSON question and normalize it to the parser output format
+def validate_question_data(item): # Define the validate_question_data function with the item parameter
+    if not isinstance(item, dict): # Check if the item is not an object
+        return None # Reject the item
+
+    question_type = item.get("type") # Retrieve the question type
+    question = item.get("question") # Retrieve the question text
+    correct_answer = item.get("correct_answer") # Retrieve the correct answer
+
+    if question_type not in QUESTION_SCHEMAS or not isinstance(question, str) or not question.strip(): # Check the shared fields
+        return None # Reject the item
+    question = question.strip() # Clean the question text
 
-        # Step 6: Return structured data
+    if question_type == "multiple_choice": # Check if the question type is 'multiple_choice'
+        options = item.get("options") # Retrieve the options
+        if isinstance(options, list): # Accept the options as a plain list
+            options = dict(zip("ABCD", options)) # Label the options A to D
+        if not isinstance(options, dict): # Check if the options are missing
+            return None # Reject the item
+        options = {str(label).strip().upper(): str(text).strip() for label, text in options.items() if str(text).strip()} # Normalize the labels and text
+        if set(options) != set("ABCD"): # Check that exactly options A to D are present
+            return None # Reject the item
+        if not isinstance(correct_answer, str) or correct_answer.strip().upper()[:1] not in options: # Check that the answer names one of the options
+            return None # Reject the item
         return { # Return the structured question data
             "type": "multiple_choice", # Include the question type
-            "question": question_text, # Include the question text
-            "options": options,  # Now stored as a dictionary with labels
-            "correct_answer": correct_answer, # Include the correct answer
+            "question": question, # Include the question text
+            "options": options, # Include the labelled options
+            "correct_answer": correct_answer.strip().upper()[:1], # Include the correct option letter
         }
 
-    except Exception as e: # Catch any exceptions
-        return None # Return None
-
-# Function to parse a fill-in-the-blank question
-def parse_fill_in_the_blank(lines): # Define the parse_fill_in_the_blank function with the lines parameter
-
-    try:
-        # Step 1: Clean and filter lines
-        cleaned_lines = [line.strip() for line in lines if line.strip()] # Clean and filter out empty lines
-        # Step 2: Extract the question line with a placeholder
-        question_line = next( # Extract the question line with a placeholder
-            (line for line in cleaned_lines if 'Insert' in line or '________' in line), # Find lines with placeholders
-            None # Return None if no valid line found
-        )
-
-        if not question_line:   # If no valid question line found
-            raise ValueError("No valid blank or placeholder found in the question.") # Raise a ValueError
-
-        # Step 3: Validate if the blank is properly placed
-        if (
-            question_line.endswith('? ________') or  # Avoid if blank follows a question mark
-            question_line.endswith('.') or           # Avoid if sentence ends with a period
-            question_line == '________'              # Avoid if it's a lone blank
-        ):
-            raise ValueError("Improperly formatted fill-in-the-blank question.") # Raise a ValueError
-
-        # Step 4: Extract the correct answer
-        answer_pattern = re.search(r'\(([^)]+)\)', question_line) # Extract the answer in parentheses
-        correct_answer = answer_pattern.group(1).strip() if answer_pattern else None # Extract the correct answer
-
-        # If no answer found in parentheses, look for "Correct Answer:" line
-        if not correct_answer: # Check if the correct answer is missing
-            answer_line = next( # Extract the correct answer line
-                (line for line in cleaned_lines if line.lower().startswith("correct answer:")), # Find the line with 'Correct Answer:'
-                None # Return None if no valid line found
-            )
-            if answer_line: # Check if the answer line is found
-                correct_answer = answer_line.split(":", 1)[-1].strip() # Extract the correct answer
-
-            if not correct_answer: # Check if the correct answer is still missing
-                raise ValueError("No valid answer found in parentheses or 'Correct Answer:' line.") # Raise a ValueError
-
-        # Step 5: Format the question with consistent blanks
-        formatted_question = re.sub(r'(_{2,}|\[.*?\]|-{3,}|Insert answer)', '________', question_line).strip() # Format the question with consistent blanks
-        formatted_question = re.sub(r'\s*\([^)]*\)', '', formatted_question).strip() # Remove any parentheses from the question
-
-        # Step 6: Return the structured question data
+    if question_type == "true_false": # Check if the question type is 'true_false'
+        answer = str(correct_answer).strip().lower() # Accept either a string or a JSON boolean
+        if answer not in ("true", "false"): # Check that the answer is True or False
+            return None # Reject the item
+        return {"type": "true_false", "question": question, "correct_answer": answer} # Return the structured question data
+
+    if not isinstance(correct_answer, str) or not correct_answer.strip(): # Check the answer for the remaining types
+        return None # Reject the item
+    correct_answer = correct_answer.strip() # Clean the answer text
+
+    if question_type == "fill_in_the_blank": # Check if the question type is 'fill_in_the_blank'
+        question = re.sub(r'(_{2,}|\[.*?\]|-{3,})', '________', question) # Format the question with consistent blanks
+        if '________' not in question or question == '________': # Check that the question has a blank to fill
+            return None # Reject the item
+
+    if question_type == "write_code": # Check if the question type is 'write_code'
+        correct_answer = re.sub(r'^```(?:python)?\s*|\s*```$', '', correct_answer).strip() # Remove a markdown code fence around the solution
+        if not correct_answer: # Check if the solution is missing
+            return None # Reject the item
+        tests = item.get("tests") # Retrieve the test cases
         return { # Return the structured question data
-            "type": "fill_in_the_blank", # Include the question type
-            "question": formatted_question, # Include the formatted question
-            "correct_answer": correct_answer, # Include the correct answer
+            "type": "write_code", # Include the question type
+            "question": question, # Include the task description
+            "correct_answer": correct_answer, # Include the sample solution
+            "tests": [str(test) for test in tests] if isinstance(tests, list) else [], # Include the test cases, verified later
         }
 
-    except Exception as e: # Catch any exceptions
-        return None # Return None
+    return {"type": question_type, "question": question, "correct_answer": correct_answer} # Return the structured question data
 
-# Function to parse a code challenge question
-def parse_code_challenge(lines): # Define the parse_code_challenge function with the lines parameter
+# Function to keep only the test cases a code challenge's sample solution passes
+def verify_code_question(question_data): # Define the verify_code_question function with the question_data parameter
+    if question_data and question_data.get("type") == "write_code": # Check if the question is a code challenge
+        question_data["tests"] = verify_test_cases(question_data["correct_answer"], question_data.get("tests", [])) # Drop tests the sample solution fails
+    return question_data # Return the question data, graded by GPT alone when no test survives
 
+# Function to parse the response from the OpenAI API, returning None when it cannot be parsed
+def parse_response(response_text, question_type): # Define the parse_response function with the response_text and question_type parameters
     try: # Try block to handle exceptions
-
-        task_lines = []  # Store task description
-        solution_lines = []  # Store solution code
-
-        in_solution_block = False  # Track whether inside solution block
-
-        for line in lines: # Iterate over the lines
-            stripped_line = line.strip() # Strip the line
-
-            if stripped_line.startswith("```python"): # Check if the line starts with '```python'
-                in_solution_block = True # Enter the solution block 
-                continue    
-
-            elif stripped_line == "```": # Check if the line contains '```'
-                in_solution_block = False   # Exit the solution block
-                continue 
-
-            if in_solution_block: # Check if inside the solution block
-                solution_lines.append(line) # Append the line to the solution block
-            else: # If not inside the solution block
-                task_lines.append(line) # Append the line to the task description
-
-        # Join and clean lines
-        task_text = "\n".join(task_lines).strip() # Join and clean the task lines
-        correct_answer = "\n".join(solution_lines).strip() # Join and clean the solution lines
-
-        if not task_text or not correct_answer: # Check if the task or solution is missing
-            raise ValueError("Incomplete code challenge: Missing task or solution.") # Raise a ValueError
-
-        # Return 'question' instead of 'task' for consistency with retry logic
-        return {
-            "type": "write_code", # Include the question type
-            "question": task_text,  # Align with the retry logic
-            "correct_answer": correct_answer   # Include the solution code
-        }
-
-    except Exception as e: # Catch any exceptions
+        return parse_question(response_text, question_type) # Parse the response in one pass
+    except ParseError: # Catch responses that cannot be parsed
         return None # Return None
 
 # Function to generate review questions for a specific chapter
@@ -494,31 +669,21 @@ def generate_review_questions(progress, chapter): # Define the generate_review_q
 
     lesson_question_counts = {} # Initialize an empty dictionary to store the question counts per lesson
 
+    write_buffer.flush() # Write buffered mistakes, so they count toward the review
+    lessons_with_mistakes = set() # Lessons in the chapter where the user made a mistake
+    try: # Try block to handle exceptions
+        lessons_with_mistakes = repository.get_lessons_with_mistakes(progress.user_id, chapter) # One query for the whole chapter
+    except sqlite3.Error as e: # Catch any exceptions
+        print(f"Failed to retrieve mistakes from database: {e}") # Log the error
+
     for lesson_num, lesson in lessons.items(): # Iterate over the lessons
         if lesson_num == 8: # Check if the lesson number is 8
             continue  # Skip the review test lesson
 
         base_question_count = lesson.get('complexity', 1) # Retrieve the base question count for the lesson based on complexity level set in the config.py file
 
-        mistake_exists = False # Initialize the mistake_exists variable as False
-        try: # Try block to handle exceptions
-            with sqlite3.connect('progress.db') as conn: # Connect to the database
-                cursor = conn.cursor() # Create a cursor object
-                cursor.execute( # Execute a query to check for mistakes
-                    '''
-                    SELECT 1
-                    FROM mistakes
-                    WHERE user_id = ? AND chapter = ? AND lesson = ?
-                    LIMIT 1
-                    ''',
-                    (progress.user_id, chapter, lesson_num) # Provide the user ID, chapter, and lesson number as parameters
-                )
-                mistake_exists = cursor.fetchone() is not None # Check if a mistake exists
-        except sqlite3.Error as e: # Catch any exceptions
-            print(f"Failed to retrieve mistakes from database: {e}") # Log the error
-
         # If the user made any mistakes in this lesson, add one extra question
-        if mistake_exists: # Check if a mistake exists
+        if lesson_num in lessons_with_mistakes: # Check if a mistake exists
             total_question_count = base_question_count + 1 # Increment the question count
         else: # If no mistakes exist
             total_question_count = base_question_count # Use the base question count
@@ -531,7 +696,8 @@ def generate_review_questions(progress, chapter): # Define the generate_review_q
         lesson_content = generate_lesson_content(progress, chapter, lesson_num)  # Retrieve the lesson content from the database or generate it if not available
 
         generated_questions = generate_questions_from_content( # Generate questions based on the lesson content
-            chapter, lesson_num, lesson_content, question_count=question_count # Provide the chapter, lesson number, lesson content, and question count as parameters
+            chapter, lesson_num, lesson_content, question_count=question_count, from_review_pool=True, # Provide the chapter, lesson number, lesson content, and question count as parameters and draw from the review pool
+            user_id=progress.user_id # Skip questions the user has already been served
         )
 
         for question in generated_questions: # Iterate over the generated questions
@@ -553,77 +719,71 @@ def fill_missing_questions(existing_questions, chapter, total_needed): # Define
     return existing_questions # Return the existing questions
 
 # Function to generate a cumulative review with 100 questions plus mistakes from chapter reviews
-def generate_cumulative_review(progress):
-    questions = []  # Initialize an empty list to store the questions
-
-    # Loop over all chapters
-    for chapter_num, chapter_data in chapters.items():
-        # Loop over all lessons in the chapter (excluding the chapter review lesson)
-        for lesson_num, lesson_data in chapter_data['lessons'].items():
-            # Exclude the chapter review lesson (assuming it's lesson number 8)
-            if lesson_num == 8:
-                continue  # Skip the chapter review lesson
-
-            content = None  # Initialize content variable
-
-            # Attempt to fetch lesson content from the database
-            try:
-                with sqlite3.connect('progress.db') as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        '''
-                        SELECT content FROM lesson_content
-                        WHERE user_id = ? AND chapter = ? AND lesson = ?
-                        ''',
-                        (progress.user_id, chapter_num, lesson_num)
-                    )
-                    result = cursor.fetchone()
-                    if result:
-                        content = result[0]
-                    else:
-                        # If content is not in the database, generate it using your existing function
-                        content = generate_lesson_content(progress, chapter_num, lesson_num)
-
-                        # Store the generated content in the database
-                        try:
-                            cursor.execute(
-                                '''
-                                INSERT INTO lesson_content (user_id, chapter, lesson, content)
-                                VALUES (?, ?, ?, ?)
-                                ''',
-                                (progress.user_id, chapter_num, lesson_num, content)
-                            )
-                            conn.commit()
-                        except sqlite3.Error as e:
-                            print(f"Failed to store lesson content for Chapter {chapter_num}, Lesson {lesson_num}: {e}")
-            except sqlite3.Error as e:
-                print(f"Database error when fetching content for Chapter {chapter_num}, Lesson {lesson_num}: {e}")
-                content = None
-
-            # Now, proceed to generate questions if content is available
-            if content:
-                # Generate one question for this lesson
-                generated_questions = generate_questions_from_content(
-                    chapter=chapter_num,
-                    lesson=lesson_num,
-                    content=content,
-                    question_count=1
-                )
-                for question in generated_questions:
-                    question['chapter'] = chapter_num
-                    question['lesson'] = lesson_num
-                questions.extend(generated_questions)
-            else:
-                # Log or print a message if content is missing
-                print(f"Skipping Chapter {chapter_num}, Lesson {lesson_num}: Missing content.")
-
-    # Shuffle the questions to randomize their order
-    random.shuffle(questions)
+def generate_cumulative_review(progress, max_workers=None, progress_callback=None, cancel_event=None, seed=None): # Define the generate_cumulative_review function with the progress, max_workers, progress_callback, cancel_event, and seed parameters
+    # Collect every lesson in the course (excluding the chapter review lessons, lesson number 8)
+    lessons = [ # List the lessons in curriculum order
+        (chapter_num, lesson_num) # Store the chapter and lesson numbers
+        for chapter_num, chapter_data in chapters.items() # Loop over all chapters
+        for lesson_num in chapter_data['lessons'] # Loop over all lessons in the chapter
+        if lesson_num != 8 # Skip the chapter review lesson
+    ]
+    total = len(lessons) # Number of lessons to process
+    lesson_questions = [[] for _ in lessons] # One slot per lesson so the result does not depend on completion order
+
+    # Function to generate the question for one lesson, run on a worker thread
+    def build_lesson_question(chapter_num, lesson_num): # Define the build_lesson_question function
+        if cancel_event and cancel_event.is_set(): # Check if the review was cancelled
+            return [] # Skip the lesson
+
+        # Fetch the lesson content from the database or generate it if not available
+        content = generate_lesson_content(progress, chapter_num, lesson_num) # Retrieve the lesson content
+        if content == LESSON_CONTENT_UNAVAILABLE: # Treat a failed generation as missing content
+            print(f"Skipping Chapter {chapter_num}, Lesson {lesson_num}: Missing content.") # Log the skipped lesson
+            return [] # No question for this lesson
+
+        # Generate one question for this lesson
+        generated_questions = generate_questions_from_content( # Generate the question
+            chapter=chapter_num, # Provide the chapter
+            lesson=lesson_num, # Provide the lesson
+            content=content, # Provide the lesson content
+            question_count=1, # One question per lesson
+            max_workers=1, # The lessons already run in parallel
+            user_id=progress.user_id # Skip questions the user has already been served
+        )
+        for question in generated_questions: # Iterate over the generated questions
+            question['chapter'] = chapter_num # Record the chapter
+            question['lesson'] = lesson_num # Record the lesson
+        return generated_questions # Return the question
+
+    worker_count = max(1, max_workers or CUMULATIVE_REVIEW_CONCURRENCY) # Use the configured concurrency limit unless one is passed in
+
+    with ThreadPoolExecutor(max_workers=worker_count) as executor: # Create a thread pool to process the lessons in parallel
+        futures = { # Submit one job per lesson
+            executor.submit(build_lesson_question, chapter_num, lesson_num): index # Remember each lesson's slot
+            for index, (chapter_num, lesson_num) in enumerate(lessons) # Iterate over the lessons
+        }
+
+        for done, future in enumerate(as_completed(futures), start=1): # Handle the lessons as they finish
+            index = futures[future] # Look up the lesson's slot
+            try: # Try block to handle exceptions
+                lesson_questions[index] = future.result() # Store the lesson's questions in its slot
+            except Exception as e: # Catch any exceptions
+                chapter_num, lesson_num = lessons[index] # Look up the failed lesson
+                print(f"Error generating question for Chapter {chapter_num}, Lesson {lesson_num}: {e}") # Log the error
+
+            if progress_callback: # Check if the caller wants progress reports
+                progress_callback(done, total) # Report how many lessons are finished
+
+    questions = [question for slot in lesson_questions for question in slot] # Join the lessons in curriculum order
+
+    # Shuffle the questions to randomize their order, repeatably when a seed is given
+    random.Random(seed).shuffle(questions) # Shuffle the questions
 
     # Return the list of questions
     return questions
+
 # Function to validate answers using GPT-3 for coding challenges and scenario-based questions
-def validate_answer_with_gpt(question_data, user_response=None, user_code=None, user_output=None): # Define the validate_answer_with_gpt function with the question_data, user_response, user_code, and user_output parameters
+def validate_answer_with_gpt(question_data, user_response=None, user_code=None, user_output=None, failed_tests=None): # Define the validate_answer_with_gpt function with the question_data, user_response, user_code, user_output, and failed_tests parameters
     try: # Try block to handle exceptions 
         # Ensure question_data is valid
         if not isinstance(question_data, dict): # Check if the question_data is not a dictionary
@@ -631,21 +791,29 @@ def validate_answer_with_gpt(question_data, user_response=None, user_code=None,
 
         question_type = question_data.get('type', 'scenario') # Retrieve the question type
 
+        # Serve the stored verdict when the same answer to the same question was already graded
+        cache_key = verdict_key(question_data, user_response, user_code, user_output) # Hash the question and the normalized answer, failed tests follow from the code
+        cached = verdict_cache.get(cache_key) # Look up the verdict
+        if cached is not None: # Check if the answer was already graded
+            return cached # Return the stored (correct, feedback)
+
         # Construct the prompt based on question type
         if question_type == "write_code":  # Check if the question type is 'write_code'
+            failed_section = "".join(f"Failed Test: {test} ({message})\n" for test, message in failed_tests or []) # List the tests the code failed
             validation_prompt = ( # Define the validation prompt
                 f"You are a Python tutor. A student has provided a solution to the following coding challenge.\n\n" # Include the tutor role
                 f"### Coding Challenge\n{question_data.get('question', 'No question provided.')}\n\n" # Include the question text
-                f"Sample Solution:\n{question_data.get('solution', 'No solution provided.')}\n\n" # Include the sample solution
+                f"Sample Solution:\n{question_data.get('correct_answer', 'No solution provided.')}\n\n" # Include the sample solution
                 f"Student's Code:\n{user_code or 'No code provided.'}\n\n" # Include the student's code
                 f"Student's Code Output:\n{user_output or 'No output provided.'}\n" # Include the student's code output
+                f"{failed_section}" # Include the tests the code failed, if any
                 f"Is the student's solution correct? Start your response with 'Correct' or 'Incorrect'. Then give feedback on how the user can fix their function to work" # Include the validation instructions
             ) 
         elif question_type == "scenario": # Check if the question type is 'scenario'
             validation_prompt = ( # Define the validation prompt
                 f"You are a Python tutor. A student has responded to the following scenario-based question.\n\n" # Include the tutor role
                 f"### Scenario Question\n{question_data.get('question', 'No question provided.')}\n\n" # Include the question text
-                f"Expected Answer:\n{question_data.get('answer', 'No answer provided.')}\n\n" # Include the expected answer
+                f"Expected Answer:\n{question_data.get('correct_answer', 'No answer provided.')}\n\n" # Include the expected answer
                 f"Student's Response:\n{user_response or 'No response provided.'}\n" # Include the student's response
                 f"Is the student's response correct? Start your response with 'Correct' or 'Incorrect'. Then give feedback on what the user got wrong and why" # Include the validation instructions
             )
@@ -653,25 +821,39 @@ def validate_answer_with_gpt(question_data, user_response=None, user_code=None,
             raise ValueError(f"Unsupported question type: {question_type}") # Raise a ValueError for unsupported question types
 
         # Send the request to GPT
-        response = client.chat.completions.create( # Call the OpenAI API to generate the content
-            model="gpt-3.5-turbo", # Use the GPT-3.5-turbo model
-            messages=[ # Define the messages to send to the API
-                {"role": "system", "content": "You are a Python tutor."}, # Define the system message
-                {"role": "user", "content": validation_prompt} # Define the user message
-            ],
-            temperature=0.7, # Set the temperature to 0.7 for diversity
-            max_tokens=150 # Limit the token count for the response
-        )
+        started = time.perf_counter() # Time the grading so cache hits can report the latency they saved
+        call = LLMCall("validation", question_data.get('chapter'), question_data.get('lesson'), question_type) # Record the call's usage and latency
+        try: # Try block to make sure the call is recorded
+            response = gateway.create( # Call the OpenAI API through the gateway to grade the answer
+                call=call, # Fill in the call record
+                deadline=VALIDATION_DEADLINE, # The learner is waiting, so give up sooner
+                model=MODEL, # Use the configured model
+                messages=[ # Define the messages to send to the API
+                    {"role": "system", "content": "You are a Python tutor."}, # Define the system message
+                    {"role": "user", "content": validation_prompt} # Define the user message
+                ],
+                temperature=0.7, # Set the temperature to 0.7 for diversity
+                max_tokens=150 # Limit the token count for the response
+            )
+        except Exception: # Catch any exceptions
+            record_call(call) # Record the failed call
+            raise # Let the outer handler report the error
 
         gpt_response = response.choices[0].message.content.strip() # Extract the content from the API response
         # Prioritize "Incorrect" over "Correct" to avoid misinterpretation
         if "incorrect" in gpt_response.lower(): # Check if the response contains 'incorrect'
-            return False, gpt_response  # Invalid response
+            verdict = (False, gpt_response)  # Invalid response
         elif "correct" in gpt_response.lower():     # Check if the response contains 'correct'
-            return True, gpt_response  # Valid response
+            verdict = (True, gpt_response)  # Valid response
         else: # If neither 'correct' nor 'incorrect' is found
+            call.parse_failures = 1 # Record that the verdict could not be read
+            record_call(call) # Record the call
             return False, "Unexpected response from GPT. Please review the feedback." # Return an unexpected response message
 
+        record_call(call) # Record the call
+        verdict_cache.put(cache_key, verdict, time.perf_counter() - started) # Only real verdicts are cached, errors are retried
+        return verdict # Return the verdict
+
     except ValueError as ve: # Catch ValueError exceptions
         return False, str(ve)   # Return False and the error message
 
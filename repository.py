@@ -0,0 +1,207 @@
+from dataclasses import dataclass # Import dataclass to define the row models
+import database # Import the database module for the shared connections
+
+# Class for a row of the users table
+@dataclass(frozen=True, slots=True)
+class User: # Define the User class
+    id: int # User ID
+    name: str # Display name
+    email: str # Login email
+    password: bytes # bcrypt hash of the password
+    chapter: int # Furthest unlocked chapter
+    lesson: int # Furthest unlocked lesson in that chapter
+
+# Class for a row of the mistakes table
+@dataclass(frozen=True, slots=True)
+class Mistake: # Define the Mistake class
+    id: int # Mistake ID, in the order the mistakes were made
+    user_id: int # User who made the mistake
+    chapter: int # Chapter of the question
+    lesson: int # Lesson of the question
+    question: str # Question text
+    user_answer: str # Answer the user gave
+    correct_answer: str # Expected answer
+    feedback: str = None # Grading feedback
+    user_code: str = None # Code the user submitted
+    user_output: str = None # Output of the user's code
+    user_errors: str = None # Errors from the user's code
+    original_lesson: int = None # Lesson the question came from, for review questions
+
+# Class for a row of the mistake_summary table
+@dataclass(frozen=True, slots=True)
+class MistakeSummary: # Define the MistakeSummary class
+    chapter: int # Chapter with mistakes
+    lesson: int # Lesson with mistakes
+    count: int # Mistakes recorded in the lesson
+    last_at: float # When the latest mistake was recorded, in seconds since the epoch
+
+# Class for stored lesson content, a user's override when user_id is set, shared content otherwise
+@dataclass(frozen=True, slots=True)
+class LessonContent: # Define the LessonContent class
+    user_id: int # User the override belongs to, or None for shared content
+    chapter: int # Chapter of the lesson
+    lesson: int # Lesson number
+    content: str # Lesson text
+
+# Class for a row of the certificates table
+@dataclass(frozen=True, slots=True)
+class Certificate: # Define the Certificate class
+    user_id: int # User the certificate was issued to
+    certificate_path: str # Path of the generated PDF
+    date_issued: str # Date printed on the certificate
+
+# Every query the app runs against these tables, by name; the text never changes, so each connection prepares it once
+QUERIES = {
+    "user": 'SELECT id, name, email, password, chapter, lesson FROM users WHERE id = ?',
+    "user_by_email": 'SELECT id, name, email, password, chapter, lesson FROM users WHERE email = ?',
+    "user_name": 'SELECT name FROM users WHERE id = ?',
+    "insert_user": 'INSERT INTO users (name, email, password) VALUES (?, ?, ?)',
+    "update_user_name": 'UPDATE users SET name = ? WHERE id = ?',
+    "update_user_email": 'UPDATE users SET email = ? WHERE id = ?',
+    "update_user_password": 'UPDATE users SET password = ? WHERE id = ?',
+    "save_progress": 'UPDATE users SET chapter = ?, lesson = ? WHERE id = ?',
+    "mistakes_for_lesson": '''
+        SELECT id, user_id, chapter, lesson, question, user_answer, correct_answer, feedback, user_code, user_output, user_errors, original_lesson
+        FROM mistakes
+        WHERE user_id = ? AND chapter = ? AND lesson = ?
+        ORDER BY id
+    ''',
+    "mistakes_for_chapter": '''
+        SELECT id, user_id, chapter, lesson, question, user_answer, correct_answer, feedback, user_code, user_output, user_errors, original_lesson
+        FROM mistakes
+        WHERE user_id = ? AND chapter = ?
+        ORDER BY lesson, id
+    ''',
+    "insert_mistake": '''
+        INSERT INTO mistakes (user_id, chapter, lesson, question, user_answer, correct_answer, feedback, user_code, user_output, user_errors, original_lesson)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''',
+    "delete_mistakes_for_lesson": 'DELETE FROM mistakes WHERE user_id = ? AND chapter = ? AND lesson = ?',
+    "mistake_summary": '''
+        SELECT chapter, lesson, count, last_at
+        FROM mistake_summary
+        WHERE user_id = ?
+        ORDER BY chapter, lesson
+    ''',
+    "lessons_with_mistakes": 'SELECT lesson FROM mistake_summary WHERE user_id = ? AND chapter = ?',
+    "lesson_content": '''
+        SELECT user_id, chapter, lesson, content, 0 AS priority
+        FROM lesson_content
+        WHERE user_id = ? AND chapter = ? AND lesson = ?
+        UNION ALL
+        SELECT NULL, chapter, lesson, content, 1 AS priority
+        FROM shared_lesson_content
+        WHERE chapter = ? AND lesson = ? AND prompt_version = ? AND model = ? AND variant = ?
+        ORDER BY priority
+        LIMIT 1
+    ''',
+    "lesson_overrides_for_user": '''
+        SELECT user_id, chapter, lesson, content
+        FROM lesson_content
+        WHERE user_id = ?
+        ORDER BY chapter, lesson
+    ''',
+    "insert_shared_lesson_content": '''
+        INSERT OR IGNORE INTO shared_lesson_content (chapter, lesson, prompt_version, model, variant, content)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''',
+    "set_lesson_override": 'INSERT OR REPLACE INTO lesson_content (user_id, chapter, lesson, content) VALUES (?, ?, ?, ?)',
+    "clear_lesson_override": 'DELETE FROM lesson_content WHERE user_id = ? AND chapter = ? AND lesson = ?',
+    "certificate": 'SELECT user_id, certificate_path, date_issued FROM certificates WHERE user_id = ?',
+    "save_certificate": '''
+        INSERT INTO certificates (user_id, certificate_path, date_issued)
+        VALUES (?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET certificate_path = excluded.certificate_path, date_issued = excluded.date_issued
+    ''',
+}
+
+# Function to run a named query, building a model from each row when one is given
+def fetch(name, parameters, model=None): # Define the fetch function with the name, parameters, and model parameters
+    cursor = database.connect().cursor() # Cursor on the thread's connection
+    if model is not None: # Check if the rows should become models
+        cursor.row_factory = lambda _, row: model(*row) # Build the model straight from the row
+    return cursor.execute(QUERIES[name], parameters) # Run the query and return the cursor to read from
+
+# Function to run a named statement that changes rows, in its own transaction
+def execute(name, parameters): # Define the execute function with the name and parameters parameters
+    with database.connect() as conn: # Connect to the database, committing on success and rolling back on error
+        return conn.execute(QUERIES[name], parameters).rowcount # Run the statement and return the rows it changed
+
+# Function to get a user by ID
+def get_user(user_id): # Define the get_user function with the user_id parameter
+    return fetch("user", (user_id,), User).fetchone() # Return the user, or None
+
+# Function to get a user by login email
+def get_user_by_email(email): # Define the get_user_by_email function with the email parameter
+    return fetch("user_by_email", (email,), User).fetchone() # Return the user, or None
+
+# Function to get a user's display name without loading the rest of the row
+def get_user_name(user_id): # Define the get_user_name function with the user_id parameter
+    row = fetch("user_name", (user_id,)).fetchone() # Look up the name
+    return row[0] if row else None # Return the name, or None
+
+# Function to create a user, raising sqlite3.IntegrityError when the email is taken
+def create_user(name, email, password): # Define the create_user function with the name, email, and password parameters
+    with database.connect() as conn: # Connect to the database
+        return conn.execute(QUERIES["insert_user"], (name, email, password)).lastrowid # Insert the user and return the new ID
+
+# Function to change a user's display name
+def update_user_name(user_id, name): # Define the update_user_name function with the user_id and name parameters
+    return execute("update_user_name", (name, user_id)) == 1 # Return True if the user was updated
+
+# Function to change a user's login email
+def update_user_email(user_id, email): # Define the update_user_email function with the user_id and email parameters
+    return execute("update_user_email", (email, user_id)) == 1 # Return True if the user was updated
+
+# Function to change a user's password hash
+def update_user_password(user_id, password): # Define the update_user_password function with the user_id and password parameters
+    return execute("update_user_password", (password, user_id)) == 1 # Return True if the user was updated
+
+# Function to get a lesson's mistakes in the order they were made
+def get_mistakes_for_lesson(user_id, chapter, lesson): # Define the get_mistakes_for_lesson function
+    return fetch("mistakes_for_lesson", (user_id, chapter, lesson), Mistake).fetchall() # Return the mistakes
+
+# Function to get every mistake in a chapter, grouped by lesson
+def get_mistakes_for_chapter(user_id, chapter): # Define the get_mistakes_for_chapter function with the user_id and chapter parameters
+    return fetch("mistakes_for_chapter", (user_id, chapter), Mistake).fetchall() # Return the mistakes
+
+# Function to delete a lesson's mistakes, so a retaken lesson starts clean
+def delete_mistakes_for_lesson(user_id, chapter, lesson): # Define the delete_mistakes_for_lesson function
+    return execute("delete_mistakes_for_lesson", (user_id, chapter, lesson)) # Return the number of deleted mistakes
+
+# Function to get the mistake count of every lesson the user made mistakes in
+def get_mistake_summary(user_id): # Define the get_mistake_summary function with the user_id parameter
+    return fetch("mistake_summary", (user_id,), MistakeSummary).fetchall() # Return the counts, ordered by chapter and lesson
+
+# Function to get the lessons in a chapter where the user made mistakes
+def get_lessons_with_mistakes(user_id, chapter): # Define the get_lessons_with_mistakes function with the user_id and chapter parameters
+    return {row[0] for row in fetch("lessons_with_mistakes", (user_id, chapter))} # Return the lesson numbers
+
+# Function to find a lesson's stored content, preferring the user's override over the shared variant
+def find_lesson_content(user_id, chapter, lesson, prompt_version, model, variant): # Define the find_lesson_content function
+    parameters = (user_id, chapter, lesson, chapter, lesson, prompt_version, model, variant) # Override key, then shared key
+    return fetch("lesson_content", parameters, lambda *row: LessonContent(*row[:4])).fetchone() # Return the content, or None
+
+# Function to get every lesson override stored for a user
+def get_lesson_overrides(user_id): # Define the get_lesson_overrides function with the user_id parameter
+    return fetch("lesson_overrides_for_user", (user_id,), LessonContent).fetchall() # Return the overrides, ordered by chapter and lesson
+
+# Function to store generated lesson content in the shared tier, keeping any content already stored for the key
+def store_shared_lesson_content(chapter, lesson, prompt_version, model, variant, content): # Define the store_shared_lesson_content function
+    execute("insert_shared_lesson_content", (chapter, lesson, prompt_version, model, variant, content)) # Store the content
+
+# Function to store a lesson that only this user will see
+def set_lesson_override(user_id, chapter, lesson, content): # Define the set_lesson_override function
+    execute("set_lesson_override", (user_id, chapter, lesson, content)) # Store the override
+
+# Function to remove a user's lesson override
+def clear_lesson_override(user_id, chapter, lesson): # Define the clear_lesson_override function
+    execute("clear_lesson_override", (user_id, chapter, lesson)) # Delete the override
+
+# Function to get a user's certificate
+def get_certificate(user_id): # Define the get_certificate function with the user_id parameter
+    return fetch("certificate", (user_id,), Certificate).fetchone() # Return the certificate, or None
+
+# Function to store a user's certificate, replacing any earlier one
+def save_certificate(user_id, certificate_path, date_issued): # Define the save_certificate function
+    execute("save_certificate", (user_id, certificate_path, date_issued)) # Store the certificate
@@ -0,0 +1,202 @@
+import re # Import the re module for the precompiled line patterns
+
+# Every pattern is compiled once here, not on each call
+EMPHASIS_PATTERN = re.compile(r"\*\*(?=\S)(.+?)(?<=\S)\*\*") # Bold text, so the markers can be removed without touching the ** operator
+MARKDOWN_PATTERN = re.compile(r"^(?:#+|>+|[-*+](?=\s))\s*") # Heading, quote, or bullet symbols at the start of a line
+LABEL_PATTERN = re.compile( # Section labels such as 'Question:' or 'Correct Answer:', with the rest of the line
+    r"^(question|scenario|task|options|choices|correct answer|correct option|answer|sample solution|solution|test cases|tests|chapter|lesson)(?:\s*\d+)?\s*(?::\s*(.*))?$",
+    re.IGNORECASE,
+)
+HEADING_PATTERN = re.compile( # Question type headings echoed from the prompt, such as 'Multiple Choice Question'
+    r"^(?:multiple[- ]?choice|true\s*/\s*false|fill[- ]in[- ]the[- ]blank|scenario|code|coding)(?: question| challenge)?s?\s*:?$",
+    re.IGNORECASE,
+)
+OPTION_PATTERN = re.compile(r"^\(?([A-Da-d])[).:]\s*(.+)$") # Options such as 'A) text', 'A. text', 'A: text', or '(A) text'
+ANSWER_LETTER_PATTERN = re.compile(r"^\(?([A-Da-d])\b") # Option letter at the start of a correct answer
+TRUE_FALSE_PATTERN = re.compile(r"\b(true|false)\b", re.IGNORECASE) # True or false anywhere in a line
+BARE_TRUE_FALSE_PATTERN = re.compile(r"^(true|false)\.?$", re.IGNORECASE) # A line holding only True or False
+FENCE_PATTERN = re.compile(r"^```\s*([\w+-]*)\s*$") # Code fence, with an optional language
+BLANK_PATTERN = re.compile(r"_{2,}|\[.*?\]|-{3,}|Insert answer") # Blank markers, normalized to '________'
+PARENTHESIS_PATTERN = re.compile(r"\(([^)]+)\)") # Answer given in parentheses
+STRIP_PARENTHESIS_PATTERN = re.compile(r"\s*\([^)]*\)") # Parentheses removed from the question
+
+LABEL_SECTIONS = { # Section each label starts
+    "question": "question", "scenario": "question", "task": "question", # Question text
+    "options": "options", "choices": "options", # Multiple choice options
+    "correct answer": "answer", "correct option": "answer", "answer": "answer", # Expected answer
+    "sample solution": "solution", "solution": "solution", # Code challenge solution
+    "test cases": "tests", "tests": "tests", # Code challenge tests
+    "chapter": None, "lesson": None, # Prompt headers echoed back, ignored
+}
+
+# Exception raised when a response cannot be parsed, carrying the reason
+class ParseError(ValueError): # Define the ParseError class
+    pass
+
+# Class holding a response split into sections in one pass over its lines
+class ResponseTokens: # Define the ResponseTokens class
+
+    # Initialize the ResponseTokens class
+    def __init__(self): # Define the constructor
+        self.sections = {"question": [], "options": [], "answer": [], "solution": [], "tests": []} # Text lines in each section
+        self.options = {} # Multiple choice options keyed by letter
+        self.code = [] # Lines inside code fences
+        self.tests = [] # Assert statements
+        self.labelled_question = False # True once a 'Question:' style label was seen
+
+# Function to split a response into sections, options, code, and tests in a single pass
+def tokenize(text, collect_options=False): # Define the tokenize function with the text and collect_options parameters
+    tokens = ResponseTokens() # Collected tokens
+    section = "question" # Text before any label is question text
+    in_code = False # True inside a code fence
+
+    for raw_line in text.splitlines(): # Iterate over the lines once
+        stripped = raw_line.strip() # Line without surrounding whitespace
+        fence = FENCE_PATTERN.match(stripped) # Check for a code fence
+        if fence: # The line opens or closes a code block
+            in_code = not in_code # Toggle the code block
+            continue # Fences carry no content
+        if in_code: # Inside a code block
+            if section == "tests" and stripped.startswith("assert "): # Tests written inside a code block
+                tokens.tests.append(stripped) # Keep the test
+            elif stripped or tokens.code: # Keep the code, dropping leading blank lines
+                tokens.code.append(raw_line.rstrip()) # Keep the code line with its indentation
+            continue # Code lines are not parsed further
+        if not stripped: # Skip blank lines
+            continue
+
+        line = MARKDOWN_PATTERN.sub("", EMPHASIS_PATTERN.sub(r"\1", stripped)).strip() # Remove bold, heading, quote, and bullet markers
+        if not line: # Nothing left once the markers are gone
+            continue
+        if line.startswith("assert "): # Tests written outside a code block
+            tokens.tests.append(line) # Keep the test
+            continue
+
+        label = LABEL_PATTERN.match(line) # Check for a section label
+        if label: # The line starts a section
+            section = LABEL_SECTIONS[label.group(1).lower()] # Switch to the labelled section
+            if section == "question" and not tokens.labelled_question: # Check if this is the first question label
+                tokens.sections["question"] = [] # Text before the label was a preamble, not the question
+                tokens.labelled_question = True # Remember the label
+            rest = (label.group(2) or "").strip() # Text after the label on the same line
+            if section is None or not rest: # Check if the label is an ignored header or stands alone
+                continue
+            line = rest # Parse the rest of the line as section text
+        elif stripped.startswith("#") or HEADING_PATTERN.match(line): # Headings such as '### SCENARIO QUESTION'
+            continue # Headings are not content
+        if section is None: # Lines after an ignored header label
+            section = "question" # Go back to question text
+
+        option = OPTION_PATTERN.match(line) if collect_options and section in ("question", "options") else None # Check for a multiple choice option
+        if option: # The line is an option
+            tokens.options[option.group(1).upper()] = option.group(2).strip() # Store as { 'A': 'Integer', ... }
+            continue
+        tokens.sections[section].append(line) # Keep the text in its section
+
+    return tokens # Return the tokens
+
+# Function to build a multiple choice question
+def build_multiple_choice(tokens): # Define the build_multiple_choice function with the tokens parameter
+    question = "\n".join(tokens.sections["question"]).strip() # Join the question lines
+    if not question: # Check if the question text is missing
+        raise ParseError("missing question text") # Report the failure
+    if len(tokens.options) < 2: # Check if the options are missing
+        raise ParseError(f"expected options A-D, found {len(tokens.options)}") # Report the failure
+    answer = ANSWER_LETTER_PATTERN.match(" ".join(tokens.sections["answer"])) # Read the answer letter
+    if not answer: # Check if the answer letter is missing
+        raise ParseError("missing correct answer letter") # Report the failure
+    correct_answer = answer.group(1).upper() # The answer letter
+    if correct_answer not in tokens.options: # Check if the answer is not one of the options
+        raise ParseError(f"correct answer {correct_answer} is not one of the options") # Report the failure
+    return { # Return the structured question data
+        "type": "multiple_choice", # Include the question type
+        "question": question, # Include the question text
+        "options": dict(sorted(tokens.options.items())), # Options keyed by label, in order
+        "correct_answer": correct_answer, # Include the correct answer
+    }
+
+# Function to build a true/false question
+def build_true_false(tokens): # Define the build_true_false function with the tokens parameter
+    question_lines = list(tokens.sections["question"]) # Question lines
+    answer_text = " ".join(tokens.sections["answer"]) # Answer text
+    if not answer_text and question_lines and BARE_TRUE_FALSE_PATTERN.match(question_lines[-1]): # An unlabelled answer on the last line
+        answer_text = question_lines.pop() # Take it as the answer
+    question = " ".join(question_lines).strip() # Join the question lines
+    if not question: # Check if the question text is missing
+        raise ParseError("missing question text") # Report the failure
+    answer = TRUE_FALSE_PATTERN.search(answer_text) # Read True or False
+    if not answer: # Check if the answer is missing
+        raise ParseError("missing True/False answer") # Report the failure
+    return { # Return the structured question data
+        "type": "true_false", # Include the question type
+        "question": question, # Include the question text
+        "correct_answer": answer.group(1).lower(), # Include the correct answer
+    }
+
+# Function to build a fill in the blank question
+def build_fill_in_the_blank(tokens): # Define the build_fill_in_the_blank function with the tokens parameter
+    lines = tokens.sections["question"] # Question lines
+    question_line = next((line for line in lines if "Insert" in line or "________" in line), None) # The line with the blank
+    if not question_line: # Check if no line has a blank
+        raise ParseError("no blank '________' in the question") # Report the failure
+    if question_line.endswith("? ________") or question_line.endswith(".") or question_line == "________": # Check if the blank is badly placed
+        raise ParseError("blank is improperly placed") # Report the failure
+
+    answer = PARENTHESIS_PATTERN.search(question_line) # Answer given in parentheses
+    correct_answer = answer.group(1).strip() if answer else " ".join(tokens.sections["answer"]).strip() # Otherwise the 'Correct Answer:' line
+    if not correct_answer: # Check if the answer is missing
+        raise ParseError("missing correct answer") # Report the failure
+
+    question = BLANK_PATTERN.sub("________", question_line).strip() # Use consistent blanks
+    question = STRIP_PARENTHESIS_PATTERN.sub("", question).strip() # Remove any parentheses from the question
+    return { # Return the structured question data
+        "type": "fill_in_the_blank", # Include the question type
+        "question": question, # Include the formatted question
+        "correct_answer": correct_answer, # Include the correct answer
+    }
+
+# Function to build a scenario question
+def build_scenario(tokens): # Define the build_scenario function with the tokens parameter
+    scenario = " ".join(tokens.sections["question"]).strip() # Join the scenario lines
+    if not scenario: # Check if the scenario is missing
+        raise ParseError("missing scenario text") # Report the failure
+    correct_answer = " ".join(tokens.sections["answer"]).strip() # Join the answer lines
+    if not correct_answer: # Check if the answer is missing
+        raise ParseError("missing correct answer") # Report the failure
+    return { # Return the structured question data
+        "type": "scenario", # Include the question type
+        "question": scenario, # Include the scenario text
+        "correct_answer": correct_answer, # Include the answer text
+    }
+
+# Function to build a code challenge question
+def build_code_challenge(tokens): # Define the build_code_challenge function with the tokens parameter
+    task = "\n".join(tokens.sections["question"]).strip() # Join the task lines
+    if not task: # Check if the task is missing
+        raise ParseError("missing task description") # Report the failure
+    solution = "\n".join(tokens.code).strip() # Join the solution lines
+    if not solution: # Check if the solution is missing
+        raise ParseError("missing sample solution code block") # Report the failure
+    return { # Return the structured question data
+        "type": "write_code", # Include the question type
+        "question": task, # Include the task description
+        "correct_answer": solution, # Include the solution code
+        "tests": tokens.tests, # Include the test cases, verified later
+    }
+
+BUILDERS = { # Builder for each question type
+    "multiple_choice": build_multiple_choice, # Multiple choice
+    "true_false": build_true_false, # True/false
+    "fill_in_the_blank": build_fill_in_the_blank, # Fill in the blank
+    "scenario": build_scenario, # Scenario
+    "write_code": build_code_challenge, # Code challenge
+}
+
+# Function to parse a question response, raising ParseError with the reason when it cannot
+def parse_question(response_text, question_type): # Define the parse_question function with the response_text and question_type parameters
+    builder = BUILDERS.get(question_type) # Builder for the question type
+    if builder is None: # Check if the question type is unknown
+        raise ParseError(f"unknown question type {question_type!r}") # Report the failure
+    if not response_text or not response_text.strip(): # Check if the response is empty
+        raise ParseError("empty response") # Report the failure
+    return builder(tokenize(response_text, collect_options=question_type == "multiple_choice")) # Split the response and build the question
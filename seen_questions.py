@@ -0,0 +1,117 @@
+import os # Import the os module to read environment variables
+import sqlite3 # Import the sqlite3 module to persist the seen questions
+import threading # Import the threading module to guard the loaded scopes between threads
+import time # Import the time module to record when a question was last served
+from collections import OrderedDict # Import OrderedDict to keep scopes and questions in least-recently-used order
+import database # Import the database module for the shared connections and so the seen_questions table exists before it is used
+from similarity import QuestionIndex # Import the QuestionIndex class to search a scope without a full scan
+
+SEEN_QUESTIONS_PER_SCOPE = int(os.getenv("SEEN_QUESTIONS_PER_SCOPE", "500")) # Most questions remembered for one user and chapter
+SEEN_QUESTION_SCOPES = int(os.getenv("SEEN_QUESTION_SCOPES", "8")) # Most user and chapter scopes kept in memory at once
+
+# Class to hold the questions served in one scope, most recently served last
+class SeenScope: # Define the SeenScope class
+
+    # Initialize the SeenScope class
+    def __init__(self): # Define the constructor
+        self.index = QuestionIndex() # Similarity index over the scope's questions
+        self.recency = OrderedDict() # Question texts in least-recently-served order
+
+    # Function to remember a question, returning the questions evicted to stay under the limit
+    def add(self, question_text, max_entries): # Define the add function with the question_text and max_entries parameters
+        self.index.add(question_text) # Add the question to the index
+        self.recency[question_text] = None # Remember the question
+        self.recency.move_to_end(question_text) # Mark it as the most recently served question
+        evicted = [] # Questions dropped to stay under the limit
+        while len(self.recency) > max_entries: # Check if the scope is over its limit
+            oldest, _ = self.recency.popitem(last=False) # Drop the least recently served question
+            self.index.remove(oldest) # Remove it from the index
+            evicted.append(oldest) # Report it so it can be deleted from the database
+        return evicted # Return the evicted questions
+
+# Class to remember which questions each user has been served in each chapter, across sessions
+class SeenQuestionStore: # Define the SeenQuestionStore class
+
+    # Initialize the SeenQuestionStore class
+    def __init__(self, max_per_scope=SEEN_QUESTIONS_PER_SCOPE, max_scopes=SEEN_QUESTION_SCOPES): # Define the constructor
+        self.max_per_scope = max(1, max_per_scope) # Most questions remembered per scope
+        self.max_scopes = max(1, max_scopes) # Most scopes kept in memory
+        self.scopes = OrderedDict() # Loaded scopes keyed by (user_id, chapter) in least-recently-used order
+        self.lock = threading.Lock() # Lock to keep the loaded scopes consistent across threads
+
+    # Function to get a scope, loading it from the database if it is not in memory
+    def load_scope(self, user_id, chapter): # Define the load_scope function with the user_id and chapter parameters
+        key = (user_id, chapter) # Build the scope key
+        scope = self.scopes.get(key) # Look up the loaded scope
+        if scope is not None: # Check if the scope is already loaded
+            self.scopes.move_to_end(key) # Mark it as the most recently used scope
+            return scope # Return the loaded scope
+
+        scope = SeenScope() # Create an empty scope
+        if user_id is not None: # Only questions served to a user are persisted
+            try: # Try block to handle exceptions
+                with database.connect() as conn: # Connect to the database
+                    rows = conn.execute( # Load the scope's questions, oldest first
+                        '''
+                        SELECT question FROM seen_questions
+                        WHERE user_id = ? AND chapter = ?
+                        ORDER BY last_seen
+                        ''',
+                        (user_id, chapter) # Provide the user ID and chapter as parameters
+                    ).fetchall() # Fetch every question
+                for (question_text,) in rows: # Iterate over the stored questions
+                    scope.add(question_text, self.max_per_scope) # Load the question into memory
+            except sqlite3.Error as e: # Catch any database errors
+                print(f"Failed to load seen questions: {e}") # Log the error and start the scope empty
+
+        self.scopes[key] = scope # Keep the scope in memory
+        while len(self.scopes) > self.max_scopes: # Check if too many scopes are loaded
+            self.scopes.popitem(last=False) # Drop the least recently used scope, it reloads from the database when needed
+        return scope # Return the loaded scope
+
+    # Function to check if a similar question was already served in the scope
+    def has_similar(self, question_text, user_id=None, chapter=None, threshold=70): # Define the has_similar function
+        with self.lock: # Prevent other threads from changing the scope while it is searched
+            return self.load_scope(user_id, chapter).index.has_similar(question_text, threshold) # Search the scope's index
+
+    # Function to remember that a question was served in the scope
+    def add(self, question_text, user_id=None, chapter=None): # Define the add function with the question_text, user_id, and chapter parameters
+        with self.lock: # Prevent other threads from searching the scope while it changes
+            evicted = self.load_scope(user_id, chapter).add(question_text, self.max_per_scope) # Add the question and evict the oldest ones
+
+        if user_id is None: # Check if the scope is not persisted
+            return # Nothing to write
+        try: # Try block to handle exceptions
+            with database.connect() as conn: # Connect to the database
+                conn.execute( # Store the question, or refresh when it was last served
+                    'INSERT OR REPLACE INTO seen_questions (user_id, chapter, question, last_seen) VALUES (?, ?, ?, ?)',
+                    (user_id, chapter, question_text, time.time()) # Provide the scope, question, and time as parameters
+                )
+                conn.executemany( # Delete the evicted questions
+                    'DELETE FROM seen_questions WHERE user_id = ? AND chapter = ? AND question = ?',
+                    [(user_id, chapter, oldest) for oldest in evicted] # One row per evicted question
+                )
+        except sqlite3.Error as e: # Catch any database errors
+            print(f"Failed to store seen question: {e}") # Log the error, the question is still remembered in memory
+
+    # Function to forget the seen questions for a user, a chapter, or everything
+    def invalidate(self, user_id=None, chapter=None): # Define the invalidate function with the user_id and chapter parameters
+        with self.lock: # Prevent other threads from using the scopes while they are dropped
+            for key in list(self.scopes): # Iterate over the loaded scopes
+                if (user_id is None or key[0] == user_id) and (chapter is None or key[1] == chapter): # Check if the scope matches
+                    del self.scopes[key] # Drop the scope from memory
+
+        conditions = [] # SQL conditions for the rows to delete
+        parameters = [] # Parameters for the conditions
+        if user_id is not None: # Check if the invalidation is limited to a user
+            conditions.append("user_id = ?") # Match the user
+            parameters.append(user_id) # Provide the user ID
+        if chapter is not None: # Check if the invalidation is limited to a chapter
+            conditions.append("chapter = ?") # Match the chapter
+            parameters.append(chapter) # Provide the chapter
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else "" # Build the WHERE clause
+        try: # Try block to handle exceptions
+            with database.connect() as conn: # Connect to the database
+                conn.execute(f'DELETE FROM seen_questions{where}', parameters) # Delete the matching rows
+        except sqlite3.Error as e: # Catch any database errors
+            print(f"Failed to clear seen questions: {e}") # Log the error
@@ -0,0 +1,166 @@
+import os # Import the os module to read environment variables
+import re # Import the re module to split questions into tokens
+from collections import Counter, defaultdict # Import Counter to rank probes and defaultdict to build the inverted index
+from fuzzywuzzy import fuzz # Import the fuzz function from the fuzzywuzzy module for string similarity comparison
+
+TOKEN_PATTERN = re.compile(r"\w+") # Precompiled pattern that splits a question into word tokens
+COMMON_TOKEN_LIMIT = int(os.getenv("COMMON_TOKEN_LIMIT", "50")) # Tokens found in more stored questions than this are too common to probe
+PROBE_LIMIT = 8 # Questions sharing the most rare words that are compared before the full bound pass
+BLOCK_SIZE = 128 # Stored questions packed into one bit-parallel block
+
+# Function to check if a bound on the matching characters can still make fuzz.ratio exceed the threshold
+def can_exceed(matching, total, threshold): # Define the can_exceed function with the matching, total, and threshold parameters
+    # fuzz.ratio rounds 200 * matching / total, so it exceeds the threshold only from threshold + 0.5 upwards
+    return not total or 400 * matching >= (2 * threshold + 1) * total # Integer form of the check, empty pairs are left to fuzz.ratio
+
+# Class to pack stored questions into one integer per character, so the longest common subsequence with all of them is computed at once
+class LcsBlock: # Define the LcsBlock class
+
+    # Initialize the LcsBlock class
+    def __init__(self): # Define the constructor
+        self.offsets = {} # First bit of each live question keyed by entry ID
+        self.lengths = {} # Length of each live question keyed by entry ID
+        self.masks = {} # Bits of the positions holding each character, keyed by character
+        self.live = 0 # Bits of the live questions' positions
+        self.size = 0 # Bits used so far, including the ones of removed questions
+        self.added = 0 # Questions packed so far, including removed ones
+
+    # Function to check if the block has room for another question
+    def full(self): # Define the full function
+        return self.added >= BLOCK_SIZE # Return True if the block is full
+
+    # Function to pack a question into the block
+    def add(self, entry_id, lowered): # Define the add function with the entry_id and lowered parameters
+        offset = self.size # The question starts after the last one
+        positions = defaultdict(int) # Position bits keyed by character
+        for position, character in enumerate(lowered): # Iterate over the question's characters
+            positions[character] |= 1 << position # Mark the character's position
+        for character, bits in positions.items(): # Iterate over the characters
+            self.masks[character] = self.masks.get(character, 0) | bits << offset # Add the positions to the block
+        self.live |= ((1 << len(lowered)) - 1) << offset # Mark the question's positions as live
+        self.offsets[entry_id] = offset # Remember where the question starts
+        self.lengths[entry_id] = len(lowered) # Remember its length
+        self.size += len(lowered) + 1 # Leave a zero bit after the question so additions never carry into the next one
+        self.added += 1 # Count the packed question
+
+    # Function to drop a question from the block, leaving its bits unused
+    def remove(self, entry_id): # Define the remove function with the entry_id parameter
+        offset = self.offsets.pop(entry_id) # Forget where the question starts
+        length = self.lengths.pop(entry_id) # Forget its length
+        self.live &= ~(((1 << length) - 1) << offset) # Its positions stay zero, so they never match
+
+    # Function to compute the longest common subsequence of a question with every live question in the block
+    def common_lengths(self, lowered): # Define the common_lengths function with the lowered parameter
+        # Bit-parallel LCS (Hyyro 2004): a zero bit in row marks a position matched so far
+        row = self.live # Start with every position unmatched
+        for character in lowered: # Iterate over the new question's characters
+            matches = row & self.masks.get(character, 0) # Unmatched positions holding the character
+            if matches: # Check if the character occurs in the block
+                row = ((row + matches) | (row - matches)) & self.live # Advance the row, carries stop at the zero bit after each question
+        for entry_id, offset in self.offsets.items(): # Iterate over the live questions
+            length = self.lengths[entry_id] # Length of the stored question
+            unmatched = bin((row >> offset) & ((1 << length) - 1)).count("1") # Positions left unmatched
+            yield entry_id, length - unmatched # Return the common subsequence length
+
+# Class to find stored questions similar to a new one, comparing only those that can still pass the threshold
+class QuestionIndex: # Define the QuestionIndex class
+
+    # Initialize the QuestionIndex class
+    def __init__(self): # Define the constructor
+        self.entries = {} # Lowercased question text keyed by entry ID
+        self.ids = {} # Entry ID keyed by the original question text
+        self.postings = defaultdict(set) # Entry IDs keyed by token
+        self.blocks = [] # Bit-parallel blocks, oldest first
+        self.block_of = {} # Block holding each question keyed by entry ID
+        self.next_id = 0 # ID given to the next stored question
+
+    # Function to get the number of stored questions
+    def __len__(self): # Define the __len__ function
+        return len(self.entries) # Return the number of stored questions
+
+    # Function to check if a question is stored
+    def __contains__(self, question_text): # Define the __contains__ function with the question_text parameter
+        return question_text in self.ids # Return True if the exact question is stored
+
+    # Function to iterate over the stored questions
+    def __iter__(self): # Define the __iter__ function
+        return iter(list(self.ids)) # Iterate over a copy of the original question texts
+
+    # Function to store a question in the index
+    def add(self, question_text): # Define the add function with the question_text parameter
+        if question_text in self.ids: # Check if the question is already stored
+            return # Nothing to do
+        entry_id = self.next_id # Give the question the next ID
+        self.next_id += 1 # Advance the ID counter
+        lowered = question_text.lower() # Lowercase once here instead of on every comparison
+        self.entries[entry_id] = lowered # Store the lowercased text
+        self.ids[question_text] = entry_id # Remember the ID for removal
+        for token in set(TOKEN_PATTERN.findall(lowered)): # Iterate over the unique tokens
+            self.postings[token].add(entry_id) # Add the question to the token's posting list
+        self.pack(entry_id, lowered) # Pack the question into the newest block
+
+    # Function to pack a question into the newest block, starting a new one when it is full
+    def pack(self, entry_id, lowered): # Define the pack function with the entry_id and lowered parameters
+        if not self.blocks or self.blocks[-1].full(): # Check if the newest block has no room
+            self.blocks.append(LcsBlock()) # Start a new block
+        self.blocks[-1].add(entry_id, lowered) # Pack the question
+        self.block_of[entry_id] = self.blocks[-1] # Remember which block holds it
+
+    # Function to remove a question from the index
+    def remove(self, question_text): # Define the remove function with the question_text parameter
+        entry_id = self.ids.pop(question_text, None) # Look up and forget the question's ID
+        if entry_id is None: # Check if the question was not stored
+            return # Nothing to do
+        lowered = self.entries.pop(entry_id) # Forget the lowercased text
+        for token in set(TOKEN_PATTERN.findall(lowered)): # Iterate over the question's tokens
+            posting = self.postings.get(token) # Look up the token's posting list
+            if posting is not None: # Check if the token is indexed
+                posting.discard(entry_id) # Remove the question from the posting list
+                if not posting: # Check if the posting list is now empty
+                    del self.postings[token] # Drop the empty posting list
+        block = self.block_of.pop(entry_id) # Look up the question's block
+        block.remove(entry_id) # Drop the question from it
+        if block.full() and len(block.offsets) < BLOCK_SIZE // 4: # Check if a full block is mostly removed questions
+            self.blocks.remove(block) # Drop the block
+            for live_id in block.offsets: # Iterate over the questions still in it
+                self.pack(live_id, self.entries[live_id]) # Repack the question into the newest block
+
+    # Function to remove every question from the index
+    def clear(self): # Define the clear function
+        self.entries.clear() # Forget the lowercased texts
+        self.ids.clear() # Forget the IDs
+        self.postings.clear() # Forget the posting lists
+        self.blocks.clear() # Forget the blocks
+        self.block_of.clear() # Forget the block of each question
+
+    # Function to pick the few stored questions sharing the most rare words, where near-duplicates usually are
+    def probes(self, lowered): # Define the probes function with the lowered parameter
+        # Common words like "what" or "python" appear in most questions and say little about similarity
+        shared = Counter() # Shared rare token count keyed by entry ID
+        for token in set(TOKEN_PATTERN.findall(lowered)): # Iterate over the new question's unique tokens
+            posting = self.postings.get(token, ()) # Look up the token's posting list
+            if len(posting) <= COMMON_TOKEN_LIMIT: # Check if the token is rare enough to probe
+                shared.update(posting) # Count the questions sharing the token
+        return [entry_id for entry_id, _ in shared.most_common(PROBE_LIMIT)] # Return the closest few
+
+    # Function to find every stored question that can be more similar than the threshold
+    def candidates(self, lowered, threshold=70): # Define the candidates function with the lowered and threshold parameters
+        # fuzz.ratio never matches more characters than the longest common subsequence, so anything below the bound is ruled out exactly
+        length = len(lowered) # Length of the new question
+        for block in list(self.blocks): # Iterate over the blocks
+            for entry_id, common in block.common_lengths(lowered): # Iterate over the block's common subsequence lengths
+                if can_exceed(common, length + len(self.entries[entry_id]), threshold): # Check if the question can still match
+                    yield entry_id # Compare it
+
+    # Function to check if any stored question is more similar than the threshold
+    def has_similar(self, question_text, threshold=70): # Define the has_similar function with the question_text and threshold parameters
+        lowered = question_text.lower() # Lowercase the new question once
+        compared = set() # Entry IDs already compared
+        for entry_id in self.probes(lowered): # Iterate over the likely near-duplicates first
+            compared.add(entry_id) # Compare each question only once
+            if fuzz.ratio(lowered, self.entries[entry_id]) > threshold: # Check the exact similarity ratio
+                return True # A similar question is stored
+        for entry_id in self.candidates(lowered, threshold): # Iterate over every question the bound leaves in play
+            if entry_id not in compared and fuzz.ratio(lowered, self.entries[entry_id]) > threshold: # Check the exact similarity ratio
+                return True # A similar question is stored
+        return False # No similar question is stored
@@ -0,0 +1,79 @@
+import os # Import the os module to read environment variables
+import threading # Import the threading module to signal cancellation to running work
+from concurrent.futures import ThreadPoolExecutor # Import the thread pool that runs the background work
+from kivy.clock import Clock # Import the Clock class from kivy.clock to deliver results on the UI thread
+
+UI_TASK_WORKERS = int(os.getenv("UI_TASK_WORKERS", "4")) # Number of worker threads for generation and validation work
+
+# Class to track one piece of background work and deliver its callbacks on the UI thread
+class Task: # Define the Task class
+
+    # Initialize the Task class
+    def __init__(self, on_result=None, on_error=None, on_progress=None): # Define the constructor with the callback parameters
+        self.on_result = on_result # Called on the UI thread with the return value
+        self.on_error = on_error # Called on the UI thread with the exception
+        self.on_progress = on_progress # Called on the UI thread with each progress report
+        self.cancel_event = threading.Event() # Set when the task is cancelled
+        self.future = None # The future running the work, set by the runner
+
+    # Function to cancel the task, dropping any callbacks that have not run yet
+    def cancel(self): # Define the cancel function
+        self.cancel_event.set() # Tell the work and the callbacks that the task was cancelled
+        if self.future: # Check if the work was submitted
+            self.future.cancel() # Stop the work from starting if it is still queued
+
+    # Function to check if the task was cancelled
+    def is_cancelled(self): # Define the is_cancelled function
+        return self.cancel_event.is_set() # Return True if the task was cancelled
+
+    # Function for the work to report progress, delivered on the UI thread
+    def report_progress(self, *values): # Define the report_progress function with the values parameter
+        if self.on_progress: # Check if anyone is listening for progress
+            self.deliver(self.on_progress, *values) # Deliver the progress report
+
+    # Function to run a callback on the UI thread unless the task was cancelled
+    def deliver(self, callback, *values): # Define the deliver function with the callback and values parameters
+        if self.is_cancelled(): # Check if the task was cancelled before the callback was scheduled
+            return # Drop the callback
+
+        # Function that runs on the UI thread
+        def run(dt): # Define the run function
+            if not self.is_cancelled(): # Check again in case the task was cancelled while the callback was queued
+                callback(*values) # Run the callback
+        Clock.schedule_once(run) # Schedule the callback for the next frame
+
+    # Function to deliver the outcome of the work once it finishes
+    def finish(self, future): # Define the finish function with the future parameter
+        if future.cancelled(): # Check if the work never ran
+            return # Nothing to deliver
+        error = future.exception() # Check if the work raised an exception
+        if error is not None: # Check if the work failed
+            print(f"Background task failed: {error}") # Log the error
+            if self.on_error: # Check if anyone is listening for errors
+                self.deliver(self.on_error, error) # Deliver the error
+        elif self.on_result: # Check if anyone is listening for the result
+            self.deliver(self.on_result, future.result()) # Deliver the result
+
+# Class to run generation and validation work off the UI thread
+class TaskRunner: # Define the TaskRunner class
+
+    # Initialize the TaskRunner class
+    def __init__(self, max_workers=UI_TASK_WORKERS): # Define the constructor with the max_workers parameter
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="task") # Create the worker pool
+
+    # Function to run work in the background and deliver its result, error, and progress on the UI thread
+    def submit(self, fn, *args, on_result=None, on_error=None, on_progress=None, cancellable=False, **kwargs): # Define the submit function
+        task = Task(on_result, on_error, on_progress) # Create the task handle
+        if on_progress: # Check if the work reports progress
+            kwargs["progress_callback"] = task.report_progress # Give the work a way to report progress
+        if cancellable: # Check if the work checks for cancellation itself
+            kwargs["cancel_event"] = task.cancel_event # Give the work the cancellation signal
+        task.future = self.executor.submit(fn, *args, **kwargs) # Run the work on a worker thread
+        task.future.add_done_callback(task.finish) # Deliver the outcome when the work finishes
+        return task # Return the task handle so the caller can cancel it
+
+    # Function to stop the worker pool when the app closes
+    def shutdown(self): # Define the shutdown function
+        self.executor.shutdown(wait=False, cancel_futures=True) # Stop queued work without waiting for running work
+
+task_runner = TaskRunner() # Shared runner used by every screen
@@ -0,0 +1,167 @@
+import argparse # Import the argparse module to read the report options
+import atexit # Import the atexit module to write the last call records when the app exits
+import os # Import the os module to read environment variables
+import queue # Import the queue module to hand call records to the writer thread
+import sqlite3 # Import the sqlite3 module to store the call records
+import threading # Import the threading module to write call records in the background
+import time # Import the time module to timestamp the call records
+from collections import defaultdict # Import defaultdict to group the call records
+import database # Import the database module for the shared connections and so the llm_calls table exists before it is used
+
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "true").lower() == "true" # Record every API call by default
+MODEL_PRICES = { # Dollars per 1,000 prompt and completion tokens for each model
+    "gpt-3.5-turbo": (0.0005, 0.0015), # GPT-3.5 Turbo pricing
+}
+REPORT_GROUPS = { # Columns the report can group by
+    "site": "call_site", # Lesson, digest, question, batch, or validation calls
+    "chapter": "chapter", # Chapter the call was for
+    "lesson": "lesson", # Lesson the call was for
+    "type": "question_type", # Question type the call was for
+    "model": "model", # Model the call used
+}
+
+# Class to collect what happened during one API call
+class LLMCall: # Define the LLMCall class
+
+    # Initialize the LLMCall class
+    def __init__(self, call_site, chapter=None, lesson=None, question_type=None): # Define the constructor with the call_site, chapter, lesson, and question_type parameters
+        self.call_site = call_site # Which part of the app made the call
+        self.chapter = chapter # Chapter the call was for
+        self.lesson = lesson # Lesson the call was for
+        self.question_type = question_type # Question type the call was for
+        self.model = None # Model the call used, set by the gateway
+        self.prompt_tokens = None # Prompt tokens reported by the API
+        self.completion_tokens = None # Completion tokens reported by the API
+        self.latency = None # Seconds the call took, including retries
+        self.retries = 0 # Retries the gateway made
+        self.parse_failures = 0 # Responses, or batch items, that could not be parsed
+        self.error = None # Error that ended the call, if any
+
+    # Function to take the token counts from an API usage block
+    def set_usage(self, usage): # Define the set_usage function with the usage parameter
+        if usage is not None: # Check if the API reported usage
+            self.prompt_tokens = getattr(usage, "prompt_tokens", None) # Prompt tokens
+            self.completion_tokens = getattr(usage, "completion_tokens", None) # Completion tokens
+
+# Function to estimate the cost of a call in dollars
+def call_cost(model, prompt_tokens, completion_tokens): # Define the call_cost function with the model, prompt_tokens, and completion_tokens parameters
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0)) # Look up the model's prices
+    return ((prompt_tokens or 0) * prompt_price + (completion_tokens or 0) * completion_price) / 1000 # Return the cost
+
+# Class to write call records on a background thread so recording never slows down a call
+class CallWriter: # Define the CallWriter class
+
+    # Initialize the CallWriter class
+    def __init__(self): # Define the constructor
+        self.queue = queue.Queue() # Call rows waiting to be written
+        self.thread = None # Background writer thread, started on first use
+        self.lock = threading.Lock() # Lock to start the thread only once
+        atexit.register(self.flush) # Write any remaining rows when the app exits
+
+    # Function to queue a row for writing
+    def put(self, row): # Define the put function with the row parameter
+        with self.lock: # Guard the thread start
+            if self.thread is None: # Check if the writer is not running yet
+                self.thread = threading.Thread(target=self.run, name="telemetry", daemon=True) # Create the writer thread
+                self.thread.start() # Start the writer thread
+        self.queue.put(row) # Queue the row
+
+    # Function run by the writer thread, writing queued rows in batches
+    def run(self): # Define the run function
+        while True: # Loop for the life of the app
+            rows = [self.queue.get()] # Wait for a row
+            while not self.queue.empty(): # Take every other row that is already waiting
+                rows.append(self.queue.get_nowait()) # Add it to the batch
+            self.write(rows) # Write the batch
+            for _ in rows: # Iterate over the written rows
+                self.queue.task_done() # Mark the row as written
+
+    # Function to write a batch of rows in one transaction
+    def write(self, rows): # Define the write function with the rows parameter
+        try: # Try block to handle exceptions
+            with database.connect() as conn: # Connect to the database
+                conn.executemany( # Store the calls
+                    '''
+                    INSERT INTO llm_calls (created_at, call_site, chapter, lesson, question_type, model, prompt_tokens, completion_tokens, latency, retries, parse_failures, error)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''',
+                    rows # One row per call
+                )
+        except sqlite3.Error as e: # Catch any database errors
+            print(f"Failed to record API calls: {e}") # Log the error, telemetry never breaks the app
+
+    # Function to wait until every queued row is written
+    def flush(self): # Define the flush function
+        if self.thread is not None: # Check if anything was ever queued
+            self.queue.join() # Wait for the writer to catch up
+
+call_writer = CallWriter() # Shared writer used by record_call
+
+# Function to store a call record
+def record_call(call): # Define the record_call function with the call parameter
+    if not TELEMETRY_ENABLED: # Check if telemetry is turned off
+        return # Nothing to record
+    call_writer.put(( # Queue the call for the background writer
+        time.time(), call.call_site, call.chapter, call.lesson, call.question_type, call.model, call.prompt_tokens, # Provide the call details
+        call.completion_tokens, call.latency, call.retries, call.parse_failures, call.error
+    ))
+
+# Function to read a percentile from sorted values
+def percentile(values, fraction): # Define the percentile function with the values and fraction parameters
+    if not values: # Check if there are no values
+        return 0.0 # Nothing to report
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1)))) # Nearest rank
+    return values[index] # Return the value at that rank
+
+# Function to aggregate the call records into a report grouped by the chosen columns
+def build_report(group_by=("site",), since=None): # Define the build_report function with the group_by and since parameters
+    columns = [REPORT_GROUPS[name] for name in group_by] # Columns to group by
+    query = f'SELECT {", ".join(columns)}, model, prompt_tokens, completion_tokens, latency, retries, parse_failures, error FROM llm_calls' # Read every call
+    parameters = [] # Parameters for the query
+    if since is not None: # Check if the report covers recent calls only
+        query += ' WHERE created_at >= ?' # Limit the calls by time
+        parameters.append(since) # Provide the start time
+
+    groups = defaultdict(list) # Call records keyed by group
+    with database.connect() as conn: # Connect to the database
+        for row in conn.execute(query, parameters): # Iterate over the calls
+            groups[row[:len(columns)]].append(row[len(columns):]) # Add the call to its group
+
+    report = [] # One row per group
+    for key, calls in sorted(groups.items(), key=lambda item: tuple(str(value) for value in item[0])): # Iterate over the groups in order
+        latencies = sorted(call[3] for call in calls if call[3] is not None) # Latencies of the calls
+        report.append({ # Summarize the group
+            "group": key, # Group values
+            "calls": len(calls), # Number of calls
+            "p50": percentile(latencies, 0.5), # Median latency
+            "p95": percentile(latencies, 0.95), # 95th percentile latency
+            "prompt_tokens": sum(call[1] or 0 for call in calls), # Prompt tokens used
+            "prompt_per_call": sum(call[1] or 0 for call in calls) / len(calls), # Average prompt tokens per call, which shows the effect of shorter prompts
+            "completion_tokens": sum(call[2] or 0 for call in calls), # Completion tokens used
+            "cost": sum(call_cost(call[0], call[1], call[2]) for call in calls), # Estimated cost
+            "retries": sum(call[4] or 0 for call in calls), # Retries made
+            "parse_failures": sum(call[5] or 0 for call in calls), # Parse failures
+            "errors": sum(1 for call in calls if call[6]), # Calls that failed
+        })
+    return report # Return the report
+
+# Function to print the report as a table
+def print_report(group_by=("site",), since=None): # Define the print_report function with the group_by and since parameters
+    report = build_report(group_by, since) # Build the report
+    header = " ".join(f"{name:>12}" for name in group_by) # Group column headings
+    print(f"{header} {'calls':>6} {'p50 s':>7} {'p95 s':>7} {'prompt tok':>11} {'tok/call':>9} {'compl tok':>10} {'cost $':>8} {'retries':>8} {'parse err':>9} {'errors':>7}") # Print the header
+    for row in report: # Iterate over the groups
+        group = " ".join(f"{str(value):>12}" for value in row["group"]) # Group values
+        print(f"{group} {row['calls']:>6} {row['p50']:>7.2f} {row['p95']:>7.2f} {row['prompt_tokens']:>11} {row['prompt_per_call']:>9.0f} {row['completion_tokens']:>10} " # Print the row
+              f"{row['cost']:>8.4f} {row['retries']:>8} {row['parse_failures']:>9} {row['errors']:>7}")
+    total_cost = sum(row["cost"] for row in report) # Cost across every group
+    print(f"Total: {sum(row['calls'] for row in report)} calls, ${total_cost:.4f}") # Print the totals
+
+# Main entry point
+if __name__ == "__main__": # Check if the script is being run directly
+    parser = argparse.ArgumentParser(description="Report API call latency, token usage, and cost.") # Create the argument parser
+    parser.add_argument("--by", nargs="+", choices=sorted(REPORT_GROUPS), default=["site"], help="Columns to group the report by.") # Grouping
+    parser.add_argument("--days", type=float, help="Only include calls from the last N days.") # Time window
+    args = parser.parse_args() # Parse the command line
+
+    print_report(args.by, time.time() - args.days * 86400 if args.days else None) # Print the report
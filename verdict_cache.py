@@ -0,0 +1,84 @@
+import hashlib # Import the hashlib module to build content-addressed cache keys
+import json # Import the json module to serialize the key fields unambiguously
+import os # Import the os module to read environment variables
+import re # Import the re module to normalize whitespace
+import threading # Import the threading module to guard the cache between threads
+import time # Import the time module for expiry and latency tracking
+from collections import OrderedDict # Import OrderedDict to keep the cache in least-recently-used order
+
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "1000")) # Most verdicts kept in memory
+VERDICT_CACHE_TTL = float(os.getenv("VERDICT_CACHE_TTL", "3600")) # Seconds a verdict stays valid
+
+WHITESPACE_PATTERN = re.compile(r"\s+") # Precompiled pattern matching runs of whitespace
+
+# Function to normalize a free text response so trivial differences share a verdict
+def normalize_response(text): # Define the normalize_response function with the text parameter
+    return WHITESPACE_PATTERN.sub(" ", (text or "").strip().lower()) # Lowercase and collapse the whitespace
+
+# Function to normalize code or program output without changing what it means
+def normalize_code(text): # Define the normalize_code function with the text parameter
+    lines = (text or "").replace("\r\n", "\n").split("\n") # Split into lines with consistent line endings
+    return "\n".join(line.rstrip() for line in lines if line.strip()) # Drop trailing spaces and blank lines, keep indentation
+
+# Function to build the cache key for a graded answer
+def verdict_key(question_data, user_response=None, user_code=None, user_output=None): # Define the verdict_key function
+    fields = [ # Everything the verdict depends on
+        question_data.get('type', 'scenario'), # Question type
+        question_data.get('question', ''), # Question text
+        question_data.get('correct_answer', ''), # Expected answer or sample code solution
+        question_data.get('tests', []) if question_data.get('type') == 'write_code' else [], # Test cases the code is graded against
+        normalize_response(user_response), # Normalized response
+        normalize_code(user_code), # Normalized code
+        normalize_code(user_output), # Normalized captured output
+    ]
+    return hashlib.sha256(json.dumps(fields).encode("utf-8")).hexdigest() # Hash the fields into a fixed size key
+
+# Class to keep recent grading verdicts so repeated answers skip the API round trip
+class VerdictCache: # Define the VerdictCache class
+
+    # Initialize the VerdictCache class
+    def __init__(self, max_entries=VERDICT_CACHE_SIZE, ttl=VERDICT_CACHE_TTL): # Define the constructor with the max_entries and ttl parameters
+        self.max_entries = max(1, max_entries) # Most verdicts kept
+        self.ttl = ttl # Seconds a verdict stays valid
+        self.entries = OrderedDict() # (verdict, latency, stored_at) keyed by cache key
+        self.lock = threading.Lock() # Lock to keep the cache consistent across threads
+        self.hits = 0 # Lookups answered from the cache
+        self.misses = 0 # Lookups that needed a fresh verdict
+        self.latency_saved = 0.0 # Seconds of grading latency avoided by hits
+
+    # Function to look up a verdict, returning None on a miss
+    def get(self, key): # Define the get function with the key parameter
+        with self.lock: # Guard the cache
+            entry = self.entries.get(key) # Look up the entry
+            if entry is not None and time.monotonic() - entry[2] > self.ttl: # Check if the entry has expired
+                del self.entries[key] # Drop the expired entry
+                entry = None # Treat it as a miss
+            if entry is None: # Check if the verdict is not cached
+                self.misses += 1 # Count the miss
+                return None # Let the caller grade the answer
+            self.entries.move_to_end(key) # Mark it as the most recently used verdict
+            self.hits += 1 # Count the hit
+            self.latency_saved += entry[1] # Credit the latency of the original grading
+            return entry[0] # Return the cached verdict
+
+    # Function to store a verdict along with how long it took to produce
+    def put(self, key, verdict, latency): # Define the put function with the key, verdict, and latency parameters
+        with self.lock: # Guard the cache
+            self.entries[key] = (verdict, latency, time.monotonic()) # Store the verdict
+            self.entries.move_to_end(key) # Mark it as the most recently used verdict
+            while len(self.entries) > self.max_entries: # Check if the cache is over its limit
+                self.entries.popitem(last=False) # Evict the least recently used verdict
+
+    # Function to report the cache counters
+    def stats(self): # Define the stats function
+        with self.lock: # Guard the counters
+            lookups = self.hits + self.misses # Total lookups
+            return { # Return the counters
+                "hits": self.hits, # Lookups answered from the cache
+                "misses": self.misses, # Lookups that needed a fresh verdict
+                "hit_rate": self.hits / lookups if lookups else 0.0, # Fraction of lookups answered from the cache
+                "latency_saved": self.latency_saved, # Seconds of grading latency avoided
+                "entries": len(self.entries), # Verdicts currently cached
+            }
+
+verdict_cache = VerdictCache() # Shared cache used by validate_answer_with_gpt
@@ -0,0 +1,88 @@
+import atexit # Import the atexit module to write anything still buffered when the app exits
+import os # Import the os module to read environment variables
+import sqlite3 # Import the sqlite3 module to catch database errors
+import threading # Import the threading module to flush on a background timer
+import database # Import the database module for the shared connections
+from repository import QUERIES # Import the named queries so buffered writes use the same statements
+
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "2")) # Seconds a write may wait in the buffer before the timer flushes it
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "50")) # Buffered writes that trigger a flush without waiting for the timer
+
+# Class to buffer mistake and progress writes and commit them together, off the UI thread where possible
+class WriteBehindBuffer: # Define the WriteBehindBuffer class
+
+    # Initialize the WriteBehindBuffer class
+    def __init__(self, interval=WRITE_BEHIND_INTERVAL, max_pending=WRITE_BEHIND_MAX_PENDING): # Define the constructor with the interval and max_pending parameters
+        self.interval = interval # Seconds between timer flushes
+        self.max_pending = max(1, max_pending) # Buffered writes that wake the flusher early
+        self.mistakes = [] # Mistake rows waiting to be inserted, in the order they were made
+        self.progress = {} # Latest chapter and lesson per user waiting to be saved, older updates are replaced
+        self.lock = threading.Lock() # Lock to guard the buffered writes
+        self.flush_lock = threading.Lock() # Lock so flushes commit one at a time, in order
+        self.wake = threading.Event() # Set to flush before the timer runs out
+        self.thread = None # Background flusher, started on the first buffered write
+        atexit.register(self.flush) # Write anything still buffered when the app exits
+
+    # Function to start the background flusher if it is not running
+    def start(self): # Define the start function
+        if self.thread is None: # Check if the flusher is not running yet
+            self.thread = threading.Thread(target=self.run, name="write-behind", daemon=True) # Create the flusher thread
+            self.thread.start() # Start the flusher thread
+
+    # Function to buffer a mistake
+    def add_mistake(self, user_id, chapter, lesson, question, user_answer, correct_answer, feedback=None, user_code=None, user_output=None, user_errors=None, original_lesson=None): # Define the add_mistake function
+        with self.lock: # Guard the buffer
+            self.mistakes.append((user_id, chapter, lesson, question, user_answer, correct_answer, feedback, user_code, user_output, user_errors, original_lesson)) # Buffer the row
+            pending = len(self.mistakes) + len(self.progress) # Writes waiting
+            self.start() # Make sure the timer is running
+        if pending >= self.max_pending: # Check if the buffer is full
+            self.wake.set() # Flush without waiting for the timer
+
+    # Function to buffer a progress update, replacing any older one for the same user
+    def save_progress(self, user_id, chapter, lesson): # Define the save_progress function with the user_id, chapter, and lesson parameters
+        with self.lock: # Guard the buffer
+            self.progress[user_id] = (chapter, lesson) # Only the latest position needs saving
+            self.start() # Make sure the timer is running
+
+    # Function to read a user's buffered progress, so readers see it before it is flushed
+    def pending_progress(self, user_id): # Define the pending_progress function with the user_id parameter
+        with self.lock: # Guard the buffer
+            return self.progress.get(user_id) # Return the buffered chapter and lesson, or None
+
+    # Function to write every buffered change in one transaction, returning True once it is committed
+    def flush(self): # Define the flush function
+        with self.flush_lock: # Commit one batch at a time, so batches land in order
+            with self.lock: # Guard the buffer
+                mistakes, self.mistakes = self.mistakes, [] # Take the buffered mistakes
+                progress, self.progress = self.progress, {} # Take the buffered progress
+            if not mistakes and not progress: # Check if there is nothing to write
+                return True # Nothing was waiting
+            try: # Try block to handle exceptions
+                with database.connect() as conn: # Connect to the database, committing on success and rolling back on error
+                    conn.executemany(QUERIES["insert_mistake"], mistakes) # Insert the mistakes, one row each
+                    conn.executemany( # Save the progress
+                        QUERIES["save_progress"],
+                        [(chapter, lesson, user_id) for user_id, (chapter, lesson) in progress.items()] # One row per user
+                    )
+                return True # The writes are committed
+            except sqlite3.Error as e: # Catch any database errors
+                print(f"Failed to flush buffered writes: {e}") # Log the error
+                with self.lock: # Guard the buffer
+                    self.mistakes[:0] = mistakes # Put the mistakes back ahead of newer ones
+                    for user_id, position in progress.items(): # Iterate over the progress updates
+                        self.progress.setdefault(user_id, position) # Put them back unless a newer one arrived
+                return False # The writes are still buffered
+
+    # Function to flush on the background thread without waiting for it
+    def flush_soon(self): # Define the flush_soon function
+        if self.thread is not None: # Check if anything was ever buffered
+            self.wake.set() # Wake the flusher
+
+    # Function run by the flusher thread, flushing when woken or when the timer runs out
+    def run(self): # Define the run function
+        while True: # Loop for the life of the app
+            self.wake.wait(self.interval) # Wait for a wake-up or the timer
+            self.wake.clear() # Reset the wake-up
+            self.flush() # Write whatever is buffered
+
+write_buffer = WriteBehindBuffer() # Shared buffer for mistake and progress writes